@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from crud.jobs_crud import list_jobs
+from utility.db import get_db
+from utility.job_manager import job_manager, JOB_KINDS
+
+job_router = APIRouter(tags=["Jobs"])
+
+
+@job_router.get("/list-jobs")
+def list_jobs_endpoint(
+    status: Optional[str] = Query(None),
+    kind: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Background jobs, latest first (status: queued, running, completed, failed, cancelled)"""
+    result = list_jobs(db, skip=skip, limit=limit, status=status, kind=kind)
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@job_router.get("/job-kinds")
+def list_job_kinds():
+    """Job kinds with their concurrency limit, default priority and default timeout (seconds)"""
+    return [
+        {"kind": kind, "limit": limit, "priority": priority, "timeout": timeout}
+        for kind, (_, limit, priority, timeout) in JOB_KINDS.items()
+    ]
+
+@job_router.get("/job-status/{job_id}")
+def get_job_status(job_id: int):
+    """Status and progress of a job, with the current step and spark task counts while it's running"""
+    result = job_manager.get_status(job_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@job_router.post("/cancel-job/{job_id}")
+def cancel_job(job_id: int):
+    """
+    Cancels a queued job, or stops a running one: its spark job groups are cancelled, its input renames reverted and
+    its partial output deleted
+    """
+    result = job_manager.cancel(job_id)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
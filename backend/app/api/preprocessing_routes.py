@@ -12,6 +12,8 @@ from schemas.dataset import (
     DatasetListResponse,
     Operation,
     DatasetUpdate,
+    RecipeCreate,
+    LineageCreate,
 )
 
 from crud.datasets_crud import (
@@ -29,16 +31,35 @@ from crud.datasets_crud import (
     get_raw_data_filename_by_id,
     edit_dataset_details,
     edit_raw_dataset_details,
+    update_raw_dataset_stats,
+    update_dataset_stats,
+    create_recipe,
+    get_recipe,
+    list_dataset_recipes,
+    create_lineage,
+    list_lineage_datasets,
+    get_dataset_lineage,
+    update_lineage_fingerprint,
     handle_file_renaming_during_processing
 )
 
 from utility.db import get_db
 from utility.hdfs_services import HDFSServiceManager
 from utility.spark_services import SparkSessionManager
+from utility.local_engine import (
+    LocalEngine, LocalEngineUnsupportedError, PROCESSING_ENGINES, PROCESSING_ENGINE, LOCAL_ENGINE_MAX_JOBS, select_engine,
+    get_local_input_size, local_engine_slot
+)
+from utility.overview_helper_functions import OVERVIEW_MODES, MAX_RELATIVE_ERROR
+from utility.parquet_writer import PARQUET_COMPRESSION_CODECS, is_same_layout
+from utility.dataset_readers import FILE_FORMATS, get_file_format, is_compressed_file
+from utility.dataset_lineage import canonical_operations, get_operations_hash, get_prefix_hashes, merge_recipes
+from utility.job_manager import job_manager, register_job_kind, report_progress, keep_job_outputs, record_job_rename, get_job_priority, get_job_timeout
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# synchronous requests only (preview), background jobs are queued in the job manager (see job_manager.py)
 executor = ThreadPoolExecutor(max_workers=os.cpu_count())
 
 dataset_router = APIRouter(tags=["Dataset"])
@@ -49,53 +70,331 @@ RECENTLY_UPLOADED_DATASETS_DIR = os.getenv("RECENTLY_UPLOADED_DATASETS_DIR")
 
 hdfs_client = HDFSServiceManager()
 spark_client = SparkSessionManager()
+local_client = LocalEngine()
+
+def get_number_option(data: dict, key: str, default=None, number_type=float):
+    """Number of the request json (default if not given), an error 400 if it's not a number"""
+    if data.get(key) is None:
+        return default
+    try:
+        return number_type(data[key])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{key} should be a number")
+
+def get_overview_options(data: dict):
+    """Overview mode and relative error from the request json (exact mode by default)"""
+    overview_mode = data.get("overviewMode", "exact")
+    relative_error = get_number_option(data, "relativeError", 0.05)
+    if overview_mode not in OVERVIEW_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid overview mode. Supported modes: {OVERVIEW_MODES}")
+    if not 0 < relative_error <= MAX_RELATIVE_ERROR:
+        raise HTTPException(status_code=400, detail=f"relativeError should be in (0, {MAX_RELATIVE_ERROR}]")
+    return overview_mode, relative_error
+
+def get_layout_options(data: dict):
+    """Layout of the written parquet from the request json (see parquet_writer.py), None for the defaults"""
+    layout = {}
+    if data.get("targetFileSizeMb") is not None:
+        layout["targetFileSizeMb"] = get_number_option(data, "targetFileSizeMb")
+        if layout["targetFileSizeMb"] <= 0:
+            raise HTTPException(status_code=400, detail="targetFileSizeMb should be positive")
+    for key in ["partitionBy", "sortBy"]:
+        if data.get(key) is not None:
+            if not isinstance(data[key], list) or not all(isinstance(c, str) for c in data[key]):
+                raise HTTPException(status_code=400, detail=f"{key} should be a list of column names")
+            layout[key] = data[key]
+    if data.get("compression") is not None:
+        if data["compression"] not in PARQUET_COMPRESSION_CODECS:
+            raise HTTPException(status_code=400, detail=f"Invalid compression codec. Supported codecs: {PARQUET_COMPRESSION_CODECS}")
+        layout["compression"] = data["compression"]
+    if data.get("maxRecordsPerFile") is not None:
+        layout["maxRecordsPerFile"] = get_number_option(data, "maxRecordsPerFile", number_type=int)
+        if layout["maxRecordsPerFile"] <= 0:
+            raise HTTPException(status_code=400, detail="maxRecordsPerFile should be positive")
+    return layout or None
+
+def get_priority_option(data: dict):
+    """Priority of a background job from the request json (integer or low / normal / high), None for the default"""
+    try:
+        return get_job_priority(data.get("priority"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_timeout_option(data: dict):
+    """Wall clock timeout of a background job in seconds from the request json, None for JOB_TIMEOUT_<KIND>"""
+    try:
+        return get_job_timeout(data.get("timeout"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_engine_option(data: dict):
+    """Engine of a job from the request json (auto, spark or local, see local_engine.py), None for PROCESSING_ENGINE"""
+    engine = data.get("engine")
+    if engine is not None and engine not in PROCESSING_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Invalid engine. Supported engines: {PROCESSING_ENGINES}")
+    return engine
+
+def get_read_options(data: dict):
+    """Schema, schema hints and sampling ratio of the csv schema inference from the request json (see dataset_readers.py)"""
+    read_options = {}
+    if data.get("schema") is not None:
+        if not isinstance(data["schema"], str) or not data["schema"].strip():
+            raise HTTPException(status_code=400, detail="schema should be a DDL string, e.g. \"id INT, name STRING\"")
+        read_options["schema"] = data["schema"]
+    if data.get("schemaHints") is not None:
+        if not isinstance(data["schemaHints"], dict) or not all(isinstance(t, str) for t in data["schemaHints"].values()):
+            raise HTTPException(status_code=400, detail="schemaHints should map column names to types")
+        read_options["schemaHints"] = data["schemaHints"]
+    if data.get("samplingRatio") is not None:
+        read_options["samplingRatio"] = get_number_option(data, "samplingRatio")
+        if not 0 < read_options["samplingRatio"] <= 1:
+            raise HTTPException(status_code=400, detail="samplingRatio should be between 0 and 1")
+    if data.get("multiLine") is not None:
+        read_options["multiLine"] = bool(data["multiLine"])
+    return read_options or None
+
+def get_upload_file_format(filename: str):
+    """Format of an uploaded file by its suffix (see dataset_readers.py)"""
+    file_format = get_file_format(filename or "")
+    if file_format is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Supported formats: {', '.join(FILE_FORMATS)}"
+        )
+    return file_format
+
+async def mark_upload_processing(filename: str):
+    """
+    Renames an upload to {filename}__PROCESSING__ while a job reads it. A compressed file is moved into a directory of
+    that name instead, as hadoop picks the codec by the extension of the file (spark reads the directory).
+    """
+    source_path = f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}"
+    processing_path = f"{source_path}__PROCESSING__"
+    if is_compressed_file(filename):
+        record_job_rename(f"{processing_path}/{filename}", source_path, remove_path=processing_path)
+        await hdfs_client.make_directory(processing_path)
+        # rename into an existing directory moves the file into it
+        await hdfs_client.rename_file_or_folder(source_path, processing_path)
+    else:
+        record_job_rename(processing_path, source_path)
+        await hdfs_client.rename_file_or_folder(source_path, processing_path)
+
+async def unmark_upload_processing(filename: str, ignore_missing: bool = False):
+    """Reverts mark_upload_processing, with ignore_missing an upload which was not renamed (job failed before) is skipped"""
+    source_path = f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}"
+    processing_path = f"{source_path}__PROCESSING__"
+    try:
+        if is_compressed_file(filename):
+            await hdfs_client.rename_file_or_folder(f"{processing_path}/{filename}", source_path)
+            hdfs_client.delete_path(processing_path)
+        else:
+            await hdfs_client.rename_file_or_folder(processing_path, source_path)
+    except Exception as e:
+        if not ignore_missing:
+            raise
+        print(f"Upload {filename} not reverted: {e}")
 
 ###################### Background processing tasks ######################
-async def process_create_dataset(filename: str, filetype: str):
+def get_auto_input_size(engine: str, hdfs_path: str, file_format: str = "parquet"):
+    """In memory size of the input for select_engine, only needed (read from HDFS) in auto mode"""
+    if (engine or PROCESSING_ENGINE) != "auto":
+        return None
+    return get_local_input_size(hdfs_path, file_format)
+
+async def run_on_local_engine(engine: str, job, *args, **kwargs):
+    """
+    Result of a LocalEngine job method, None if the input has columns the local engine can't read (nothing is written
+    then) or all the local engine slots are taken, and the engine was not requested explicitly: the caller runs the job
+    on spark instead
+    """
+    requested = (engine or PROCESSING_ENGINE) == "local"
+    with local_engine_slot(wait=requested) as acquired:
+        if not acquired:
+            print(f"{LOCAL_ENGINE_MAX_JOBS} local engine jobs already running, running the job on spark")
+            return None
+        try:
+            return await job(*args, **kwargs)
+        except LocalEngineUnsupportedError as e:
+            if requested:
+                raise
+            print(f"Local engine can't run the job, running it on spark: {e}")
+            return None
+
+def get_lineage_fingerprint(directory: str, filename: str):
+    """Fingerprint of the input of a preprocessing request for the lineage lookup, None if not available"""
+    try:
+        return hdfs_client.get_fingerprint(f"{directory}/{filename}")
+    except Exception as e:
+        print("Error in getting the fingerprint for the lineage lookup: ", str(e))
+        return None
+
+def get_lineage_dataset(db: Session, input_fingerprint: str, operations_hashes: list, layout: dict = None):
+    """
+    Processed dataset of the input produced by any of the operations hashes and written with the requested layout
+    (a dataset with another layout can't be returned for the request, nor resumed from: partition columns are read
+    back last), the one with the most steps first, None if there is none
+    """
+    datasets = list_lineage_datasets(db, input_fingerprint, operations_hashes)
+    if not isinstance(datasets, list):
+        return None
+    for lineage_dataset in datasets:
+        if is_same_layout(layout, (lineage_dataset["dataset"]["datastats"] or {}).get("layout")):
+            return lineage_dataset
+    return None
+
+def find_resumable_dataset(db: Session, input_fingerprint: str, operations: list, layout: dict = None):
+    """
+    Output of the longest earlier request on the same input whose operations are a prefix of operations (written with
+    the same layout), with its recipe (needed for the recipe of the resumed run), None if there is none.
+    """
+    prefix_hashes = get_prefix_hashes(operations)
+    if input_fingerprint is None or not prefix_hashes:
+        return None
+    resumable = get_lineage_dataset(db, input_fingerprint, list(prefix_hashes), layout)
+    if resumable is None:
+        return None
+    recipes = list_dataset_recipes(db, resumable["dataset"]["dataset_id"])
+    if not isinstance(recipes, list) or not recipes:
+        return None
+    resumable["recipe"] = recipes[-1]["recipe"]
+    return resumable
+
+@register_job_kind("create_dataset", limit=2)
+async def process_create_dataset(filename: str, filetype: str, overview_mode: str = "exact", relative_error: float = 0.05,
+                                 preview_fraction: float = None, footer_overview: bool = False, spark_overview: bool = True, layout: dict = None,
+                                 read_options: dict = None, engine: str = None):
+    """
+    If preview_fraction is given (or footer_overview for parquet files), a raw dataset entry with a preview overview
+    is created first, and its datastats are replaced with the full overview once the dataset is written.
+    With spark_overview=False the footer overview is kept and the spark overview pass is skipped.
+    A small upload is written by the local engine (see select_engine) without any preview, its full overview is as fast.
+    """
     db = next(get_db())
+    preview_dataset = None
     try:
-        source_path = f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}"
-        processing_path = f"{source_path}__PROCESSING__"
-        
-        await hdfs_client.rename_file_or_folder(source_path, processing_path)
-        dataset_overview = await spark_client.create_new_dataset(f"{filename}__PROCESSING__", filetype)
         description = f"Raw dataset created from {filename}"
-        print(f"Overview of dataset: {dataset_overview['numRows']} rows, {dataset_overview['numColumns']} columns")
+        
+        await mark_upload_processing(filename)
+        report_progress(0.05, "Reading the uploaded file")
 
-        dataset_obj = DatasetCreate(filename=dataset_overview['filename'], description=description, datastats=dataset_overview)
+        selected_engine, engine_reason = select_engine(
+            engine, get_auto_input_size(engine, f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}__PROCESSING__", filetype), filetype,
+            filename=filename, read_options=read_options, layout=layout
+        )
+        print(f"Engine of the dataset creation: {selected_engine} ({engine_reason})")
+        dataset_overview = None
+        if selected_engine == "local":
+            dataset_overview = await run_on_local_engine(
+                engine, local_client.create_new_dataset, f"{filename}__PROCESSING__", filetype, overview_mode, relative_error,
+                layout=layout, read_options=read_options
+            )
+
+        preview_overview = None
+        if dataset_overview is None and filetype == "parquet" and footer_overview:
+            preview_overview = await spark_client.create_footer_overview(f"{filename}__PROCESSING__")
+        elif dataset_overview is None and preview_fraction:
+            preview_overview = await spark_client.create_preview_overview(f"{filename}__PROCESSING__", filetype, preview_fraction, overview_mode, relative_error, read_options)
+
+        if preview_overview is not None:
+            print(f"Preview overview of dataset: ~{preview_overview['numRows']} rows, {preview_overview['numColumns']} columns")
+            preview_dataset = create_raw_dataset(db, DatasetCreate(filename=preview_overview['filename'], description=description, datastats=preview_overview))
+            if isinstance(preview_dataset, dict) and "error" in preview_dataset:
+                error, preview_dataset = preview_dataset["error"], None
+                raise HTTPException(status_code=400, detail=error)
+            report_progress(0.2, "Preview overview ready, writing the dataset")
+
+        if dataset_overview is None:
+            dataset_overview = await spark_client.create_new_dataset(
+                f"{filename}__PROCESSING__", filetype, overview_mode, relative_error, with_overview=spark_overview or preview_dataset is None,
+                layout=layout, read_options=read_options
+            )
 
-        # Create raw dataset entry
-        crud_result = create_raw_dataset(db, dataset_obj)
+        if "numRows" not in dataset_overview:
+            # spark overview skipped, the footer overview is the final one
+            dataset_overview = {**preview_overview, "preview": False, "layout": dataset_overview.get("layout")}
+        dataset_overview.setdefault("engine", "spark")
+        print(f"Overview of dataset: {dataset_overview['numRows']} rows, {dataset_overview['numColumns']} columns")
+        report_progress(0.9, "Saving the dataset entry")
+
+        if preview_dataset is not None:
+            # Replace the preview overview with the full one
+            crud_result = update_raw_dataset_stats(db, preview_dataset.dataset_id, dataset_overview)
+        else:
+            # Create raw dataset entry
+            dataset_obj = DatasetCreate(filename=dataset_overview['filename'], description=description, datastats=dataset_overview)
+            crud_result = create_raw_dataset(db, dataset_obj)
         if isinstance(crud_result, dict) and "error" in crud_result:
             raise HTTPException(status_code=400, detail=crud_result["error"])
+        keep_job_outputs()
         
-        await hdfs_client.rename_file_or_folder(processing_path, source_path)
+        await unmark_upload_processing(filename)
         return {"message": "Dataset created successfully"}
     except Exception as e:
-        await hdfs_client.rename_file_or_folder(processing_path, source_path, ignore_missing=True)
+        if preview_dataset is not None:
+            delete_raw_dataset(db, preview_dataset.dataset_id)
+        await unmark_upload_processing(filename, ignore_missing=True)
         print("Error in processing the data is: ", str(e))
         return {"error": str(e)}
     finally:
         db.close()
 
     
-async def process_preprocessing(directory: str, filename: str, operations: List[Operation]):
+@register_job_kind("preprocessing", limit=2)
+async def process_preprocessing(directory: str, filename: str, operations: List[Operation], overview_mode: str = "exact", relative_error: float = 0.05, layout: dict = None, engine: str = None):
     db = next(get_db())
+    # file read by the job: the input file, or the output of an earlier request with a prefix of the operations
+    read_directory, read_filename = directory, filename
     try:
-        processing_path = f"{directory}/{filename}__PROCESSING__"
-        await hdfs_client.rename_file_or_folder(f"{directory}/{filename}", processing_path)
+        input_fingerprint = get_lineage_fingerprint(directory, filename)
+        # appended partitions of a raw input covered by the output (see preprocess_new_partitions)
+        source_partitions = None
+        if directory == HDFS_RAW_DATASETS_DIR:
+            source_overview = get_raw_dataset_stats(db, filename=filename).get("datastats") or {}
+            source_partitions = [p["partitionId"] for p in source_overview.get("partitions", [])] or None
+        resumed = find_resumable_dataset(db, input_fingerprint, operations, layout)
+        remaining_operations, column_state, prefix_recipe = operations, None, None
+        if resumed is not None:
+            num_steps = resumed["lineage"]["num_steps"]
+            read_directory, read_filename = HDFS_PROCESSED_DATASETS_DIR, resumed["dataset"]["filename"]
+            remaining_operations = operations[num_steps:]
+            column_state, prefix_recipe = resumed["lineage"]["column_state"], resumed["recipe"]
+            print(f"Resuming preprocessing of {filename} from {read_filename} (first {num_steps} steps already applied)")
+
+        # stored overview of the input, its column stats can be reused for the columns not touched by any step
+        get_stats = get_raw_dataset_stats if read_directory == HDFS_RAW_DATASETS_DIR else get_dataset_stats
+        input_overview = get_stats(db, filename=read_filename).get("datastats")
+
+        processing_path = f"{read_directory}/{read_filename}__PROCESSING__"
+        record_job_rename(processing_path, f"{read_directory}/{read_filename}", read_directory, read_filename)
+        await hdfs_client.rename_file_or_folder(f"{read_directory}/{read_filename}", processing_path)
         
-        renaming_result = handle_file_renaming_during_processing(db, filename, f"{filename}__PROCESSING__", directory)
+        renaming_result = handle_file_renaming_during_processing(db, read_filename, f"{read_filename}__PROCESSING__", read_directory)
         if isinstance(renaming_result, dict) and "error" in renaming_result:
             raise HTTPException(status_code=400, detail=renaming_result["error"])
-        
-        # Process data and get new filename
-        processed_info = await spark_client.preprocess_data(
-            directory, 
-            f"{filename}__PROCESSING__", 
-            operations
+        report_progress(0.05, "Running the preprocessing steps")
+
+        # small inputs are preprocessed in memory by the local engine (see local_engine.py)
+        selected_engine, engine_reason = select_engine(
+            engine, get_auto_input_size(engine, processing_path), operations=remaining_operations, layout=layout
         )
+        print(f"Engine of the preprocessing: {selected_engine} ({engine_reason})")
+        job_args = (read_directory, f"{read_filename}__PROCESSING__", remaining_operations, overview_mode, relative_error, input_overview, column_state, layout)
+        processed_info = None
+        if selected_engine == "local":
+            processed_info = await run_on_local_engine(engine, local_client.preprocess_data, *job_args)
+        if processed_info is None:
+            # Process data and get new filename
+            processed_info = await spark_client.preprocess_data(*job_args)
+            processed_info["engine"] = "spark"
         
+        report_progress(0.9, "Saving the dataset entry")
+        recipe = merge_recipes(prefix_recipe, processed_info.pop("recipe"))
+        column_state = processed_info.pop("columnState")
+        if source_partitions is not None:
+            processed_info["sourcePartitions"] = source_partitions
+        if resumed is not None:
+            processed_info["resumedFrom"] = {"datasetId": resumed["dataset"]["dataset_id"], "filename": read_filename, "numSteps": num_steps}
+
         # Create new dataset entry
         new_dataset = DatasetCreate(
             filename=processed_info["filename"],
@@ -105,22 +404,254 @@ async def process_preprocessing(directory: str, filename: str, operations: List[
         crud_result = create_dataset(db, dataset=new_dataset)
         if isinstance(crud_result, dict) and "error" in crud_result:
             raise HTTPException(status_code=400, detail=crud_result["error"])
+        keep_job_outputs()
         
-        await hdfs_client.rename_file_or_folder(processing_path, f"{directory}/{filename}")
+        # Save the fitted params, to apply the same preprocessing on new data
+        recipe_result = create_recipe(db, RecipeCreate(
+            dataset_id=crud_result.dataset_id, source_filename=filename, operations=operations, recipe=recipe
+        ))
+        if isinstance(recipe_result, dict) and "error" in recipe_result:
+            print("Error in saving the preprocessing recipe: ", recipe_result["error"])
+
+        # Lineage of the new dataset, an identical request later returns it and a longer one resumes from it
+        if input_fingerprint is not None:
+            lineage_result = create_lineage(db, LineageCreate(
+                dataset_id=crud_result.dataset_id,
+                parent_dataset_id=resumed["dataset"]["dataset_id"] if resumed is not None else None,
+                source_directory=directory,
+                source_filename=filename,
+                input_fingerprint=input_fingerprint,
+                operations_hash=get_operations_hash(operations),
+                operations=canonical_operations(operations),
+                num_steps=len(operations),
+                column_state=column_state
+            ))
+            if isinstance(lineage_result, dict) and "error" in lineage_result:
+                print("Error in saving the dataset lineage: ", lineage_result["error"])
+        
+        await hdfs_client.rename_file_or_folder(processing_path, f"{read_directory}/{read_filename}")
 
-        renaming_result = handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, directory)
+        renaming_result = handle_file_renaming_during_processing(db, f"{read_filename}__PROCESSING__", read_filename, read_directory)
         if isinstance(renaming_result, dict) and "error" in renaming_result:
             raise HTTPException(status_code=400, detail=renaming_result["error"])
         return {"message": "Preprocessing completed successfully"}
         
     except Exception as e:
-        await hdfs_client.rename_file_or_folder(processing_path, f"{directory}/{filename}", ignore_missing=True)
-        handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, directory)
+        await hdfs_client.rename_file_or_folder(f"{read_directory}/{read_filename}__PROCESSING__", f"{read_directory}/{read_filename}", ignore_missing=True)
+        handle_file_renaming_during_processing(db, f"{read_filename}__PROCESSING__", read_filename, read_directory)
         print("Error in preprocessing the data is: ", str(e))
         return {"error": str(e)}
     finally:
         db.close()
 
+@register_job_kind("recipe_application", limit=1)
+async def process_recipe_application(directory: str, filename: str, recipe_id: int, overview_mode: str = "exact", relative_error: float = 0.05, layout: dict = None):
+    db = next(get_db())
+    try:
+        recipe = get_recipe(db, recipe_id)
+        if "error" in recipe:
+            raise HTTPException(status_code=404, detail=recipe["error"])
+
+        get_stats = get_raw_dataset_stats if directory == HDFS_RAW_DATASETS_DIR else get_dataset_stats
+        input_overview = get_stats(db, filename=filename).get("datastats")
+
+        processing_path = f"{directory}/{filename}__PROCESSING__"
+        record_job_rename(processing_path, f"{directory}/{filename}", directory, filename)
+        await hdfs_client.rename_file_or_folder(f"{directory}/{filename}", processing_path)
+
+        renaming_result = handle_file_renaming_during_processing(db, filename, f"{filename}__PROCESSING__", directory)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        report_progress(0.05, "Applying the recipe")
+
+        processed_info = await spark_client.apply_preprocessing_recipe(
+            directory,
+            f"{filename}__PROCESSING__",
+            recipe["recipe"],
+            overview_mode,
+            relative_error,
+            input_overview,
+            layout
+        )
+        processed_info["recipeId"] = recipe_id
+        report_progress(0.9, "Saving the dataset entry")
+
+        new_dataset = DatasetCreate(
+            filename=processed_info["filename"],
+            description=f"Processed version of {filename} (recipe v{recipe['version']} of {recipe['source_filename']})",
+            datastats=processed_info
+        )
+        crud_result = create_dataset(db, dataset=new_dataset)
+        if isinstance(crud_result, dict) and "error" in crud_result:
+            raise HTTPException(status_code=400, detail=crud_result["error"])
+        keep_job_outputs()
+
+        await hdfs_client.rename_file_or_folder(processing_path, f"{directory}/{filename}")
+
+        renaming_result = handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, directory)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        return {"message": "Recipe applied successfully"}
+
+    except Exception as e:
+        await hdfs_client.rename_file_or_folder(f"{directory}/{filename}__PROCESSING__", f"{directory}/{filename}", ignore_missing=True)
+        handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, directory)
+        print("Error in applying the preprocessing recipe is: ", str(e))
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@register_job_kind("append_partition", limit=1)
+async def process_append_partition(filename: str, filetype: str, raw_filename: str, overview_mode: str = "exact", relative_error: float = 0.05):
+    """Appends an uploaded file (in RECENTLY_UPLOADED_DATASETS_DIR) to a raw dataset as a new partition"""
+    db = next(get_db())
+    raw_path = f"{HDFS_RAW_DATASETS_DIR}/{raw_filename}"
+    try:
+        raw_dataset = get_raw_dataset_stats(db, filename=raw_filename)
+        if "dataset_id" not in raw_dataset:
+            raise HTTPException(status_code=404, detail="Raw dataset not found")
+        raw_overview = raw_dataset["datastats"]
+        if not raw_overview or raw_overview.get("preview") or "columnStats" not in raw_overview:
+            raise HTTPException(status_code=400, detail="Full overview of the raw dataset is not ready yet")
+
+        await mark_upload_processing(filename)
+        record_job_rename(f"{raw_path}__PROCESSING__", raw_path, HDFS_RAW_DATASETS_DIR, raw_filename)
+        await hdfs_client.rename_file_or_folder(raw_path, f"{raw_path}__PROCESSING__")
+        renaming_result = handle_file_renaming_during_processing(db, raw_filename, f"{raw_filename}__PROCESSING__", HDFS_RAW_DATASETS_DIR)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        report_progress(0.05, "Appending the partition")
+
+        overview = await spark_client.append_raw_partition(
+            f"{filename}__PROCESSING__", filetype, f"{raw_filename}__PROCESSING__", raw_overview, overview_mode, relative_error
+        )
+        report_progress(0.9, "Saving the overview")
+        crud_result = update_raw_dataset_stats(db, raw_dataset["dataset_id"], overview)
+        if isinstance(crud_result, dict) and "error" in crud_result:
+            raise HTTPException(status_code=400, detail=crud_result["error"])
+        keep_job_outputs()
+
+        await hdfs_client.rename_file_or_folder(f"{raw_path}__PROCESSING__", raw_path)
+        await unmark_upload_processing(filename)
+        renaming_result = handle_file_renaming_during_processing(db, f"{raw_filename}__PROCESSING__", raw_filename, HDFS_RAW_DATASETS_DIR)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        return {"message": "Partition appended successfully"}
+
+    except Exception as e:
+        await hdfs_client.rename_file_or_folder(f"{raw_path}__PROCESSING__", raw_path, ignore_missing=True)
+        await unmark_upload_processing(filename, ignore_missing=True)
+        handle_file_renaming_during_processing(db, f"{raw_filename}__PROCESSING__", raw_filename, HDFS_RAW_DATASETS_DIR)
+        print("Error in appending the partition is: ", str(e))
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@register_job_kind("incremental_preprocessing", limit=1)
+async def process_incremental_preprocessing(dataset_id: int, overview_mode: str = "exact", relative_error: float = 0.05):
+    """Transforms the raw partitions appended since a processed dataset was created with its recipe, and appends them to it"""
+    db = next(get_db())
+    filename = None
+    try:
+        filename = get_data_filename_by_id(db, dataset_id)
+        if isinstance(filename, dict):
+            filename = None
+            raise HTTPException(status_code=404, detail="Dataset not found")
+
+        lineage = get_dataset_lineage(db, dataset_id)
+        if not isinstance(lineage, list) or not lineage or lineage[0]["source_directory"] != HDFS_RAW_DATASETS_DIR:
+            raise HTTPException(status_code=400, detail="Dataset was not preprocessed from a raw dataset")
+        recipes = list_dataset_recipes(db, dataset_id)
+        if not isinstance(recipes, list) or not recipes:
+            raise HTTPException(status_code=400, detail="No preprocessing recipe for this dataset")
+
+        raw_filename = lineage[0]["source_filename"]
+        raw_overview = get_raw_dataset_stats(db, filename=raw_filename).get("datastats") or {}
+        processed_overview = get_dataset_stats(db, filename=filename)["datastats"]
+
+        processing_path = f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}__PROCESSING__"
+        record_job_rename(processing_path, f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}", HDFS_PROCESSED_DATASETS_DIR, filename)
+        await hdfs_client.rename_file_or_folder(f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}", processing_path)
+        renaming_result = handle_file_renaming_during_processing(db, filename, f"{filename}__PROCESSING__", HDFS_PROCESSED_DATASETS_DIR)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        report_progress(0.05, "Transforming the new partitions")
+
+        overview = await spark_client.preprocess_new_partitions(
+            raw_filename,
+            raw_overview.get("partitions", []),
+            f"{filename}__PROCESSING__",
+            processed_overview,
+            recipes[-1]["recipe"],
+            overview_mode,
+            relative_error
+        )
+        report_progress(0.9, "Saving the overview")
+        if overview is not None:
+            crud_result = update_dataset_stats(db, dataset_id, overview)
+            if isinstance(crud_result, dict) and "error" in crud_result:
+                raise HTTPException(status_code=400, detail=crud_result["error"])
+            keep_job_outputs()
+
+        await hdfs_client.rename_file_or_folder(processing_path, f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}")
+        renaming_result = handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, HDFS_PROCESSED_DATASETS_DIR)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        return {"message": "Incremental preprocessing completed successfully" if overview is not None else "No new partitions"}
+
+    except Exception as e:
+        if filename is not None:
+            await hdfs_client.rename_file_or_folder(f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}__PROCESSING__", f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}", ignore_missing=True)
+            handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, HDFS_PROCESSED_DATASETS_DIR)
+        print("Error in incremental preprocessing is: ", str(e))
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@register_job_kind("compaction", limit=1, priority="low")
+async def process_compaction(directory: str, filename: str, layout: dict = None):
+    """Rewrites a raw or processed dataset into well sized files, the overview is kept (same data)"""
+    db = next(get_db())
+    is_raw = directory == HDFS_RAW_DATASETS_DIR
+    try:
+        dataset = (get_raw_dataset_stats if is_raw else get_dataset_stats)(db, filename=filename)
+        if "dataset_id" not in dataset:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+        overview = dataset["datastats"] or {}
+        if overview.get("preview") or "columnStats" not in overview:
+            raise HTTPException(status_code=400, detail="Full overview of the dataset is not ready yet")
+
+        processing_path = f"{directory}/{filename}__PROCESSING__"
+        record_job_rename(processing_path, f"{directory}/{filename}", directory, filename)
+        await hdfs_client.rename_file_or_folder(f"{directory}/{filename}", processing_path)
+        renaming_result = handle_file_renaming_during_processing(db, filename, f"{filename}__PROCESSING__", directory)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+
+        report_progress(0.05, "Compacting the files")
+        compacted = await spark_client.compact_dataset(directory, f"{filename}__PROCESSING__", overview, layout)
+        crud_result = (update_raw_dataset_stats if is_raw else update_dataset_stats)(db, dataset["dataset_id"], compacted)
+        if isinstance(crud_result, dict) and "error" in crud_result:
+            raise HTTPException(status_code=400, detail=crud_result["error"])
+        keep_job_outputs()
+        # same data, so earlier preprocessing requests on the dataset are still valid for the new files
+        if overview.get("fingerprint"):
+            update_lineage_fingerprint(db, overview["fingerprint"], compacted["fingerprint"])
+
+        await hdfs_client.rename_file_or_folder(processing_path, f"{directory}/{filename}")
+        renaming_result = handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, directory)
+        if isinstance(renaming_result, dict) and "error" in renaming_result:
+            raise HTTPException(status_code=400, detail=renaming_result["error"])
+        return {"message": "Dataset compacted successfully"}
+
+    except Exception as e:
+        await hdfs_client.rename_file_or_folder(f"{directory}/{filename}__PROCESSING__", f"{directory}/{filename}", ignore_missing=True)
+        handle_file_renaming_during_processing(db, f"{filename}__PROCESSING__", filename, directory)
+        print("Error in compacting the dataset is: ", str(e))
+        return {"error": str(e)}
+    finally:
+        db.close()
+
 ######################## Dataset Routes #######################
 
 @dataset_router.get("/preprocessing", summary="Test server connection")
@@ -228,23 +759,49 @@ async def delete_raw_dataset_file(
         print("Error in deleting raw dataset: ", str(e))
         return {"error": str(e)}
 
+@dataset_router.get("/spark-session-health")
+def spark_session_health():
+    """State of the shared (warm) spark session, see SparkSessionManager"""
+    return spark_client.health_check()
+
 @dataset_router.post("/create-new-dataset", status_code=status.HTTP_202_ACCEPTED)
 async def create_new_dataset(request: Request):
     data = await request.json()
     filename = data.get("fileName")
-    filetype = filename.split(".")[-1].lower()
+    filetype = get_upload_file_format(filename)
+    overview_mode, relative_error = get_overview_options(data)
+
+    # fraction of the data used for a quick preview overview (no preview if not given)
+    preview_fraction = get_number_option(data, "previewFraction")
+    if preview_fraction is not None and not 0 < preview_fraction <= 1:
+        raise HTTPException(status_code=400, detail="previewFraction should be between 0 and 1")
     
-    if filetype not in ["csv", "parquet"]:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid file type. Supported formats: CSV, Parquet"
-        )
+    # parquet only: instant overview from parquet footers, optionally without the spark overview pass
+    footer_overview = bool(data.get("footerOverview", False)) and filetype == "parquet"
+    spark_overview = bool(data.get("sparkOverview", True)) or not footer_overview
     
-    executor.submit(
-        asyncio.run, 
-        process_create_dataset(filename, filetype)
-    )
-    return {"message": "Dataset processing started"}
+    job_id = job_manager.submit("create_dataset", {
+        "filename": filename, "filetype": filetype, "overview_mode": overview_mode, "relative_error": relative_error,
+        "preview_fraction": preview_fraction,
+        "footer_overview": footer_overview, "spark_overview": spark_overview,
+        "layout": get_layout_options(data), "read_options": get_read_options(data), "engine": get_engine_option(data)
+    }, get_priority_option(data), f"Create dataset from {filename}", get_timeout_option(data))
+    return {"message": "Dataset processing queued", "jobId": job_id}
+
+@dataset_router.post("/append-raw-dataset-partition", status_code=status.HTTP_202_ACCEPTED)
+async def append_raw_dataset_partition(request: Request):
+    """Appends an uploaded file to an existing raw dataset as a new partition (same columns as the raw dataset)"""
+    data = await request.json()
+    filename, raw_filename = data.get("fileName"), data.get("rawFilename")
+    if not filename or not raw_filename:
+        raise HTTPException(status_code=400, detail="fileName and rawFilename are required")
+    filetype = get_upload_file_format(filename)
+    overview_mode, relative_error = get_overview_options(data)
+    job_id = job_manager.submit("append_partition", {
+        "filename": filename, "filetype": filetype, "raw_filename": raw_filename,
+        "overview_mode": overview_mode, "relative_error": relative_error
+    }, get_priority_option(data), f"Append {filename} to {raw_filename}", get_timeout_option(data))
+    return {"message": "Partition append queued", "jobId": job_id}
 
 
 
@@ -349,17 +906,145 @@ async def delete_processed_dataset_file(
         return {"error": str(e)}
 
 @dataset_router.post("/preprocess-dataset", status_code=status.HTTP_202_ACCEPTED)
-async def preprocess_dataset_endpoint(request: Request):
+async def preprocess_dataset_endpoint(request: Request, db: Session = Depends(get_db)):
     data = await request.json()
-    executor.submit(
-        asyncio.run,
-        process_preprocessing(
-            data["directory"],
-            data["filename"],
-            data["operations"]
+    overview_mode, relative_error = get_overview_options(data)
+
+    # same operations on the same (unchanged) input already processed, return the existing dataset
+    # (the fingerprint lists the input files in HDFS, so it runs off the event loop)
+    loop = asyncio.get_running_loop()
+    input_fingerprint = await loop.run_in_executor(executor, get_lineage_fingerprint, data["directory"], data["filename"])
+    layout = get_layout_options(data)
+    if input_fingerprint is not None:
+        existing = get_lineage_dataset(db, input_fingerprint, [get_operations_hash(data["operations"])], layout)
+        if existing is not None:
+            return {
+                "message": "Dataset already preprocessed with the same operations",
+                "datasetId": existing["dataset"]["dataset_id"],
+                "filename": existing["dataset"]["filename"]
+            }
+
+    job_id = job_manager.submit("preprocessing", {
+        "directory": data["directory"],
+        "filename": data["filename"],
+        "operations": data["operations"],
+        "overview_mode": overview_mode,
+        "relative_error": relative_error,
+        "layout": layout,
+        "engine": get_engine_option(data)
+    }, get_priority_option(data), f"Preprocess {data['filename']}", get_timeout_option(data))
+    return {"message": "Preprocessing queued", "jobId": job_id}
+
+@dataset_router.post("/preprocess-new-partitions", status_code=status.HTTP_202_ACCEPTED)
+async def preprocess_new_partitions_endpoint(request: Request):
+    """Brings a processed dataset up to date with the partitions appended to its raw dataset (no refitting)"""
+    data = await request.json()
+    overview_mode, relative_error = get_overview_options(data)
+    if data.get("datasetId") is None:
+        raise HTTPException(status_code=400, detail="datasetId is required")
+    job_id = job_manager.submit("incremental_preprocessing", {
+        "dataset_id": get_number_option(data, "datasetId", number_type=int), "overview_mode": overview_mode, "relative_error": relative_error
+    }, get_priority_option(data), f"Preprocess new partitions of dataset {data['datasetId']}", get_timeout_option(data))
+    return {"message": "Incremental preprocessing queued", "jobId": job_id}
+
+@dataset_router.post("/compact-dataset", status_code=status.HTTP_202_ACCEPTED)
+async def compact_dataset_endpoint(request: Request):
+    """Rewrites a dataset directory into files of about targetFileSizeMb (layout keys as in /preprocess-dataset)"""
+    data = await request.json()
+    directory, filename = data.get("directory"), data.get("filename")
+    if directory not in [HDFS_RAW_DATASETS_DIR, HDFS_PROCESSED_DATASETS_DIR] or not filename:
+        raise HTTPException(status_code=400, detail="directory (raw or processed datasets directory) and filename are required")
+    job_id = job_manager.submit("compaction", {
+        "directory": directory, "filename": filename, "layout": get_layout_options(data)
+    }, get_priority_option(data), f"Compact {filename}", get_timeout_option(data))
+    return {"message": "Compaction queued", "jobId": job_id}
+
+@dataset_router.get("/job-details/{filename}", response_model=dict)
+def get_job_details(filename: str, db: Session = Depends(get_db)):
+    """Per step report (time, spark jobs/stages, rows, shuffle bytes) and the phases after the steps (write, overview) of the preprocessing job which created the dataset"""
+    result = get_dataset_stats(db, filename=filename)
+    if "details" in result:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+    datastats = result.get("datastats") or {}
+    if "processingReport" not in datastats:
+        raise HTTPException(status_code=404, detail="No processing report for this dataset")
+    return {"filename": filename, "processingReport": datastats["processingReport"]}
+
+@dataset_router.get("/dataset-lineage/{dataset_id}")
+def get_dataset_lineage_endpoint(dataset_id: int, db: Session = Depends(get_db)):
+    """Input fingerprint and operations of the dataset, followed by the datasets it was resumed from"""
+    result = get_dataset_lineage(db, dataset_id)
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@dataset_router.get("/dataset-recipes/{dataset_id}")
+def get_dataset_recipes(dataset_id: int, db: Session = Depends(get_db)):
+    try:
+        result = list_dataset_recipes(db, dataset_id)
+        if isinstance(result, dict) and "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        return result
+    except Exception as e:
+        print("Error in getting preprocessing recipes: ", str(e))
+        return {"error": str(e)}
+
+@dataset_router.get("/preprocessing-recipe/{recipe_id}")
+def get_preprocessing_recipe(recipe_id: int, db: Session = Depends(get_db)):
+    result = get_recipe(db, recipe_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@dataset_router.post("/apply-preprocessing-recipe", status_code=status.HTTP_202_ACCEPTED)
+async def apply_preprocessing_recipe_endpoint(request: Request):
+    """Applies the fitted params of a previous preprocessing run (transform only) on another dataset"""
+    data = await request.json()
+    overview_mode, relative_error = get_overview_options(data)
+    if data.get("recipeId") is None:
+        raise HTTPException(status_code=400, detail="recipeId is required")
+    job_id = job_manager.submit("recipe_application", {
+        "directory": data["directory"],
+        "filename": data["filename"],
+        "recipe_id": get_number_option(data, "recipeId", number_type=int),
+        "overview_mode": overview_mode,
+        "relative_error": relative_error,
+        "layout": get_layout_options(data)
+    }, get_priority_option(data), f"Apply recipe {data['recipeId']} on {data['filename']}", get_timeout_option(data))
+    return {"message": "Recipe application queued", "jobId": job_id}
+
+@dataset_router.post("/preview-preprocessing")
+async def preview_preprocessing_endpoint(request: Request, db: Session = Depends(get_db)):
+    """
+    Synchronous preview of an operations list on a small sample of the dataset (nothing is written),
+    stats needed by the steps come from the stored full data overview where possible.
+    """
+    data = await request.json()
+    directory, filename = data["directory"], data["filename"]
+    num_rows = get_number_option(data, "numRows", 20, int)
+    if not 0 < num_rows <= 1000:
+        raise HTTPException(status_code=400, detail="numRows should be between 1 and 1000")
+
+    get_stats = get_raw_dataset_stats if directory == HDFS_RAW_DATASETS_DIR else get_dataset_stats
+    datastats = get_stats(db, filename=filename).get("datastats") or {}
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor,
+            asyncio.run,
+            spark_client.preview_preprocessing(
+                directory, filename, data["operations"], num_rows, known_stats=datastats.get("columnStats"), total_rows=datastats.get("numRows")
+            )
         )
-    )
-    return {"message": "Preprocessing initiated"}
+    except TimeoutError as e:
+        print("Preprocessing preview timed out: ", str(e))
+        raise HTTPException(status_code=504, detail=str(e)) from e
+    except Exception as e:
+        print("Error in preprocessing preview: ", str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
 @dataset_router.get("/list-recent-uploads")   
 async def list_recent_uploads():
@@ -3,27 +3,27 @@ from sqlalchemy.orm import Session
 from utility.db import get_db
 from schemas.training_data_transfer import TransferCreate, SubmitPrice
 from utility.spark_services import SparkSessionManager
+from utility.job_manager import job_manager, register_job_kind, report_progress
 import requests
 import os
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
-# instead ensure max free cpu, if no one is free wait !!
-executor = ThreadPoolExecutor(max_workers=os.cpu_count())
-
 qpd_router = APIRouter(tags=["QPD"])
 
 BASE_URL = os.getenv("REACT_APP_SERVER_BASE_URL")
 spark_client = SparkSessionManager()
 
 
+# a federated session waits for the qpd dataset, so it runs before the other queued jobs
+@register_job_kind("qpd_dataset", limit=1, priority="high")
 async def create_qpd_dataset_from_client_data(fed_info, num_points, client_token, session_id):
     try:
         filename = fed_info.get("dataset_info", {}).get("client_filename")
         parent_filename = fed_info.get("dataset_info", {}).get("server_filename")
+        report_progress(0.05, "Creating the qpd dataset")
         overview = await spark_client.create_qpd_dataset(filename, num_points)
+        report_progress(0.9, "Sending the qpd dataset details to the server")
 
         qpd_data = TransferCreate(
             training_name=fed_info.get("organisation_name"),
@@ -74,13 +74,12 @@ def create_qpd_dataset_endpoint(request: SubmitPrice):
 
     fed_info = result.get("federated_info")
 
-    executor.submit(
-        asyncio.run, 
-        create_qpd_dataset_from_client_data(fed_info, num_points, client_token, session_id)
-    )
+    job_id = job_manager.submit("qpd_dataset", {
+        "fed_info": fed_info, "num_points": num_points, "client_token": client_token, "session_id": session_id
+    }, description=f"QPD dataset for session {session_id}")
 
-    print(f"QPD Dataset creation started for session ID: {session_id}")
-    return {"message": "QPD Dataset creation started successfully."}
+    print(f"QPD Dataset creation queued for session ID: {session_id}")
+    return {"message": "QPD Dataset creation queued successfully.", "jobId": job_id}
 
 
 #  smaple fed_info json:
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 import os
 from fastapi.responses import JSONResponse
 from utility.federated_services import process_parquet_and_save_xy
+from utility.engine_parity import run_engine_parity
+from api.preprocessing_routes import spark_client, executor, get_overview_options
+import asyncio
 from schema import DownloadCombineRequest
 test_router = APIRouter(
     prefix="/test",
@@ -27,3 +30,28 @@ async def download_and_combine(request: DownloadCombineRequest):
             status_code=500,
             detail=f"Failed to process files: {str(e)}"
         )
+
+@test_router.post("/engine-parity")
+async def engine_parity(request: Request):
+    """
+    Runs operations on a dataset with the spark and the local engine (nothing is written) and compares the overviews
+    and recipes (see engine_parity.py), e.g. {"directory": ..., "filename": ..., "operations": [...]}
+    """
+    data = await request.json()
+    if not data.get("directory") or not data.get("filename"):
+        raise HTTPException(status_code=400, detail="directory and filename are required")
+    overview_mode, relative_error = get_overview_options(data)
+    try:
+        # both engines block (spark actions, polars), so the check runs off the event loop like the preview
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            executor,
+            asyncio.run,
+            run_engine_parity(spark_client, data["directory"], data["filename"], data.get("operations", []), overview_mode, relative_error)
+        )
+        return JSONResponse(status_code=200, content=result)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to run the engine parity check: {str(e)}"
+        )
@@ -1,7 +1,9 @@
 from sqlalchemy.orm import Session, load_only
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, NoResultFound
-from schemas.dataset import DatasetCreate, DatasetUpdate
+from schemas.dataset import DatasetCreate, DatasetUpdate, RecipeCreate, LineageCreate
 from models.Dataset import RawDataset, Dataset
+from models.PreprocessingRecipe import PreprocessingRecipe
+from models.DatasetLineage import DatasetLineage
 from dotenv import load_dotenv
 import os
 load_dotenv()
@@ -90,6 +92,18 @@ def edit_raw_dataset_details(db: Session, newdetails: DatasetUpdate):
         db.rollback()
         return {"error": f"Database error: {e}"}
 
+def update_raw_dataset_stats(db: Session, dataset_id: int, datastats: dict):
+    try:
+        dataset = db.query(RawDataset).filter(RawDataset.dataset_id == dataset_id).first()
+        if not dataset:
+            return {"error": "Raw dataset not found."}
+        dataset.datastats = datastats
+        db.commit()
+        return {"message": "Raw dataset stats updated successfully."}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
 #########################################################################
 # CRUD operations for Dataset
 
@@ -112,6 +126,9 @@ def delete_dataset(db: Session, dataset_id: int):
         dataset = db.query(Dataset).filter(Dataset.dataset_id == dataset_id).first()
         if not dataset:
             return {"error": "Dataset not found."}
+        db.query(PreprocessingRecipe).filter(PreprocessingRecipe.dataset_id == dataset_id).delete()
+        db.query(DatasetLineage).filter(DatasetLineage.dataset_id == dataset_id).delete()
+        db.query(DatasetLineage).filter(DatasetLineage.parent_dataset_id == dataset_id).update({DatasetLineage.parent_dataset_id: None})
         db.delete(dataset)
         db.commit()
         return {"message": "Dataset deleted successfully."}
@@ -119,6 +136,18 @@ def delete_dataset(db: Session, dataset_id: int):
         db.rollback()
         return {"error": f"Database error: {e}"}
 
+def update_dataset_stats(db: Session, dataset_id: int, datastats: dict):
+    try:
+        dataset = db.query(Dataset).filter(Dataset.dataset_id == dataset_id).first()
+        if not dataset:
+            return {"error": "Dataset not found."}
+        dataset.datastats = datastats
+        db.commit()
+        return {"message": "Dataset stats updated successfully."}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
 def rename_dataset(db: Session, filename: str, new_file_name: str):
     try:
         dataset = db.query(Dataset).filter(Dataset.filename == filename).first()
@@ -173,6 +202,97 @@ def edit_dataset_details(db: Session, newdetails: DatasetUpdate):
         db.rollback()
         return {"error": f"Database error: {e}"}
     
+#########################################################################
+# CRUD operations for PreprocessingRecipe
+
+def create_recipe(db: Session, recipe: RecipeCreate):
+    try:
+        # version among the recipes fitted on the same source file
+        version = db.query(PreprocessingRecipe).filter(PreprocessingRecipe.source_filename == recipe.source_filename).count() + 1
+        db_recipe = PreprocessingRecipe(**recipe.dict(), version=version)
+        db.add(db_recipe)
+        db.commit()
+        db.refresh(db_recipe)
+        return db_recipe
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def get_recipe(db: Session, recipe_id: int):
+    try:
+        recipe = db.query(PreprocessingRecipe).filter(PreprocessingRecipe.recipe_id == recipe_id).first()
+        return recipe.as_dict() if recipe else {"error": "Recipe not found"}
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
+def list_dataset_recipes(db: Session, dataset_id: int):
+    try:
+        recipes = db.query(PreprocessingRecipe).filter(PreprocessingRecipe.dataset_id == dataset_id).all()
+        return [recipe.as_dict() for recipe in recipes]
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
+#########################################################################
+# CRUD operations for DatasetLineage
+
+def create_lineage(db: Session, lineage: LineageCreate):
+    try:
+        db_lineage = DatasetLineage(**lineage.dict())
+        db.add(db_lineage)
+        db.commit()
+        db.refresh(db_lineage)
+        return db_lineage
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def list_lineage_datasets(db: Session, input_fingerprint: str, operations_hashes: list):
+    """
+    Processed datasets (with their lineage) of the input produced by any of the operations hashes, the ones with the
+    most steps first. Datasets being processed (__PROCESSING__) are skipped.
+    """
+    try:
+        results = (
+            db.query(DatasetLineage, Dataset)
+            .join(Dataset, DatasetLineage.dataset_id == Dataset.dataset_id)
+            .filter(
+                DatasetLineage.input_fingerprint == input_fingerprint,
+                DatasetLineage.operations_hash.in_(operations_hashes),
+                ~Dataset.filename.endswith("__PROCESSING__")
+            )
+            .order_by(DatasetLineage.num_steps.desc(), DatasetLineage.lineage_id.desc())
+            .all()
+        )
+        return [{"lineage": lineage.as_dict(), "dataset": dataset.as_dict()} for lineage, dataset in results]
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
+def update_lineage_fingerprint(db: Session, old_fingerprint: str, new_fingerprint: str):
+    """Lineage of outputs of a dataset whose files were rewritten with the same data (e.g. compaction)"""
+    try:
+        db.query(DatasetLineage).filter(DatasetLineage.input_fingerprint == old_fingerprint).update(
+            {DatasetLineage.input_fingerprint: new_fingerprint}
+        )
+        db.commit()
+        return {"message": "Lineage updated successfully."}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def get_dataset_lineage(db: Session, dataset_id: int):
+    """Lineage of a dataset followed by the lineage of the datasets it was resumed from (latest first)"""
+    try:
+        chain = []
+        while dataset_id is not None:
+            lineage = db.query(DatasetLineage).filter(DatasetLineage.dataset_id == dataset_id).first()
+            if not lineage:
+                break
+            chain.append(lineage.as_dict())
+            dataset_id = lineage.parent_dataset_id
+        return chain
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
 def handle_file_renaming_during_processing(db: Session, old_file_name: str, new_file_name: str, directory: str):
 
     if directory == HDFS_RAW_DATASETS_DIR:
@@ -0,0 +1,137 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from schemas.jobs import JobCreate
+from models.Job import Job
+from datetime import datetime
+
+FINISHED_JOB_STATUSES = ["completed", "failed", "cancelled"]
+
+def create_job(db: Session, job: JobCreate):
+    try:
+        db_job = Job(**job.dict(), status="queued", progress=0.0, cancel_requested=False)
+        db.add(db_job)
+        db.commit()
+        db.refresh(db_job)
+        return db_job
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def get_job(db: Session, job_id: int):
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        return job.as_dict() if job else {"error": "Job not found."}
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
+def list_jobs(db: Session, skip: int, limit: int, status: str = None, kind: str = None):
+    """Latest jobs first"""
+    try:
+        query = db.query(Job)
+        if status:
+            query = query.filter(Job.status == status)
+        if kind:
+            query = query.filter(Job.kind == kind)
+        return [job.as_dict() for job in query.order_by(Job.job_id.desc()).offset(skip).limit(limit).all()]
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
+def list_queued_jobs(db: Session):
+    """Queued jobs in the order they should run (priority, then submission order)"""
+    try:
+        return db.query(Job).filter(Job.status == "queued").order_by(Job.priority.desc(), Job.job_id).all()
+    except SQLAlchemyError as e:
+        return {"error": f"Database error: {e}"}
+
+def claim_job(db: Session, job_id: int):
+    """Marks a queued job as running, False if it's not queued anymore (e.g. cancelled in between)"""
+    try:
+        updated = db.query(Job).filter(Job.job_id == job_id, Job.status == "queued").update(
+            {"status": "running", "started_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        return updated == 1
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error claiming job {job_id}: {e}")
+        return False
+
+def update_job_progress(db: Session, job_id: int, progress: float = None, message: str = None):
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        if not job:
+            return {"error": "Job not found."}
+        if progress is not None:
+            job.progress = max(0.0, min(1.0, float(progress)))
+        if message is not None:
+            job.message = message
+        db.commit()
+        return {"message": "Job progress updated successfully."}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def finish_job(db: Session, job_id: int, status: str, result: dict = None, error: str = None):
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        if not job:
+            return {"error": "Job not found."}
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        if status == "completed":
+            job.progress = 1.0
+        db.commit()
+        return {"message": f"Job {status}."}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def request_job_cancel(db: Session, job_id: int):
+    """
+    A queued job is cancelled right away, a running job is flagged (the JobManager stops it and marks it cancelled).
+    Returns the status of the job after the request.
+    """
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        if not job:
+            return {"error": "Job not found."}
+        if job.status in FINISHED_JOB_STATUSES:
+            return {"error": f"Job already {job.status}."}
+        job.cancel_requested = True
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+        db.commit()
+        return {"status": job.status}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def add_job_rename(db: Session, job_id: int, rename: dict):
+    try:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        if not job:
+            return {"error": "Job not found."}
+        # a new list, so the JSON column is marked as changed
+        job.renames = (job.renames or []) + [rename]
+        db.commit()
+        return {"message": "Job rename recorded."}
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
+
+def fail_interrupted_jobs(db: Session):
+    """Jobs left running by a previous process (server restart), returns them (as_dict, with their renames)"""
+    try:
+        jobs = db.query(Job).filter(Job.status == "running").all()
+        for job in jobs:
+            job.status = "failed"
+            job.error = "Interrupted by a server restart"
+            job.finished_at = datetime.utcnow()
+        db.commit()
+        return [job.as_dict() for job in jobs]
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"error": f"Database error: {e}"}
@@ -9,6 +9,8 @@ from api import model_training_routes
 from api import confidential_routers    
 from api import qpd_routers
 from api import testing_routers
+from api import job_routes
+from utility.job_manager import job_manager
 """
   Don't start this server from terminal without specifying port (9000 or something unused) in the command,
   otherwise by default 8000 port will conflict with federated server
@@ -39,6 +41,16 @@ app.include_router(model_training_routes.model_router)
 app.include_router(confidential_routers.confidential_router)
 app.include_router(qpd_routers.qpd_router)
 app.include_router(testing_routers.test_router)
+app.include_router(job_routes.job_router)
+
+# queued jobs survive a restart, the job manager starts them once the routers (and their job kinds) are loaded
+@app.on_event("startup")
+def start_job_manager():
+    job_manager.start()
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    job_manager.stop()
 
 # Temporary testing endpoints
 @app.get("/testing")
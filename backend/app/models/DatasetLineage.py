@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, JSON, ForeignKey
+from models.Base import Base
+
+
+class DatasetLineage(Base):
+    """
+    Lineage of a processed dataset: fingerprint of the input file and the canonical hash of the operations list
+    which produced it (see utility/dataset_lineage.py), used to reuse the outputs of earlier preprocessing requests
+    """
+    __tablename__ = "dataset_lineage"
+    lineage_id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.dataset_id", ondelete="CASCADE"), nullable=False, index=True)
+    # processed dataset the run resumed from (output of a prefix of the operations), null for a run on the input file
+    parent_dataset_id = Column(Integer, ForeignKey("datasets.dataset_id", ondelete="SET NULL"), nullable=True)
+    source_directory = Column(String, nullable=False)
+    source_filename = Column(String, nullable=False)
+    input_fingerprint = Column(String, nullable=False, index=True)
+    operations_hash = Column(String(64), nullable=False, index=True)
+    operations = Column(JSON, nullable=False)
+    num_steps = Column(Integer, nullable=False)
+    # "All Columns" lists of the planner after the operations, needed to resume with more operations
+    column_state = Column(JSON, nullable=True)
+
+    def as_dict(self):
+        return {
+            "lineage_id": self.lineage_id,
+            "dataset_id": self.dataset_id,
+            "parent_dataset_id": self.parent_dataset_id,
+            "source_directory": self.source_directory,
+            "source_filename": self.source_filename,
+            "input_fingerprint": self.input_fingerprint,
+            "operations_hash": self.operations_hash,
+            "operations": self.operations,
+            "num_steps": self.num_steps,
+            "column_state": self.column_state
+        }
@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Integer, String, JSON, Float, Boolean, DateTime
+from models.Base import Base
+from datetime import datetime
+
+
+class Job(Base):
+    """ Background job (dataset creation, preprocessing, qpd dataset...) queued and run by the JobManager (utility/job_manager.py) """
+    __tablename__ = "jobs"
+    job_id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)
+    # queued, running, completed, failed, cancelled
+    status = Column(String, nullable=False, index=True, default="queued")
+    # higher runs first, jobs of the same priority in submission order
+    priority = Column(Integer, nullable=False, default=0)
+    # keyword args of the job handler
+    params = Column(JSON, nullable=False)
+    description = Column(String, nullable=True)
+    progress = Column(Float, nullable=False, default=0.0)
+    message = Column(String, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    # wall clock limit of the run in seconds (null: JOB_TIMEOUT_<KIND> of the kind, if any)
+    timeout = Column(Float, nullable=True)
+    # inputs renamed to __PROCESSING__ by the running job (see record_job_rename), reverted if a restart interrupts it
+    renames = Column(JSON, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def as_dict(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "description": self.description,
+            "progress": self.progress,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "timeout": self.timeout,
+            "renames": self.renames,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, JSON, ForeignKey
+from models.Base import Base
+
+
+class PreprocessingRecipe(Base):
+    """ Fitted params of a preprocessing run (see PreprocessingPlanner.get_recipe), linked to the processed dataset """
+    __tablename__ = "preprocessing_recipes"
+    recipe_id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.dataset_id", ondelete="CASCADE"), nullable=False, index=True)
+    source_filename = Column(String, nullable=False, index=True)
+    # version among the recipes fitted on the same source file
+    version = Column(Integer, nullable=False)
+    operations = Column(JSON, nullable=False)
+    recipe = Column(JSON, nullable=False)
+
+    def as_dict(self):
+        return {
+            "recipe_id": self.recipe_id,
+            "dataset_id": self.dataset_id,
+            "source_filename": self.source_filename,
+            "version": self.version,
+            "operations": self.operations,
+            "recipe": self.recipe
+        }
@@ -1,2 +1,5 @@
 from .Dataset import RawDataset, Dataset
 from .Trainings import CurrentTrainings 
+from .PreprocessingRecipe import PreprocessingRecipe
+from .DatasetLineage import DatasetLineage
+from .Job import Job
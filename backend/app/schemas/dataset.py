@@ -26,4 +26,26 @@ class DatasetListResponse(BaseModel):
 
 class Operation(BaseModel):
     column: str
-    operation: str
\ No newline at end of file
+    operation: str
+    expression: Optional[str] = None   # "Expression" operation
+    function: Optional[str] = None     # "Custom Function" operation
+    params: Optional[dict] = None
+    method: Optional[str] = None       # "Remove Outliers": IQR, Z-score or MAD
+    factor: Optional[float] = None
+    mode: Optional[str] = None         # "Remove Outliers": remove or clip
+class RecipeCreate(BaseModel):
+    dataset_id: int
+    source_filename: str
+    operations: list
+    recipe: dict
+
+class LineageCreate(BaseModel):
+    dataset_id: int
+    parent_dataset_id: Optional[int] = None
+    source_directory: str
+    source_filename: str
+    input_fingerprint: str
+    operations_hash: str
+    operations: list
+    num_steps: int
+    column_state: Optional[dict] = None
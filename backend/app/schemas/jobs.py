@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class JobCreate(BaseModel):
+    kind: str
+    params: dict
+    priority: int = 0
+    description: Optional[str] = None
+    timeout: Optional[float] = None
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# run from backend/app with the test requirements: pip install -r requirements-dev.txt && python -m pytest tests
+
+# the app uses absolute imports from backend/app (from utility.x import y), as when it is run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "spark: compares with a local spark session (skipped if pyspark is not installed)")
@@ -0,0 +1,73 @@
+import pytest
+
+pl = pytest.importorskip("polars")
+pytest.importorskip("pyspark")
+
+from pyspark.sql import SparkSession
+from utility.engine_parity import compare_overviews, compare_recipes, get_value_range
+from utility.local_engine import LocalPreprocessingPlanner
+from utility.local_overview import compute_local_overview, get_spark_min_max
+from utility.overview_helper_functions import compute_overview
+from utility.preprocessing_planner import PreprocessingPlanner, to_json_value
+
+"""
+    Both engines on the same parquet file (same checks as the /test/engine-parity endpoint, on a local spark session
+    instead of the cluster and HDFS), run with: python -m pytest -m spark tests
+"""
+
+pytestmark = pytest.mark.spark
+
+# the vector normalization of All Columns fails on nulls and NaN (VectorAssembler), Drop Null removes them first
+OPERATIONS = [
+    [{"column": "All Columns", "operation": "Drop Null"}, {"column": "All Columns", "operation": "Min-Max"}],
+    [{"column": "All Columns", "operation": "Drop Null"}, {"column": "All Columns", "operation": "Z-score"}],
+    [{"column": "All Columns", "operation": "Drop Null"}, {"column": "All Columns", "operation": "L1 Norm"}],
+    [{"column": "All Columns", "operation": "Drop Null"}, {"column": "All Columns", "operation": "L2 Norm"}],
+    [{"column": "All Columns", "operation": "Drop Null"}, {"column": "All Columns", "operation": "L inf Norm"}],
+    [{"column": "All Columns", "operation": "Fill Median"}],
+    [{"column": "All Columns", "operation": "Drop Null"}],
+    [{"column": "All Columns", "operation": "Fill 0 Unknown False"}],
+    [{"column": "All Columns", "operation": "Remove Outliers", "mode": "clip"}],
+    [{"column": "x", "operation": "Remove Outliers", "method": "MAD"}],
+    [{"column": "f", "operation": "Remove Outliers", "method": "Z-score", "factor": 1.0}],
+    [{"column": "c", "operation": "Min-Max"}, {"column": "x", "operation": "Log"}],
+    [{"column": "s", "operation": "Fill Unknown"}, {"column": "s", "operation": "Label Encoding"}],
+    [{"column": "x", "operation": "Fill Mode"}, {"column": "All Columns", "operation": "Drop Duplicates"}],
+]
+
+@pytest.fixture(scope="module")
+def spark():
+    spark = SparkSession.builder.master("local[1]").appName("engine-parity-tests").getOrCreate()
+    yield spark
+    spark.stop()
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("parity") / "dataset.parquet")
+    pl.DataFrame({
+        "x": pl.Series([1, 2, 2, 3, 4, None, 50, 2], dtype=pl.Int64),
+        "f": pl.Series([0.5, float("nan"), -1.0, None, 2.0, 2.5, 3.0, -7.5], dtype=pl.Float64),
+        "c": pl.Series([3.0, 3.0, 3.0, 3.0, 3.0, 3.0, 3.0, 3.0], dtype=pl.Float64),
+        "s": ["a", "b", "a", None, "c", "a", "b", "a"],
+    }).write_parquet(path)
+    return path
+
+@pytest.mark.parametrize("operations", OPERATIONS)
+def test_local_engine_matches_spark(spark, dataset, operations):
+    df = spark.read.parquet(dataset)
+    planner = PreprocessingPlanner(df)
+    df = planner.run(operations)
+    spark_overview = to_json_value(compute_overview(df, "exact", 0.05))
+    spark_recipe = to_json_value(planner.get_recipe())
+
+    local_df = pl.read_parquet(dataset)
+    value_ranges = {c: get_value_range(*get_spark_min_max(local_df.get_column(c))) for c in ["x", "f", "c"]}
+    planner = LocalPreprocessingPlanner(local_df)
+    local_df = planner.run(operations)
+    local_overview = to_json_value(compute_local_overview(local_df, "exact", 0.05))
+    local_recipe = to_json_value(planner.get_recipe())
+
+    differences = []
+    compare_overviews(spark_overview, local_overview, 0.05, differences)
+    compare_recipes(spark_recipe, local_recipe, value_ranges, 0.05, differences)
+    assert differences == []
@@ -0,0 +1,100 @@
+import math
+import pytest
+
+pl = pytest.importorskip("polars")
+# the local engine shares its constants and recipe helpers with the spark planner
+local_engine = pytest.importorskip("utility.local_engine")
+
+LocalPreprocessingPlanner = local_engine.LocalPreprocessingPlanner
+
+"""
+    LocalPreprocessingPlanner against the values PreprocessingPlanner (spark) gives for the same operations.
+"""
+
+def run(df, operations):
+    planner = LocalPreprocessingPlanner(df)
+    return planner, planner.run(operations)
+
+def test_all_columns_min_max_of_a_constant_column_is_half():
+    df = pl.DataFrame({"a": [1.0, 1.0, 1.0], "b": [0.0, 5.0, 10.0]})
+    planner, df = run(df, [{"column": "All Columns", "operation": "Min-Max"}])
+    # MinMaxScaler maps a constant feature to the middle of the range
+    assert df["a"].to_list() == [0.5, 0.5, 0.5]
+    assert df["b"].to_list() == [0.0, 0.5, 1.0]
+    entry = planner.get_recipe()["steps"][0]
+    assert entry["kind"] == "vector_scaling"
+    assert entry["params"]["stats"] == {"a": {"min": 1.0, "max": 1.0}, "b": {"min": 0.0, "max": 10.0}}
+
+def test_column_min_max_of_a_constant_column_is_zero():
+    _, df = run(pl.DataFrame({"a": [2.0, 2.0]}), [{"column": "a", "operation": "Min-Max"}])
+    assert df["a"].to_list() == [0.0, 0.0]
+
+def test_all_columns_norm_fails_the_job_on_null():
+    df = pl.DataFrame({"a": [3.0, None], "b": [4.0, 2.0]})
+    # VectorAssembler fails when the normalized rows are computed, not when the step is added
+    with pytest.raises(local_engine.LocalEngineDataError):
+        run(df, [{"column": "All Columns", "operation": "L2 Norm"}])
+
+def test_all_columns_min_max_fails_the_step_on_nan():
+    df = pl.DataFrame({"a": [1.0, float("nan")], "b": [4.0, 2.0]})
+    # the MinMaxScaler fit fails, the step is skipped
+    planner, df = run(df, [{"column": "All Columns", "operation": "Min-Max"}])
+    assert planner.get_report()["steps"][0]["status"] == "failed"
+    assert df["b"].to_list() == [4.0, 2.0]
+
+def test_all_columns_l2_norm():
+    df = pl.DataFrame({"a": [3.0, 0.0], "b": [4.0, 2.0]})
+    _, df = run(df, [{"column": "All Columns", "operation": "L2 Norm"}])
+    assert df["a"].to_list() == pytest.approx([0.6, 0.0])
+    assert df["b"].to_list() == pytest.approx([0.8, 1.0])
+
+def test_all_columns_l_inf_norm_of_a_zero_row():
+    df = pl.DataFrame({"a": [-4.0, 0.0], "b": [2.0, 0.0]})
+    _, df = run(df, [{"column": "All Columns", "operation": "L inf Norm"}])
+    assert df["a"].to_list() == [-1.0, 0.0]
+    assert df["b"].to_list() == [0.5, 0.0]
+
+def test_fill_median_is_the_lower_median():
+    df = pl.DataFrame({"x": [1.0, 2.0, 3.0, 4.0, None]})
+    planner, df = run(df, [{"column": "x", "operation": "Fill Median"}])
+    # Imputer median (approxQuantile) returns a value of the column, not the mean of the two middle values
+    assert planner.get_recipe()["steps"][0]["params"]["surrogates"] == {"x": 2.0}
+    assert df["x"].to_list() == [1.0, 2.0, 3.0, 4.0, 2.0]
+
+def test_remove_outliers_clip_keeps_nan():
+    df = pl.DataFrame({"x": [1.0, 2.0, 3.0, 4.0, 100.0, float("nan")]})
+    planner, df = run(df, [{"column": "x", "operation": "Remove Outliers", "mode": "clip"}])
+    # quartiles of the valid values 2.0 and 4.0, bounds [2 - 1.5 * 2, 4 + 1.5 * 2]
+    assert planner.get_recipe()["steps"][0]["params"]["bounds"] == {"x": [-1.0, 7.0]}
+    values = df["x"].to_list()
+    assert values[:5] == [1.0, 2.0, 3.0, 4.0, 7.0]
+    assert math.isnan(values[5])
+
+def test_remove_outliers_removes_rows():
+    df = pl.DataFrame({"x": [1.0, 2.0, 3.0, 4.0, 100.0]})
+    _, df = run(df, [{"column": "x", "operation": "Remove Outliers"}])
+    assert df["x"].to_list() == [1.0, 2.0, 3.0, 4.0]
+
+def test_label_encoding_most_frequent_first():
+    df = pl.DataFrame({"s": ["b", "a", "b", "c"]})
+    planner, df = run(df, [{"column": "s", "operation": "Label Encoding"}])
+    # frequencyDesc, ties in alphabetical order
+    assert planner.get_recipe()["steps"][0]["params"]["labels"] == ["b", "a", "c"]
+    assert df["s"].to_list() == [0.0, 1.0, 0.0, 2.0]
+
+def test_drop_null_drops_nan():
+    df = pl.DataFrame({"x": [1.0, float("nan"), None, 4.0], "s": ["a", "b", "c", None]})
+    _, df = run(df, [{"column": "x", "operation": "Drop Null"}])
+    assert df["x"].to_list() == [1.0, 4.0]
+
+def test_failed_step_is_reported_and_skipped():
+    df = pl.DataFrame({"x": [1.0, 2.0]})
+    planner, df = run(df, [
+        {"column": "missing", "operation": "Fill Median"},
+        {"column": "x", "operation": "Square"},
+    ])
+    assert df["x"].to_list() == [2.0, 4.0]
+    report = planner.get_report()
+    assert report["numSteps"] == 2
+    assert [step["status"] for step in report["steps"]] == ["failed", "applied"]
+    assert [entry["kind"] for entry in planner.get_recipe()["steps"]] == ["projection"]
@@ -0,0 +1,119 @@
+import math
+import pytest
+
+pl = pytest.importorskip("polars")
+
+from utility.local_overview import compute_local_overview, get_lower_quantile, get_spark_min_max, get_spark_type
+
+"""
+    Local engine overview against the values spark computes for the same data (expected values are the ones of
+    compute_overview / percentile_approx / min / max on the parquet written from the same polars df).
+"""
+
+def test_lower_quantile_is_percentile_approx_without_error():
+    values = [1.0, 2.0, 3.0, 4.0]
+    # percentile_approx(x, p) returns the value of rank ceil(p * n), never an interpolation
+    assert get_lower_quantile(values, 0.25) == 1.0
+    assert get_lower_quantile(values, 0.5) == 2.0
+    assert get_lower_quantile(values, 0.75) == 3.0
+    assert get_lower_quantile(values, 0.0) == 1.0
+    assert get_lower_quantile(values, 1.0) == 4.0
+    assert get_lower_quantile([1.0, 2.0, 3.0, 4.0, 100.0], 0.75) == 4.0
+    assert get_lower_quantile([], 0.5) is None
+
+def test_spark_min_max_nan_is_the_largest_value():
+    min_val, max_val = get_spark_min_max(pl.Series([0.5, float("nan"), -1.0, None, 2.0]))
+    assert min_val == -1.0
+    assert math.isnan(max_val)
+
+    min_val, max_val = get_spark_min_max(pl.Series([float("nan"), None], dtype=pl.Float64))
+    assert math.isnan(min_val) and math.isnan(max_val)
+
+    assert get_spark_min_max(pl.Series([3, None, -2, 7])) == (-2, 7)
+    assert get_spark_min_max(pl.Series([None, None], dtype=pl.Float64)) == (None, None)
+
+def test_spark_type_of_polars_dtypes():
+    assert get_spark_type(pl.Int32) == ("IntegerType()", "int")
+    assert get_spark_type(pl.Int64) == ("LongType()", "bigint")
+    assert get_spark_type(pl.UInt64) == ("DecimalType(20,0)", "decimal(20,0)")
+    assert get_spark_type(pl.List(pl.Float64)) == ("ArrayType(DoubleType(), True)", "array<double>")
+    assert get_spark_type(pl.Datetime("us", "UTC"))[0] == "TimestampType()"
+    assert get_spark_type(pl.Datetime("us"))[0] == "TimestampNTZType()"
+
+@pytest.fixture
+def overview():
+    df = pl.DataFrame({
+        "x": pl.Series([1, 2, 3, 4, None], dtype=pl.Int64),
+        "f": pl.Series([0.5, float("nan"), -1.0, None, 2.0], dtype=pl.Float64),
+        "s": ["a", "b", "a", None, "a" * 60],
+        "arr": pl.Series([[1.0, 2.0], [3.0, 0.0], None, [0.0, 0.0], [4.0]], dtype=pl.List(pl.Float64)),
+    })
+    overview = compute_local_overview(df, mode="exact", relative_error=0.05)
+    overview["columnStats"] = {stats["name"]: stats for stats in overview["columnStats"]}
+    return overview
+
+def test_overview_structure(overview):
+    assert overview["numRows"] == 5
+    assert overview["numColumns"] == 4
+    assert overview["overviewMode"] == "exact"
+    assert overview["relativeError"] == 0.05
+    assert list(overview["columnStats"]) == ["x", "f", "s", "arr"]
+
+def test_overview_numeric_column(overview):
+    stats = overview["columnStats"]["x"]
+    assert stats["type"] == "LongType()"
+    assert stats["entries"] == 5
+    assert stats["nullCount"] == 1
+    assert stats["mean"] == 2.5
+    # sample standard deviation (spark stddev)
+    assert stats["stddev"] == pytest.approx(1.2909944487358056)
+    assert (stats["min"], stats["max"]) == (1, 4)
+    # exact distinct count counts null as a value
+    assert stats["uniqueCount"] == 5
+    assert stats["quartiles"] == {"Q1": 1.0, "median": 2.0, "Q3": 3.0, "IQR": 2.0}
+    assert stats["histogram"]["bins"] == pytest.approx([1.0 + 0.3 * i for i in range(11)])
+    # the max value goes to the last bin
+    assert stats["histogram"]["counts"] == [1, 0, 0, 1, 0, 0, 1, 0, 0, 1]
+
+def test_overview_float_column_with_nan(overview):
+    stats = overview["columnStats"]["f"]
+    assert stats["type"] == "DoubleType()"
+    # NaN is not a null, and is the max
+    assert stats["nullCount"] == 1
+    assert stats["min"] == -1.0
+    assert math.isnan(stats["max"])
+    assert stats["uniqueCount"] == 5
+    # no histogram without a finite range
+    assert "histogram" not in stats
+
+def test_overview_string_column(overview):
+    stats = overview["columnStats"]["s"]
+    assert stats["type"] == "StringType()"
+    assert stats["nullCount"] == 1
+    assert stats["uniqueCount"] == 4
+    assert stats["topCategories"][0] == {"value": "a", "count": 2}
+    others = sorted(stats["topCategories"][1:], key=lambda category: str(category["value"]))
+    assert others == [
+        {"value": None, "count": 1},
+        {"value": "a" * 50 + "...", "count": 1},
+        {"value": "b", "count": 1},
+    ]
+
+def test_overview_array_column(overview):
+    stats = overview["columnStats"]["arr"]
+    assert stats["type"] == "ArrayType(DoubleType(), True)"
+    assert stats["nullCount"] == 1
+    assert stats["Shape"] == (2,)
+    assert stats["LengthStats"] == {"min": 1, "max": 2, "mean": 1.75, "std": 0.5}
+    assert stats["valueCount"] == 7
+    value_stats = stats["valueStats"]
+    assert (value_stats["min"], value_stats["max"]) == (0.0, 4.0)
+    assert value_stats["mean"] == pytest.approx(10 / 7)
+    # population standard deviation of the values
+    assert value_stats["std"] == pytest.approx(math.sqrt(110 / 49))
+    assert value_stats["median"] == 1.0
+    assert value_stats["sparsity"] == pytest.approx(3 / 7)
+
+def test_overview_invalid_mode():
+    with pytest.raises(ValueError):
+        compute_local_overview(pl.DataFrame({"x": [1]}), mode="sampled")
@@ -0,0 +1,263 @@
+from pyspark.sql import functions as F
+from pyspark.sql.functions import pandas_udf
+from pyspark.sql.types import DoubleType
+from functools import reduce
+import pandas as pd
+import ast
+
+
+"""
+    User defined column transforms of preprocessing, both are applied per row on executors:
+    i) "Expression": a restricted formula compiled to a spark Column (a Spark SQL expression, it runs in the JVM
+        without any python worker), e.g.
+            {"column": "temp", "operation": "Expression", "expression": "clip(value, -40, 60) * 1.8 + 32"}
+        `value` is the column of the step, other columns by name or col("name with spaces").
+        Only literals, arithmetic / comparison / boolean operators, "a if cond else b" and the functions of
+        EXPRESSION_FUNCTIONS are allowed. The expression is never evaluated by python, it's only parsed (ast) and
+        translated node by node, so it can't run any code.
+    ii) "Custom Function": a python function registered in COLUMN_FUNCTIONS (see register_column_function), run as an
+        Arrow backed pandas UDF (vectorized over batches of rows), e.g.
+            {"column": "distance", "operation": "Custom Function", "function": "unit_convert", "params": {"fromUnit": "km", "toUnit": "mi"}}
+    The result replaces the column of the step (or adds it, if there is no such column).
+"""
+
+MAX_EXPRESSION_LENGTH = 1000
+STEP_COLUMN_NAME = "value"
+
+def bin_column(column_expr, *edges):
+    """Index of the bin [edges[i], edges[i+1]) of the value (last bin includes the last edge), null outside the edges"""
+    if len(edges) < 2:
+        raise ValueError("bin needs at least two edges")
+    if any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError(f"Edges of bin should be strictly increasing, got {list(edges)}")
+    result = F.when(column_expr == edges[-1], F.lit(len(edges) - 2))
+    for i in range(len(edges) - 1):
+        result = result.when((column_expr >= edges[i]) & (column_expr < edges[i + 1]), F.lit(i))
+    return result
+
+# name: (spark function, min args, max args)
+EXPRESSION_FUNCTIONS = {
+    "abs": (F.abs, 1, 1),
+    "sqrt": (F.sqrt, 1, 1),
+    "exp": (F.exp, 1, 1),
+    "log": (F.log, 1, 1),
+    "log10": (F.log10, 1, 1),
+    "log2": (F.log2, 1, 1),
+    "pow": (F.pow, 2, 2),
+    "floor": (F.floor, 1, 1),
+    "ceil": (F.ceil, 1, 1),
+    "round": (lambda x, scale=0: F.round(x, scale), 1, 2),
+    "sign": (F.signum, 1, 1),
+    "min": (F.least, 2, None),
+    "max": (F.greatest, 2, None),
+    "clip": (lambda x, lower, upper: F.least(F.greatest(x, lower), upper), 3, 3),
+    "bin": (bin_column, 3, None),
+    "coalesce": (F.coalesce, 2, None),
+    "isnull": (lambda x: x.isNull(), 1, 1),
+    "isnan": (F.isnan, 1, 1),
+    "lower": (F.lower, 1, 1),
+    "upper": (F.upper, 1, 1),
+    "trim": (F.trim, 1, 1),
+    "length": (F.length, 1, 1),
+    "concat": (F.concat, 2, None),
+    "double": (lambda x: x.cast("double"), 1, 1),
+    "int": (lambda x: x.cast("int"), 1, 1),
+    "string": (lambda x: x.cast("string"), 1, 1),
+}
+
+BINARY_OPERATORS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.Mod: lambda a, b: a % b,
+    ast.Pow: F.pow,
+}
+
+COMPARISON_OPERATORS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+}
+
+
+class LiteralColumn:
+    """Literal of an expression, kept as a python value for functions that need one (e.g. the scale of round)"""
+    def __init__(self, value):
+        self._literal = value
+        self.column = F.lit(value)
+
+def is_number_literal(value, integer=False):
+    """Whether a compiled node is a literal number (an int if integer), booleans are not numbers"""
+    if not isinstance(value, LiteralColumn) or isinstance(value._literal, bool):
+        return False
+    return isinstance(value._literal, int) if integer else isinstance(value._literal, (int, float))
+
+
+def parse_expression(expression):
+    if not isinstance(expression, str) or not expression.strip():
+        raise ValueError("Expression is empty")
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        return ast.parse(expression.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {e.msg}")
+
+def get_expression_columns(expression, step_column):
+    """Names of the columns used by the expression (value is the column of the step)"""
+    columns = set()
+    for node in ast.walk(parse_expression(expression)):
+        if isinstance(node, ast.Name) and node.id not in EXPRESSION_FUNCTIONS and node.id != "col":
+            columns.add(step_column if node.id == STEP_COLUMN_NAME else node.id)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "col":
+            if len(node.args) == 1 and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+                columns.add(node.args[0].value)
+    return columns
+
+def compile_expression(expression, step_column, resolve):
+    """
+    Spark Column of the expression, resolve(name) gives the Column of a column of the df
+    (the planner resolves to the composed expressions of the columns).
+    """
+    def to_column(value):
+        return value.column if isinstance(value, LiteralColumn) else value
+
+    def compile_node(node):
+        if isinstance(node, ast.Constant):
+            if node.value is not None and not isinstance(node.value, (bool, int, float, str)):
+                raise ValueError(f"Literal {node.value!r} is not allowed in an expression")
+            return LiteralColumn(node.value)
+        if isinstance(node, ast.Name):
+            return resolve(step_column if node.id == STEP_COLUMN_NAME else node.id)
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            return BINARY_OPERATORS[type(node.op)](to_column(compile_node(node.left)), to_column(compile_node(node.right)))
+        if isinstance(node, ast.UnaryOp):
+            operand = compile_node(node.operand)
+            if isinstance(node.op, (ast.USub, ast.UAdd)) and is_number_literal(operand):
+                # a negative number stays a literal (bin edges, scale of round)
+                return LiteralColumn(-operand._literal if isinstance(node.op, ast.USub) else operand._literal)
+            operand = to_column(operand)
+            if isinstance(node.op, ast.USub):
+                return -operand
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            if isinstance(node.op, ast.Not):
+                return ~operand
+        if isinstance(node, ast.BoolOp):
+            values = [to_column(compile_node(value)) for value in node.values]
+            return reduce(lambda a, b: a & b, values) if isinstance(node.op, ast.And) else reduce(lambda a, b: a | b, values)
+        if isinstance(node, ast.Compare) and all(type(op) in COMPARISON_OPERATORS for op in node.ops):
+            operands = [to_column(compile_node(node.left))] + [to_column(compile_node(c)) for c in node.comparators]
+            conditions = [COMPARISON_OPERATORS[type(op)](operands[i], operands[i + 1]) for i, op in enumerate(node.ops)]
+            return reduce(lambda a, b: a & b, conditions)
+        if isinstance(node, ast.IfExp):
+            return F.when(to_column(compile_node(node.test)), to_column(compile_node(node.body))).otherwise(to_column(compile_node(node.orelse)))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            if name == "col":
+                if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, str):
+                    raise ValueError("col takes the name of a column as a string")
+                return resolve(node.args[0].value)
+            if name in EXPRESSION_FUNCTIONS:
+                function, min_args, max_args = EXPRESSION_FUNCTIONS[name]
+                if len(node.args) < min_args or (max_args is not None and len(node.args) > max_args):
+                    raise ValueError(f"Wrong number of arguments for {name}")
+                args = [compile_node(arg) for arg in node.args]
+                if name == "round":
+                    if len(args) == 2 and not is_number_literal(args[1], integer=True):
+                        raise ValueError("The scale of round should be an integer")
+                    return function(to_column(args[0]), *[arg._literal for arg in args[1:]])
+                if name == "bin":
+                    if not all(is_number_literal(arg) for arg in args[1:]):
+                        raise ValueError("Edges of bin should be numbers")
+                    return function(to_column(args[0]), *[arg._literal for arg in args[1:]])
+                return function(*[to_column(arg) for arg in args])
+            raise ValueError(f"Function {name} is not allowed in an expression, allowed functions: {sorted(EXPRESSION_FUNCTIONS)}")
+        raise ValueError(f"{type(node).__name__} is not allowed in an expression")
+
+    return to_column(compile_node(parse_expression(expression)))
+
+
+###################### Registered functions (pandas UDFs)
+
+# name: (function(series, params) -> series, spark return type, validate(params) or None)
+COLUMN_FUNCTIONS = {}
+
+def register_column_function(name, return_type=None, validate=None):
+    """
+    Registers function(series: pd.Series, params: dict) -> pd.Series as a Custom Function (double result by default),
+    validate(params) raises ValueError for invalid params on the driver, before any task runs the function
+    """
+    def register(function):
+        COLUMN_FUNCTIONS[name] = (function, return_type or DoubleType(), validate)
+        return function
+    return register
+
+def get_function_column(function_name, params, column_expr):
+    """(Column, return type) of a registered function applied to column_expr as a pandas UDF"""
+    if function_name not in COLUMN_FUNCTIONS:
+        raise ValueError(f"Function {function_name} is not registered, registered functions: {sorted(COLUMN_FUNCTIONS)}")
+    function, return_type, validate = COLUMN_FUNCTIONS[function_name]
+    params = params or {}
+    if validate is not None:
+        validate(params)
+
+    @pandas_udf(return_type)
+    def apply_function(series: pd.Series) -> pd.Series:
+        return function(series, params)
+
+    return apply_function(column_expr), return_type
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# linear conversions: (from, to) -> (scale, offset)
+UNIT_CONVERSIONS = {
+    ("c", "f"): (1.8, 32.0), ("f", "c"): (5 / 9, -32.0 * 5 / 9),
+    ("c", "k"): (1.0, 273.15), ("k", "c"): (1.0, -273.15),
+    ("km", "mi"): (0.621371, 0.0), ("mi", "km"): (1.609344, 0.0),
+    ("m", "ft"): (3.28084, 0.0), ("ft", "m"): (0.3048, 0.0),
+    ("kg", "lb"): (2.204623, 0.0), ("lb", "kg"): (0.45359237, 0.0),
+}
+
+def get_unit_conversion(params):
+    """(scale, offset) of the fromUnit / toUnit params"""
+    key = (str(params.get("fromUnit", "")).lower(), str(params.get("toUnit", "")).lower())
+    if key not in UNIT_CONVERSIONS:
+        raise ValueError(f"Unsupported unit conversion: {key}, supported conversions: {list(UNIT_CONVERSIONS)}")
+    return UNIT_CONVERSIONS[key]
+
+@register_column_function("unit_convert", validate=get_unit_conversion)
+def unit_convert(series, params):
+    """params: fromUnit, toUnit (see UNIT_CONVERSIONS)"""
+    scale, offset = get_unit_conversion(params)
+    return series.astype("float64") * scale + offset
+
+def validate_clip_params(params):
+    lower, upper = params.get("lower"), params.get("upper")
+    if any(bound is not None and not is_number(bound) for bound in (lower, upper)):
+        raise ValueError(f"Bounds of clip should be numbers, got lower={lower!r}, upper={upper!r}")
+    if lower is not None and upper is not None and lower > upper:
+        raise ValueError(f"Lower bound of clip ({lower}) is greater than the upper bound ({upper})")
+
+@register_column_function("clip", validate=validate_clip_params)
+def clip(series, params):
+    """params: lower, upper (either can be left out)"""
+    return series.astype("float64").clip(lower=params.get("lower"), upper=params.get("upper"))
+
+def validate_bin_params(params):
+    edges = params.get("edges")
+    if not isinstance(edges, list) or len(edges) < 2 or not all(is_number(edge) for edge in edges):
+        raise ValueError(f"edges of bin should be a list of at least two numbers, got {edges!r}")
+    if any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError(f"edges of bin should be strictly increasing, got {edges}")
+
+@register_column_function("bin", validate=validate_bin_params)
+def bin_values(series, params):
+    """params: edges (sorted bin edges), the result is the index of the bin (null outside the edges)"""
+    return pd.cut(series.astype("float64"), params["edges"], labels=False, include_lowest=True).astype("float64")
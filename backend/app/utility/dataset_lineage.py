@@ -0,0 +1,39 @@
+import hashlib
+import json
+
+
+"""
+    Memoization of preprocessing requests by the lineage of the processed datasets (models/DatasetLineage.py):
+    i) A processed dataset is identified by the fingerprint of its input file (path, size, files, modification time) and
+        the canonical hash of its operations list, an identical request returns the existing dataset without any job
+        (if it was written with the requested layout, see is_same_layout of parquet_writer.py).
+    ii) A request which extends the operations of an earlier request (same input) resumes from the earlier output:
+        only the remaining steps run, on the stored intermediate, with the "All Columns" lists of the earlier run.
+    iii) The recipe of a resumed run is the recipe of the earlier run followed by the recipe of the remaining steps.
+"""
+
+# every key of a step read by Column_Operations, All_Column_Operations or PreprocessingPlanner has to be listed here,
+# else two requests which differ only by that key share the hash (and the memoized dataset)
+CANONICAL_STEP_KEYS = ["column", "operation", "expression", "function", "params", "method", "factor", "mode", "format"]
+
+def canonical_operations(operations):
+    """Operations list with only the keys that change the result (column, operation and its optional args), in order"""
+    return [{key: step[key] for key in CANONICAL_STEP_KEYS if step.get(key) is not None} for step in operations]
+
+def get_operations_hash(operations):
+    canonical = json.dumps(canonical_operations(operations), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def get_prefix_hashes(operations):
+    """Hash -> length of every proper (non empty) prefix of the operations list"""
+    return {get_operations_hash(operations[:k]): k for k in range(1, len(operations))}
+
+def merge_recipes(prefix_recipe, recipe):
+    """Recipe of a resumed run: steps of the earlier run (prefix_recipe) followed by the steps of this run"""
+    if prefix_recipe is None:
+        return recipe
+    return {
+        **recipe,
+        "inputColumns": prefix_recipe["inputColumns"],
+        "steps": prefix_recipe["steps"] + recipe["steps"],
+    }
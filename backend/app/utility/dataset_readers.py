@@ -0,0 +1,240 @@
+from dotenv import load_dotenv
+from functools import partial
+import pandas as pd
+import numpy as np
+import json
+import io
+import os
+
+load_dotenv()
+
+# 1.0: types are inferred from all the rows, a lower ratio is opt-in (see samplingRatio below)
+CSV_SCHEMA_SAMPLING_RATIO = float(os.getenv("CSV_SCHEMA_SAMPLING_RATIO", 1.0))
+
+"""
+    Readers of the uploaded files by format, every format is read into a spark df by one distributed read and written
+    to parquet by create_new_dataset (so the overview is the same for every format). Format of a file is given by its
+    suffix (FILE_FORMATS), compressed text files are decompressed by the hadoop codec of their extension: bz2 files are
+    split between tasks, gz and zst files can't be split (one task per file, the write is still parallel as the df is
+    repartitioned by write_parquet).
+
+    Read options from the request json (stored in datastats["readOptions"]):
+        schema: DDL string of all the columns (e.g. "id INT, name STRING, price DOUBLE"), no inference pass
+            (csv: applied to the columns in file order, json: columns by name)
+        schemaHints: csv only, {column: type} (e.g. {"id": "bigint", "price": "double"}), other columns are read as
+            strings. Only the header line is read to get the column names, no inference pass
+        samplingRatio: fraction of the rows used to infer the types (csv, json) when there is no schema or hints
+            (CSV_SCHEMA_SAMPLING_RATIO of the env, all the rows by default). Spark still reads the file once for the
+            inference but parses only the sampled rows, types seen only in the rows left out are not considered (such
+            values are silently read as null), so a ratio below 1 is only safe for files of uniform values
+        multiLine: json only, the file is a single json document (array of records) instead of json lines
+
+    New formats: register a reader(spark, paths, read_options) -> df with register_reader and add its suffixes to FILE_FORMATS.
+"""
+
+# suffix: format (the longest matching suffix is used)
+FILE_FORMATS = {
+    ".csv": "csv", ".csv.gz": "csv", ".csv.bz2": "csv", ".csv.zst": "csv",
+    ".json": "json", ".jsonl": "json", ".ndjson": "json", ".json.gz": "json", ".jsonl.gz": "json", ".jsonl.bz2": "json",
+    ".parquet": "parquet",
+    ".orc": "orc",
+    ".avro": "avro",
+    ".npy": "numpy", ".npz": "numpy",
+}
+
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".zst")
+
+# format: reader(spark, paths, read_options) -> df
+DATASET_READERS = {}
+
+def register_reader(file_format):
+    def register(reader):
+        DATASET_READERS[file_format] = reader
+        return reader
+    return register
+
+def get_file_suffix(filename):
+    """Longest suffix of FILE_FORMATS the filename ends with (case insensitive), None if there is none"""
+    matches = [suffix for suffix in FILE_FORMATS if filename.lower().endswith(suffix)]
+    return max(matches, key=len) if matches else None
+
+def is_compressed_file(filename):
+    """Whether the hadoop codec of the file is picked by its extension (the file must keep its name to be read)"""
+    return filename.lower().endswith(COMPRESSED_SUFFIXES)
+
+def get_file_format(filename):
+    """Format of an uploaded file (or directory) by its suffix, None for an unsupported file"""
+    suffix = get_file_suffix(filename)
+    return FILE_FORMATS[suffix] if suffix else None
+
+def read_dataset(spark, file_format, paths, read_options=None):
+    """df of the file(s) of the given format"""
+    if file_format not in DATASET_READERS:
+        raise ValueError(f"Unsupported file format: {file_format}, supported formats: {sorted(DATASET_READERS)}")
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    return DATASET_READERS[file_format](spark, paths, read_options or {})
+
+
+###################### Text formats
+
+def get_hinted_schema(columns, schema_hints):
+    """DDL schema of the columns (in file order) with the hinted types, string for a column without hint"""
+    unknown = [c for c in schema_hints if c not in columns]
+    if unknown:
+        raise ValueError(f"Columns {unknown} of the schema hints are not in the file, columns of the file: {columns}")
+    return ", ".join(f"`{c}` {schema_hints.get(c, 'string')}" for c in columns)
+
+@register_reader("csv")
+def read_csv(spark, paths, read_options=None):
+    """CSV file(s) with header, the schema is given, built from the hints, or inferred from a sample of the rows"""
+    read_options = read_options or {}
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if read_options.get("schema"):
+        return spark.read.csv(paths, header=True, schema=read_options["schema"])
+    if read_options.get("schemaHints"):
+        # without inferSchema only the first line is read (column names)
+        columns = spark.read.csv(paths[0], header=True).columns
+        return spark.read.csv(paths, header=True, schema=get_hinted_schema(columns, read_options["schemaHints"]))
+    sampling_ratio = read_options.get("samplingRatio") or CSV_SCHEMA_SAMPLING_RATIO
+    return spark.read.csv(paths, header=True, inferSchema=True, samplingRatio=sampling_ratio)
+
+def read_lines(spark, file_format, lines, read_options=None):
+    """
+    df of csv (with the header line) or json lines already read on the driver (e.g. the start of a file), with the
+    schema / schema hints of read_options or types inferred from all the lines
+    """
+    read_options = read_options or {}
+    rdd = spark.sparkContext.parallelize(lines)
+    if file_format == "csv":
+        if read_options.get("schema"):
+            return spark.read.csv(rdd, header=True, schema=read_options["schema"])
+        if read_options.get("schemaHints"):
+            columns = spark.read.csv(spark.sparkContext.parallelize(lines[:1]), header=True).columns
+            return spark.read.csv(rdd, header=True, schema=get_hinted_schema(columns, read_options["schemaHints"]))
+        return spark.read.csv(rdd, header=True, inferSchema=True)
+    if file_format == "json":
+        if read_options.get("schema"):
+            return spark.read.json(rdd, schema=read_options["schema"])
+        return spark.read.json(rdd)
+    raise ValueError(f"Lines of {file_format} files can't be read, only csv and json lines")
+
+@register_reader("json")
+def read_json(spark, paths, read_options):
+    """JSON lines (one record per line, split between tasks) or a single json document per file with multiLine"""
+    multi_line = bool(read_options.get("multiLine", False))
+    if read_options.get("schema"):
+        return spark.read.json(paths, schema=read_options["schema"], multiLine=multi_line)
+    sampling_ratio = read_options.get("samplingRatio") or CSV_SCHEMA_SAMPLING_RATIO
+    return spark.read.json(paths, samplingRatio=sampling_ratio, multiLine=multi_line)
+
+
+###################### Binary formats (schema in the file)
+
+@register_reader("parquet")
+def read_parquet(spark, paths, read_options):
+    # we don't need inferSchema=True with parquet (as parquet stores the schema as metadata)
+    return spark.read.parquet(*paths)
+
+@register_reader("orc")
+def read_orc(spark, paths, read_options):
+    return spark.read.orc(paths)
+
+@register_reader("avro")
+def read_avro(spark, paths, read_options):
+    try:
+        return spark.read.format("avro").load(paths)
+    except Exception as e:
+        if "avro" in str(e).lower() and "data source" in str(e).lower():
+            raise Exception("Avro files need the spark-avro package, add org.apache.spark:spark-avro_<scala version>:<spark version> to SPARK_JARS_PACKAGES") from e
+        raise
+
+
+###################### NumPy (.npy, .npz)
+
+"""
+    NumPy files are read with the binaryFile source (one row per file, a file is parsed by one task, max 2 GB per file)
+    and parsed on the executors by mapInPandas, with allow_pickle=False (object arrays are rejected).
+    The first dimension of an array is the rows, arrays of an .npz file are its columns (same number of rows):
+        (n,) -> a column, (n, d) -> d columns {name}_{i}, (n, d1, d2, ...) -> a column of nested arrays (e.g. images)
+    Name of the array of an .npy file is NUMPY_COLUMN_NAME, arrays of an .npz file keep their names.
+    Columns are described from the first file (a small job that returns only the description), every file must
+    have the same arrays.
+"""
+
+NUMPY_COLUMN_NAME = "value"
+
+def get_numpy_spark_type(dtype):
+    if dtype.kind == "b":
+        return "boolean"
+    if dtype.kind == "i":
+        return {1: "tinyint", 2: "smallint", 4: "int"}.get(dtype.itemsize, "bigint")
+    if dtype.kind == "u":
+        # unsigned values in the next larger signed type
+        return {1: "smallint", 2: "int", 4: "bigint"}.get(dtype.itemsize, "double")
+    if dtype.kind == "f":
+        return "double" if dtype.itemsize > 4 else "float"
+    if dtype.kind in ["U", "S"]:
+        return "string"
+    raise ValueError(f"Unsupported numpy dtype: {dtype}")
+
+def load_numpy_arrays(content, path):
+    """{name: array} of an .npy or .npz file content"""
+    buffer = io.BytesIO(content)
+    # by content, the name of an upload being processed ends with __PROCESSING__
+    if content[:4] == b"PK\x03\x04":
+        with np.load(buffer, allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+    return {NUMPY_COLUMN_NAME: np.load(buffer, allow_pickle=False)}
+
+def get_numpy_columns(arrays):
+    """[(name, spark type)] of the columns of the arrays of a file"""
+    columns = []
+    for name, array in arrays.items():
+        if array.dtype.names or array.ndim == 0:
+            raise ValueError(f"Array {name}: structured and 0-d arrays are not supported")
+        spark_type = get_numpy_spark_type(array.dtype)
+        if array.ndim == 1:
+            columns.append((name, spark_type))
+        elif array.ndim == 2:
+            columns.extend((f"{name}_{i}", spark_type) for i in range(array.shape[1]))
+        else:
+            columns.append((name, "array<" * (array.ndim - 1) + spark_type + ">" * (array.ndim - 1)))
+    return columns
+
+def get_numpy_frame(arrays, columns):
+    """pandas df of the arrays of a file (columns as described by get_numpy_columns of the first file)"""
+    num_rows = {len(array) for array in arrays.values()}
+    if len(num_rows) > 1:
+        raise ValueError(f"Arrays of a file should have the same number of rows, found {sorted(num_rows)}")
+    if get_numpy_columns(arrays) != columns:
+        raise ValueError("Arrays of every file should have the same names, shapes (except the rows) and dtypes")
+    data = {}
+    for name, array in arrays.items():
+        if array.ndim == 1:
+            data[name] = array.astype(str) if array.dtype.kind in ["U", "S"] else array
+        elif array.ndim == 2:
+            for i in range(array.shape[1]):
+                data[f"{name}_{i}"] = array[:, i]
+        else:
+            data[name] = [row.tolist() for row in array]
+    return pd.DataFrame(data)
+
+def describe_numpy_files(batches):
+    for batch in batches:
+        for path, content in zip(batch["path"], batch["content"]):
+            yield pd.DataFrame({"columns": [json.dumps(get_numpy_columns(load_numpy_arrays(content, path)))]})
+
+def parse_numpy_files(columns, batches):
+    for batch in batches:
+        for path, content in zip(batch["path"], batch["content"]):
+            yield get_numpy_frame(load_numpy_arrays(content, path), columns)
+
+@register_reader("numpy")
+def read_numpy(spark, paths, read_options):
+    files = spark.read.format("binaryFile").load(paths).select("path", "content")
+    description = files.limit(1).mapInPandas(describe_numpy_files, "columns string").first()
+    if description is None:
+        raise Exception("No .npy or .npz files found")
+    columns = [tuple(column) for column in json.loads(description["columns"])]
+    schema = ", ".join(f"`{name}` {spark_type}" for name, spark_type in columns)
+    return files.mapInPandas(partial(parse_numpy_files, columns), schema)
@@ -0,0 +1,160 @@
+from utility.local_engine import LocalPreprocessingPlanner, local_workspace, read_hdfs_input
+from utility.local_overview import compute_local_overview, get_spark_min_max
+from utility.overview_helper_functions import compute_overview
+from utility.preprocessing_planner import PreprocessingPlanner, to_json_value
+from utility.spark_services import HDFS_FILE_READ_URL
+import math
+
+# relative tolerance of floats computed by both engines in a different order (means, stddevs, histogram bins)
+PARITY_FLOAT_TOLERANCE = 1e-6
+
+"""
+    Parity check of the local engine (local_engine.py) against spark: the same operations are run by
+    PreprocessingPlanner + compute_overview and by LocalPreprocessingPlanner + compute_local_overview on a dataset
+    (nothing is written), and the overviews and recipes are compared:
+        - row count, column names and types, counts and min/max must be equal, other floats equal up to PARITY_FLOAT_TOLERANCE
+        - spark quartiles, medians and the params fitted from them (median imputation, IQR / MAD bounds) are sketch based,
+          they may differ by relative_error * (max - min) of the column
+        - top categories with the smallest count of the list may be other values with the same count (ties)
+        - "approximate" is not compared (the local stats are all exact)
+"""
+
+# stat keys of the overview (and params of the recipe) that spark computes with percentile_approx
+QUANTILE_KEYS = {"quartiles", "Q1", "median", "Q3", "IQR"}
+
+
+def compare_values(path, spark_value, local_value, differences, tolerance=0.0):
+    """Appends {"path", "spark", "local"} to differences for each value of the two json values that doesn't match"""
+    if isinstance(spark_value, dict) and isinstance(local_value, dict):
+        for key in sorted(set(spark_value) | set(local_value), key=str):
+            if key not in spark_value or key not in local_value:
+                differences.append({"path": f"{path}.{key}", "spark": spark_value.get(key), "local": local_value.get(key)})
+            else:
+                compare_values(f"{path}.{key}", spark_value[key], local_value[key], differences, tolerance)
+        return
+    if isinstance(spark_value, list) and isinstance(local_value, list):
+        if len(spark_value) != len(local_value):
+            differences.append({"path": f"{path}.length", "spark": len(spark_value), "local": len(local_value)})
+            return
+        for i, (s, l) in enumerate(zip(spark_value, local_value)):
+            compare_values(f"{path}[{i}]", s, l, differences, tolerance)
+        return
+    numeric = (int, float)
+    if isinstance(spark_value, numeric) and isinstance(local_value, numeric) and not isinstance(spark_value, bool):
+        if isinstance(spark_value, float) or isinstance(local_value, float):
+            if math.isclose(spark_value, local_value, rel_tol=PARITY_FLOAT_TOLERANCE, abs_tol=tolerance):
+                return
+        elif spark_value == local_value:
+            return
+        differences.append({"path": path, "spark": spark_value, "local": local_value})
+        return
+    if spark_value != local_value:
+        differences.append({"path": path, "spark": spark_value, "local": local_value})
+
+def get_top_categories_key(categories):
+    """Top categories without the ones tied at the smallest count (which of the ties is listed depends on the engine)"""
+    if not categories:
+        return categories
+    last_count = categories[-1]["count"]
+    return {
+        "counts": [c["count"] for c in categories],
+        "values": sorted((c["value"], c["count"]) for c in categories if c["count"] > last_count)
+    }
+
+def compare_overviews(spark_overview, local_overview, relative_error, differences):
+    """Compares two overviews (compute_overview / compute_local_overview), see the notes above"""
+    for key in ["numRows", "numColumns"]:
+        compare_values(key, spark_overview[key], local_overview[key], differences)
+    spark_columns = {stats["name"]: stats for stats in spark_overview["columnStats"]}
+    local_columns = {stats["name"]: stats for stats in local_overview["columnStats"]}
+    compare_values("columns", list(spark_columns), list(local_columns), differences)
+
+    for name in spark_columns.keys() & local_columns.keys():
+        spark_stats = {k: v for k, v in spark_columns[name].items() if k != "approximate"}
+        local_stats = {k: v for k, v in local_columns[name].items() if k != "approximate"}
+        if "topCategories" in spark_stats and "topCategories" in local_stats:
+            spark_stats["topCategories"] = get_top_categories_key(spark_stats["topCategories"])
+            local_stats["topCategories"] = get_top_categories_key(local_stats["topCategories"])
+
+        # value range of the quartile tolerance (array columns: of the values)
+        value_stats = local_stats.get("valueStats") if isinstance(local_stats.get("valueStats"), dict) else local_stats
+        value_range = get_value_range(value_stats.get("min"), value_stats.get("max"))
+        for key in sorted(spark_stats.keys() | local_stats.keys()):
+            if key not in spark_stats or key not in local_stats:
+                differences.append({"path": f"columns.{name}.{key}", "spark": spark_stats.get(key), "local": local_stats.get(key)})
+            elif key in QUANTILE_KEYS:
+                compare_values(f"columns.{name}.{key}", spark_stats[key], local_stats[key], differences, relative_error * value_range)
+            elif key == "valueStats" and isinstance(spark_stats[key], dict) and isinstance(local_stats[key], dict):
+                for stat in sorted(spark_stats[key].keys() | local_stats[key].keys()):
+                    compare_values(
+                        f"columns.{name}.valueStats.{stat}", spark_stats[key].get(stat), local_stats[key].get(stat), differences,
+                        relative_error * value_range if stat in QUANTILE_KEYS else 0.0
+                    )
+            else:
+                compare_values(f"columns.{name}.{key}", spark_stats[key], local_stats[key], differences)
+
+def get_value_range(min_val, max_val):
+    """max - min of a column (0 if unknown or not finite)"""
+    if not isinstance(min_val, (int, float)) or not isinstance(max_val, (int, float)):
+        return 0.0
+    value_range = float(max_val) - float(min_val)
+    return value_range if math.isfinite(value_range) else 0.0
+
+def is_quantile_entry(entry):
+    """Whether spark fits the params of a recipe entry with percentile_approx (median imputation, IQR / MAD bounds)"""
+    if entry.get("kind") == "imputation":
+        return entry["step"].get("operation") == "Fill Median"
+    if entry.get("kind") in ("range_filter", "clip"):
+        return entry["params"].get("method") in ("IQR", "MAD")
+    return False
+
+def compare_recipes(spark_recipe, local_recipe, value_ranges, relative_error, differences):
+    """Compares two recipes (get_recipe), params fitted from quantiles with the tolerance of the column ranges"""
+    for key in ["recipeVersion", "inputColumns", "outputColumns"]:
+        compare_values(f"recipe.{key}", spark_recipe[key], local_recipe[key], differences)
+    if len(spark_recipe["steps"]) != len(local_recipe["steps"]):
+        differences.append({"path": "recipe.steps.length", "spark": len(spark_recipe["steps"]), "local": len(local_recipe["steps"])})
+        return
+    for i, (spark_entry, local_entry) in enumerate(zip(spark_recipe["steps"], local_recipe["steps"])):
+        path = f"recipe.steps[{i}]"
+        for key in ["kind", "step", "columns"]:
+            compare_values(f"{path}.{key}", spark_entry.get(key), local_entry.get(key), differences)
+        tolerance = 0.0
+        if is_quantile_entry(spark_entry):
+            # the bounds scale with the factor (IQR / MAD times factor), 2 quantiles per bound
+            factor = abs(spark_entry["params"].get("factor") or 0) + 1
+            tolerance = 2 * factor * relative_error * max([value_ranges.get(c, 0.0) for c in spark_entry["columns"]] or [0.0])
+        compare_values(f"{path}.params", spark_entry.get("params"), local_entry.get("params"), differences, tolerance)
+
+
+async def run_engine_parity(spark_client, directory: str, filename: str, operations: list, overview_mode: str = "exact", relative_error: float = 0.05):
+    """
+    Runs the operations on a parquet dataset of HDFS with both engines (nothing is written) and compares the outputs,
+    returns {"match", "differences", "numRows": {"spark", "local"}}
+    """
+    with spark_client.job_session() as spark:
+        df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{directory}/{filename}")
+        planner = PreprocessingPlanner(df)
+        df = planner.run(operations)
+        spark_overview = to_json_value(compute_overview(df, overview_mode, relative_error))
+        spark_recipe = to_json_value(planner.get_recipe())
+
+    with local_workspace() as workspace:
+        local_df = read_hdfs_input(f"{directory}/{filename}", "parquet", workspace)
+        value_ranges = {}
+        for c, dtype in local_df.schema.items():
+            if dtype.is_numeric():
+                value_ranges[c] = get_value_range(*get_spark_min_max(local_df.get_column(c)))
+        planner = LocalPreprocessingPlanner(local_df)
+        local_df = planner.run(operations)
+        local_overview = to_json_value(compute_local_overview(local_df, overview_mode, relative_error))
+        local_recipe = to_json_value(planner.get_recipe())
+
+    differences = []
+    compare_overviews(spark_overview, local_overview, relative_error, differences)
+    compare_recipes(spark_recipe, local_recipe, value_ranges, relative_error, differences)
+    return {
+        "match": not differences,
+        "differences": differences,
+        "numRows": {"spark": spark_overview["numRows"], "local": local_overview["numRows"]}
+    }
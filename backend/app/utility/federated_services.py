@@ -1,6 +1,8 @@
 import os
 from utility.hdfs_services import HDFSServiceManager
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import shutil
 import numpy as np
 import requests
@@ -36,6 +38,40 @@ def send_client_initialize_model_signal(session_id: int, client_token: str) -> b
 def reshape_image(img_array):
     img_array = np.stack([np.stack(row, axis=0) for row in img_array], axis=0)
     return img_array.astype(np.float32)
+
+def arrow_column_to_numpy(column):
+    """
+    Numpy array of a parquet column read by pyarrow, without going through python objects per row:
+    nested lists of a fixed size (e.g. arrays of Expand Vector, images) become extra dimensions of one flat buffer
+    (zero copy for primitive values without nulls). Returns None if the lists have different sizes or nulls.
+    """
+    array = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    shape = [len(array)]
+    while pa.types.is_list(array.type) or pa.types.is_large_list(array.type) or pa.types.is_fixed_size_list(array.type):
+        if array.null_count:
+            return None
+        if pa.types.is_fixed_size_list(array.type):
+            size = array.type.list_size
+        else:
+            sizes = np.diff(array.offsets.to_numpy())
+            if len(sizes) and (sizes != sizes[0]).any():
+                return None
+            size = int(sizes[0]) if len(sizes) else 0
+        shape.append(size)
+        array = array.flatten()
+    if array.null_count and not pa.types.is_floating(array.type):
+        return None
+    return array.to_numpy(zero_copy_only=False).reshape(shape)
+
+def table_to_numpy(table, columns):
+    """2D (rows, features) array of the columns, a fixed size array column gives one feature per element"""
+    blocks = []
+    for c in columns:
+        values = arrow_column_to_numpy(table.column(c))
+        if values is None:
+            raise Exception(f"Column {c} has lists of different sizes or nulls")
+        blocks.append(values.reshape(len(values), -1))
+    return np.concatenate(blocks, axis=1) if len(blocks) > 1 else blocks[0]
         
 
 def process_parquet_and_save_xy(filename: str, session_id: str, output_column: list, client_token: str):
@@ -65,41 +101,39 @@ def process_parquet_and_save_xy(filename: str, session_id: str, output_column: l
     hdfs_service = HDFSServiceManager()
     hdfs_service.download_folder_from_hdfs(hdfs_path, temp_download_dir)
 
-    # Find and combine parquet files
-    combined_df = None
+    # Find the parquet files, all of them are read as one arrow table (columnar, no per file pandas concat)
     parquet_files = []
-
     for root, _, files in os.walk(temp_download_dir):
         for file in files:
             if file.endswith('.parquet'):
-                file_path = os.path.join(root, file)
-                parquet_files.append(file_path)
-
-                df = pd.read_parquet(file_path)
-                if combined_df is None:
-                    combined_df = df
-                else:
-                    combined_df = pd.concat([combined_df, df], ignore_index=True)
-
-    shutil.rmtree(temp_download_dir)
+                parquet_files.append(os.path.join(root, file))
 
     if not parquet_files:
+        shutil.rmtree(temp_download_dir)
         raise Exception("No parquet files found in the downloaded folder")
 
-    
-    print(f"Combined DataFrame Shape: {combined_df.shape}")
-    print(f"DataFrame Column Labels: {combined_df.columns.tolist()}")
+    table = pq.read_table(temp_download_dir)
+    shutil.rmtree(temp_download_dir)
+
+    print(f"Combined Table Shape: {(table.num_rows, table.num_columns)}")
+    print(f"Table Column Labels: {table.column_names}")
     
     # Check if all output columns exist
-    missing_cols = [col for col in output_column if col not in combined_df.columns]
+    missing_cols = [col for col in output_column if col not in table.column_names]
     if missing_cols:
         raise Exception(f"Output column(s) not found in the DataFrame: {missing_cols}")
 
-    print(combined_df.dtypes)
-    print("Check head", combined_df.head())
-
-    X = np.array([reshape_image(img) for img in combined_df['image']])
-    Y = combined_df[output_column].values
+    print(table.schema)
+
+    # image datasets: X is the image column, else the other columns (numeric or fixed size arrays, see Expand Vector)
+    if 'image' in table.column_names:
+        X = arrow_column_to_numpy(table.column('image'))
+        if X is None:
+            X = np.array([reshape_image(img) for img in table.column('image').to_pandas()])
+        X = X.astype(np.float32, copy=False)
+    else:
+        X = table_to_numpy(table, [c for c in table.column_names if c not in output_column])
+    Y = table_to_numpy(table, output_column)
     
     print(f"X shape: {X.shape}")
     print(f"Y shape: {Y.shape}")
@@ -1,4 +1,8 @@
 import os
+import io
+import struct
+import uuid
+import pyarrow.parquet as pq
 from hdfs import InsecureClient
 from dotenv import load_dotenv
 
@@ -9,6 +13,7 @@ HADOOP_USER_NAME = os.getenv("HADOOP_USER_NAME")
 HDFS_RAW_DATASETS_DIR = os.getenv("HDFS_RAW_DATASETS_DIR")
 HDFS_PROCESSED_DATASETS_DIR = os.getenv("HDFS_PROCESSED_DATASETS_DIR")
 RECENTLY_UPLOADED_DATASETS_DIR = os.getenv("RECENTLY_UPLOADED_DATASETS_DIR")
+HDFS_TRANSFER_THREADS = int(os.getenv("HDFS_TRANSFER_THREADS", 4))  # parallel file transfers of download_path / upload_path
 """
 NOTE: HDFS session is created and destroyed on demand, so there is no session created when __init__ method is called.
 """
@@ -128,12 +133,16 @@ class HDFSServiceManager:
         return self._with_hdfs_client(list_files)
 
 
-    async def rename_file_or_folder(self,source_path, destination_path):
+    async def rename_file_or_folder(self,source_path, destination_path, ignore_missing=False):
         """
         Rename a file in HDFS.
         NOTE: If the destination_path already exists and is a directory, the source will be moved into it
+        With ignore_missing a missing source is skipped (returns False), used to revert a rename that may not have happened
         """
         def rename(client):
+            if ignore_missing and client.status(source_path, strict=False) is None:
+                print(f"{source_path} not found in HDFS, rename skipped.")
+                return False
             client.rename(source_path, destination_path)
             print(f"Renamed {source_path} to {destination_path} in HDFS.")
 
@@ -143,6 +152,18 @@ class HDFSServiceManager:
             print(f"Error renaming file in HDFS: {e}")
             raise Exception(f"Error renaming file in HDFS: {e}")
     
+    async def make_directory(self, hdfs_path):
+        """Create a directory (and its parents) in HDFS"""
+        def make(client):
+            client.makedirs(hdfs_path)
+            print(f"Created directory {hdfs_path} in HDFS.")
+
+        try:
+            return self._with_hdfs_client(make)
+        except Exception as e:
+            print(f"Error creating directory in HDFS: {e}")
+            raise Exception(f"Error creating directory in HDFS: {e}")
+
     def download_folder_from_hdfs(self, hdfs_folder_path, local_destination_path):
         """
         Download a folder from HDFS to local filesystem
@@ -177,6 +198,171 @@ class HDFSServiceManager:
             print(f"Error downloading folder from HDFS: {e}")
             raise Exception(f"Error downloading folder from HDFS: {e}")
 
+    def download_path(self, hdfs_path, local_path):
+        """Downloads a file or a directory (recursively) to local_path, which should not exist yet (sync)"""
+        def download(client):
+            return client.download(hdfs_path, local_path, n_threads=HDFS_TRANSFER_THREADS)
+
+        try:
+            return self._with_hdfs_client(download)
+        except Exception as e:
+            print(f"Error downloading {hdfs_path} from HDFS: {e}")
+            raise Exception(f"Error downloading {hdfs_path} from HDFS: {e}")
+
+    def upload_path(self, local_path, hdfs_path):
+        """
+        Uploads a local file or directory (recursively) to hdfs_path, an existing hdfs_path is replaced (sync).
+        The upload goes to a temporary path next to hdfs_path which is renamed to it (upload with overwrite into an
+        existing directory would nest local_path in it), a failed upload leaves hdfs_path as it was.
+        """
+        def upload(client):
+            temp_path = f"{hdfs_path}__UPLOAD_{uuid.uuid4().hex[:8]}"
+            try:
+                client.upload(temp_path, local_path, n_threads=HDFS_TRANSFER_THREADS)
+                client.delete(hdfs_path, recursive=True)
+                client.rename(temp_path, hdfs_path)
+            except Exception:
+                client.delete(temp_path, recursive=True)
+                raise
+            return hdfs_path
+
+        try:
+            return self._with_hdfs_client(upload)
+        except Exception as e:
+            print(f"Error uploading {local_path} to HDFS: {e}")
+            raise Exception(f"Error uploading {local_path} to HDFS: {e}")
+
+    def delete_path(self, hdfs_path):
+        """Deletes a file or directory (recursively) if it exists, returns False if it didn't exist (sync)"""
+        def delete(client):
+            return client.delete(hdfs_path, recursive=True)
+
+        try:
+            return self._with_hdfs_client(delete)
+        except Exception as e:
+            print(f"Error deleting {hdfs_path} from HDFS: {e}")
+            raise Exception(f"Error deleting {hdfs_path} from HDFS: {e}")
+
+    def path_exists(self, hdfs_path):
+        """Whether a file or directory exists (sync)"""
+        def exists(client):
+            return client.status(hdfs_path, strict=False) is not None
+
+        try:
+            return self._with_hdfs_client(exists)
+        except Exception as e:
+            print(f"Error checking {hdfs_path} in HDFS: {e}")
+            raise Exception(f"Error checking {hdfs_path} in HDFS: {e}")
+
+    def list_data_files(self, hdfs_path):
+        """
+        Relative paths of the data files under hdfs_path (a file, or a directory written by spark), with their lengths,
+        hidden files (_SUCCESS, .crc etc.) are skipped. Returns: list of (relative path, length)
+        """
+        def list_files(client):
+            status = client.status(hdfs_path)
+            if status["type"] == "FILE":
+                return [("", status["length"])]
+            # walk gives absolute paths
+            base_path, files = client.resolve(hdfs_path), []
+            for (root, _), _, entries in client.walk(hdfs_path, status=True):
+                prefix = root[len(base_path):].strip("/")
+                files += [
+                    (f"{prefix}/{name}" if prefix else name, meta["length"]) for name, meta in entries
+                    if not name.startswith(("_", ".")) and meta["length"] > 0
+                ]
+            return files
+
+        try:
+            return self._with_hdfs_client(list_files)
+        except Exception as e:
+            print(f"Error listing data files in HDFS: {e}")
+            raise Exception(f"Error listing data files in HDFS: {e}")
+
+    def read_prefix(self, hdfs_path, length):
+        """First length bytes of a file, cut after its last complete line (the whole file if it's shorter) (sync)"""
+        def read(client):
+            file_length = client.status(hdfs_path)["length"]
+            with client.read(hdfs_path, offset=0, length=min(length, file_length)) as reader:
+                content = reader.read()
+            if len(content) < file_length:
+                content = content[:content.rfind(b"\n") + 1]
+            return content
+
+        try:
+            return self._with_hdfs_client(read)
+        except Exception as e:
+            print(f"Error reading the start of {hdfs_path} from HDFS: {e}")
+            raise Exception(f"Error reading the start of {hdfs_path} from HDFS: {e}")
+
+    def get_size(self, hdfs_path):
+        """Total length in bytes of a file or directory (sync)"""
+        def size(client):
+            return client.content(hdfs_path)["length"]
+
+        try:
+            return self._with_hdfs_client(size)
+        except Exception as e:
+            print(f"Error getting size of {hdfs_path} from HDFS: {e}")
+            raise Exception(f"Error getting size of {hdfs_path} from HDFS: {e}")
+
+    def get_fingerprint(self, hdfs_path, key_path=None):
+        """
+        Fingerprint of a file or directory in HDFS: path, total length, number of files and latest modification time
+        of any file in it. key_path is used in place of hdfs_path in the fingerprint (e.g. without __PROCESSING__ suffix)
+        """
+        def fingerprint(client):
+            summary = client.content(hdfs_path)
+            latest = client.status(hdfs_path)["modificationTime"]
+            for _, _, files in client.walk(hdfs_path, status=True):
+                latest = max([latest] + [meta["modificationTime"] for _, meta in files])
+            return f"{key_path or hdfs_path}:{summary['length']}:{summary['fileCount']}:{latest}"
+
+        try:
+            return self._with_hdfs_client(fingerprint)
+        except Exception as e:
+            print(f"Error getting fingerprint from HDFS: {e}")
+            raise Exception(f"Error getting fingerprint from HDFS: {e}")
+
+    def read_parquet_footers(self, hdfs_path):
+        """
+        Read the footers (metadata) of all parquet files at hdfs_path (a file, or a directory written by spark)
+        without reading any data: only the last 8 bytes and the footer of every file are transferred.
+        Hidden files (_SUCCESS, .crc etc.) are skipped.
+
+        Returns: list of pyarrow.parquet.FileMetaData
+        """
+        def read_footer(client, path, length):
+            # parquet file ends with: footer, 4 byte little endian footer length, magic "PAR1"
+            with client.read(path, offset=length - 8, length=8) as reader:
+                tail = reader.read()
+            if tail[4:] != b"PAR1":
+                raise Exception(f"{path} is not a parquet file")
+            footer_length = struct.unpack("<I", tail[:4])[0]
+            with client.read(path, offset=length - 8 - footer_length, length=footer_length) as reader:
+                footer = reader.read()
+            # pyarrow only parses the end of the buffer, so the footer can be read without the column chunks
+            return pq.read_metadata(io.BytesIO(b"PAR1" + footer + tail))
+
+        def read_footers(client):
+            status = client.status(hdfs_path)
+            if status["type"] == "FILE":
+                files = [(hdfs_path, status["length"])]
+            else:
+                files = []
+                for (root, _), _, entries in client.walk(hdfs_path, status=True):
+                    files += [
+                        (f"{root}/{name}", meta["length"]) for name, meta in entries
+                        if not name.startswith(("_", ".")) and meta["length"] > 0
+                    ]
+            return [read_footer(client, path, length) for path, length in files]
+
+        try:
+            return self._with_hdfs_client(read_footers)
+        except Exception as e:
+            print(f"Error reading parquet footers from HDFS: {e}")
+            raise Exception(f"Error reading parquet footers from HDFS: {e}")
+
     ########## Don't delete ################
     # this method is never used in the current implementation of FedData
 
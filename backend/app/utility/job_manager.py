@@ -0,0 +1,431 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from pyspark import SparkContext
+from dotenv import load_dotenv
+from utility.db import get_db
+from utility.hdfs_services import HDFSServiceManager
+from schemas.jobs import JobCreate
+from crud.jobs_crud import (
+    create_job,
+    get_job,
+    list_queued_jobs,
+    claim_job,
+    update_job_progress,
+    finish_job,
+    request_job_cancel,
+    fail_interrupted_jobs,
+    add_job_rename
+)
+from crud.datasets_crud import handle_file_renaming_during_processing
+import threading
+import asyncio
+import os
+
+load_dotenv()
+
+# all the jobs share one spark driver, so only a few run at a time (the rest wait in the queue)
+JOB_MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", 3))
+# the queue is also checked every JOB_POLL_INTERVAL seconds (a submit, cancel or finished job checks it right away)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))
+
+"""
+    Background jobs (dataset creation, preprocessing, qpd datasets...):
+    i) a job is a row of the jobs table (kind, keyword args of its handler, priority, status, progress), so the queue
+        survives a restart: queued jobs run after the restart, jobs left running are marked failed and the inputs they
+        renamed to __PROCESSING__ (record_job_rename) are renamed back, before any queued job runs
+    ii) a dispatcher thread starts the queued jobs by priority (then submission order), at most JOB_MAX_RUNNING at a time
+        and at most the limit of the kind (JOB_LIMIT_<KIND> env, e.g. JOB_LIMIT_PREPROCESSING=2) of each kind
+    iii) a handler is the async process_* function of the kind (registered with register_job_kind), run by asyncio.run
+        in a worker thread. It returns {"error": ...} on failure (the job is failed) or its result (the job is completed)
+    iv) spark jobs of a job run in its spark job group (set by SparkSessionManager.job_session, the measured blocks of
+        SparkJobInstrumentation are added to the job), cancelling a running job cancels its spark job groups and the
+        next report_progress / job_session / measured block raises JobCancelledError, so the handler reverts its
+        renames as for any error
+    v) a job running longer than its timeout (timeout of the request, else JOB_TIMEOUT_<KIND> env in seconds, e.g.
+        JOB_TIMEOUT_PREPROCESSING=3600) is cancelled the same way and marked failed
+    vi) HDFS paths written by a job (add_job_output) are deleted if the job doesn't complete, unless the handler kept
+        them (keep_job_outputs) once a dataset entry refers to them, so a cancelled job leaves no partial output
+"""
+
+JOB_PRIORITIES = {"low": -10, "normal": 0, "high": 10}
+
+# kind: (handler, max running jobs of the kind, default priority, default timeout)
+JOB_KINDS = {}
+
+CURRENT_JOB = ContextVar("current_job", default=None)
+
+
+def get_job_priority(priority):
+    """Priority of a request (an integer or low / normal / high), None if not given"""
+    if priority is None:
+        return None
+    if isinstance(priority, str) and priority.lower() in JOB_PRIORITIES:
+        return JOB_PRIORITIES[priority.lower()]
+    try:
+        return int(priority)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid priority: {priority}, use an integer or one of {list(JOB_PRIORITIES)}")
+
+def get_job_timeout(timeout):
+    """Timeout of a job in seconds (a positive number), None if not given or 0 (no timeout)"""
+    if timeout is None or timeout == "":
+        return None
+    try:
+        seconds = float(timeout)
+    except (TypeError, ValueError):
+        seconds = -1
+    if seconds < 0:
+        raise ValueError(f"Invalid timeout: {timeout}, use a number of seconds")
+    return seconds or None
+
+def register_job_kind(kind, limit=1, priority="normal", timeout=None):
+    """
+    Registers an async handler(**params) of a job kind, limit is the default of JOB_LIMIT_<KIND> and timeout
+    (seconds, None for no timeout) the default of JOB_TIMEOUT_<KIND>
+    """
+    def register(handler):
+        JOB_KINDS[kind] = (
+            handler, int(os.getenv(f"JOB_LIMIT_{kind.upper()}", limit)), get_job_priority(priority),
+            get_job_timeout(os.getenv(f"JOB_TIMEOUT_{kind.upper()}", timeout))
+        )
+        return handler
+    return register
+
+
+class JobCancelledError(Exception):
+    pass
+
+
+class JobContext:
+    """State of a running job, visible to the code it runs through get_current_job()"""
+    def __init__(self, job_id, kind, timeout=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.timeout = timeout
+        self.timed_out = False
+        self.spark_group = f"job-{job_id}"
+        # the job group and the groups of the measured blocks (see SparkJobInstrumentation)
+        self.spark_groups = {self.spark_group}
+        self.current_step = None
+        # HDFS paths written by the job, deleted if it doesn't complete
+        self.outputs = []
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelledError(f"Job {self.job_id} was cancelled")
+
+    def add_spark_group(self, group_id, label=None):
+        with self._lock:
+            self.spark_groups.add(group_id)
+        if label:
+            self.current_step = label
+
+    def add_output(self, hdfs_path):
+        with self._lock:
+            self.outputs.append(hdfs_path)
+
+    def keep_outputs(self):
+        with self._lock:
+            self.outputs = []
+
+    def cancel(self):
+        self._cancel_event.set()
+        sc = SparkContext._active_spark_context
+        if sc is None:
+            return
+        with self._lock:
+            groups = list(self.spark_groups)
+        for group_id in groups:
+            sc.cancelJobGroup(group_id)
+
+    def get_spark_progress(self):
+        """Task counts of the spark jobs run by the job so far, None without a spark context"""
+        sc = SparkContext._active_spark_context
+        if sc is None:
+            return None
+        tracker = sc.statusTracker()
+        with self._lock:
+            groups = list(self.spark_groups)
+        job_ids = [job_id for group_id in groups for job_id in tracker.getJobIdsForGroup(group_id)]
+        progress = {"sparkJobs": len(job_ids), "runningSparkJobs": 0, "numTasks": 0, "numCompletedTasks": 0, "numActiveTasks": 0}
+        for job_id in job_ids:
+            job_info = tracker.getJobInfo(job_id)
+            if job_info is None:
+                continue
+            if job_info.status == "RUNNING":
+                progress["runningSparkJobs"] += 1
+            for stage_id in job_info.stageIds:
+                stage_info = tracker.getStageInfo(stage_id)
+                if stage_info is not None:
+                    progress["numTasks"] += stage_info.numTasks
+                    progress["numCompletedTasks"] += stage_info.numCompletedTasks
+                    progress["numActiveTasks"] += stage_info.numActiveTasks
+        return progress
+
+
+def get_current_job():
+    """JobContext of the job running in this thread, None outside of a job"""
+    return CURRENT_JOB.get()
+
+def add_job_output(hdfs_path):
+    """Registers an HDFS path written by the current job (before writing it), deleted if the job doesn't complete"""
+    job = get_current_job()
+    if job is not None:
+        job.add_output(hdfs_path)
+
+def keep_job_outputs():
+    """The outputs of the current job are referred to by a dataset entry, they are kept even if the job fails later"""
+    job = get_current_job()
+    if job is not None:
+        job.keep_outputs()
+
+def record_job_rename(processing_path, original_path, directory=None, filename=None, remove_path=None):
+    """
+    Stores in the job (before the rename) that the current job renames original_path to processing_path (HDFS), so a
+    restart which interrupts the job renames it back. directory / filename: dataset entry renamed with it (see
+    handle_file_renaming_during_processing), remove_path: directory removed after the rename back (compressed uploads)
+    """
+    job = get_current_job()
+    if job is None:
+        return
+    db = next(get_db())
+    try:
+        result = add_job_rename(db, job.job_id, {
+            "processingPath": processing_path, "path": original_path,
+            "directory": directory, "filename": filename, "removePath": remove_path
+        })
+        if "error" in result:
+            print(f"Error recording a rename of job {job.job_id}: {result['error']}")
+    finally:
+        db.close()
+
+def revert_job_renames(db, job):
+    """Renames the inputs of an interrupted job (as_dict) back, a rename which didn't happen (or was reverted) is skipped"""
+    for rename in reversed(job.get("renames") or []):
+        try:
+            asyncio.run(hdfs_client.rename_file_or_folder(rename["processingPath"], rename["path"], ignore_missing=True))
+            if rename.get("removePath"):
+                hdfs_client.delete_path(rename["removePath"])
+            if rename.get("directory"):
+                result = handle_file_renaming_during_processing(db, f"{rename['filename']}__PROCESSING__", rename["filename"], rename["directory"])
+                if isinstance(result, dict) and "error" in result:
+                    print(f"Dataset entry of {rename['path']} not renamed back: {result['error']}")
+        except Exception as e:
+            print(f"Error renaming {rename['processingPath']} of interrupted job {job['job_id']} back: {e}")
+
+def report_progress(progress=None, message=None):
+    """
+    Stores the progress (0 to 1) and message of the current job (no-op outside of a job).
+    It's also a cancellation point: raises JobCancelledError if the job was cancelled.
+    """
+    job = get_current_job()
+    if job is None:
+        return
+    job.raise_if_cancelled()
+    db = next(get_db())
+    try:
+        result = update_job_progress(db, job.job_id, progress, message)
+        if "error" in result:
+            print(f"Error updating progress of job {job.job_id}: {result['error']}")
+    finally:
+        db.close()
+
+
+class JobManager:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=JOB_MAX_RUNNING, thread_name_prefix="job")
+        # job_id: JobContext of the running jobs
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dispatcher = None
+        self._stopped = False
+
+    def start(self):
+        """Starts dispatching the queued jobs, after the jobs interrupted by a restart are failed (see _recover)"""
+        if self._dispatcher is not None:
+            return
+        self._stopped = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self):
+        """Stops dispatching, running jobs finish (queued jobs stay queued for the next start)"""
+        self._stopped = True
+        self._wakeup.set()
+        self._dispatcher = None
+
+    def submit(self, kind, params, priority=None, description=None, timeout=None):
+        """Queues a job, returns its id (timeout in seconds, None for the timeout of the kind)"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}, kinds: {sorted(JOB_KINDS)}")
+        _, _, default_priority, _ = JOB_KINDS[kind]
+        db = next(get_db())
+        try:
+            job = create_job(db, JobCreate(
+                kind=kind, params=params, description=description,
+                priority=default_priority if priority is None else priority, timeout=timeout
+            ))
+            if isinstance(job, dict):
+                raise Exception(job["error"])
+            job_id = job.job_id
+        finally:
+            db.close()
+        print(f"Job {job_id} ({kind}) queued")
+        self._wakeup.set()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancels a queued job, or stops a running one (its spark jobs are cancelled)"""
+        db = next(get_db())
+        try:
+            result = request_job_cancel(db, job_id)
+        finally:
+            db.close()
+        if "error" in result:
+            return result
+        with self._lock:
+            context = self._running.get(job_id)
+        if context is not None:
+            context.cancel()
+        self._wakeup.set()
+        if result["status"] == "cancelled":
+            return {"message": "Job cancelled", "status": "cancelled"}
+        return {"message": "Job cancellation requested", "status": result["status"]}
+
+    def get_status(self, job_id):
+        """Stored state of the job, with the current step and spark task counts while it's running"""
+        db = next(get_db())
+        try:
+            job = get_job(db, job_id)
+        finally:
+            db.close()
+        if "error" in job:
+            return job
+        with self._lock:
+            context = self._running.get(job_id)
+        if context is not None:
+            job["currentStep"] = context.current_step
+            try:
+                job["sparkProgress"] = context.get_spark_progress()
+            except Exception as e:
+                print(f"Spark progress of job {job_id} not available: {e}")
+                job["sparkProgress"] = None
+        return job
+
+    def _recover(self):
+        """Marks the jobs interrupted by a restart as failed and renames their inputs back (in the dispatcher thread, no event loop)"""
+        db = next(get_db())
+        try:
+            interrupted = fail_interrupted_jobs(db)
+            if isinstance(interrupted, dict):
+                print(f"Error checking interrupted jobs: {interrupted['error']}")
+                return
+            for job in interrupted:
+                revert_job_renames(db, job)
+            if interrupted:
+                print(f"Jobs {[job['job_id'] for job in interrupted]} were interrupted by a restart, marked as failed")
+        finally:
+            db.close()
+
+    def _dispatch_loop(self):
+        self._recover()
+        while not self._stopped:
+            self._wakeup.clear()
+            try:
+                self._dispatch()
+            except Exception as e:
+                print(f"Error dispatching jobs: {e}")
+            self._wakeup.wait(JOB_POLL_INTERVAL)
+
+    def _dispatch(self):
+        db = next(get_db())
+        try:
+            queued = list_queued_jobs(db)
+            if isinstance(queued, dict):
+                print(f"Error listing queued jobs: {queued['error']}")
+                return
+            for job in queued:
+                with self._lock:
+                    if len(self._running) >= JOB_MAX_RUNNING:
+                        break
+                    if job.kind not in JOB_KINDS:
+                        finish_job(db, job.job_id, "failed", error=f"Unknown job kind: {job.kind}")
+                        continue
+                    handler, limit, _, kind_timeout = JOB_KINDS[job.kind]
+                    if sum(1 for context in self._running.values() if context.kind == job.kind) >= limit:
+                        continue
+                    # registered before the claim, so a cancel of the claimed job finds it
+                    context = JobContext(job.job_id, job.kind, job.timeout or kind_timeout)
+                    self._running[job.job_id] = context
+                if not claim_job(db, job.job_id):
+                    with self._lock:
+                        self._running.pop(job.job_id, None)
+                    continue
+                self._executor.submit(self._run, context, handler, dict(job.params))
+        finally:
+            db.close()
+
+    def _time_out(self, context):
+        print(f"Job {context.job_id} ({context.kind}) timed out after {context.timeout:g} seconds, cancelling it")
+        context.timed_out = True
+        context.cancel()
+
+    def _remove_outputs(self, context):
+        """Deletes the partial outputs of a job which didn't complete"""
+        for hdfs_path in context.outputs:
+            try:
+                if hdfs_client.delete_path(hdfs_path):
+                    print(f"Removed partial output {hdfs_path} of job {context.job_id}")
+            except Exception as e:
+                print(f"Error removing partial output {hdfs_path} of job {context.job_id}: {e}")
+
+    def _run(self, context, handler, params):
+        status, result, error = "completed", None, None
+        timer = None
+        try:
+            print(f"Job {context.job_id} ({context.kind}) started")
+            if context.timeout:
+                timer = threading.Timer(context.timeout, self._time_out, (context,))
+                timer.daemon = True
+                timer.start()
+            token = CURRENT_JOB.set(context)
+            try:
+                # the task of asyncio.run copies the context, so the handler sees the job
+                result = asyncio.run(handler(**params))
+            finally:
+                CURRENT_JOB.reset(token)
+                if timer is not None:
+                    timer.cancel()
+            if isinstance(result, dict) and "error" in result:
+                status, error = "failed", str(result["error"])
+        except Exception as e:
+            status, error = "failed", str(e)
+        try:
+            # a job which completed before its cancel / timeout took effect stays completed
+            if status != "completed" and context.timed_out:
+                status, error = "failed", f"Timed out after {context.timeout:g} seconds"
+            elif status != "completed" and context.cancelled:
+                status, error = "cancelled", error or "Cancelled"
+            if status != "completed":
+                self._remove_outputs(context)
+            db = next(get_db())
+            try:
+                finish_job(db, context.job_id, status, result if status == "completed" else None, error)
+            finally:
+                db.close()
+            print(f"Job {context.job_id} ({context.kind}) {status}" + (f": {error}" if error else ""))
+        finally:
+            with self._lock:
+                self._running.pop(context.job_id, None)
+            self._wakeup.set()
+
+
+hdfs_client = HDFSServiceManager()
+job_manager = JobManager()
@@ -0,0 +1,74 @@
+from dotenv import load_dotenv
+from uuid import uuid4
+import os
+
+load_dotenv()
+
+# parquet: intermediate parquet in HDFS_CHECKPOINT_DIR, local: df.localCheckpoint (executor storage), off: no checkpoints
+CHECKPOINT_MODES = ["parquet", "local", "off"]
+CHECKPOINT_MODE = os.getenv("CHECKPOINT_MODE", "parquet")
+CHECKPOINT_EVERY_STEPS = int(os.getenv("CHECKPOINT_EVERY_STEPS", 10))
+CHECKPOINT_MAX_PLAN_DEPTH = int(os.getenv("CHECKPOINT_MAX_PLAN_DEPTH", 60))
+HDFS_CHECKPOINT_DIR = os.getenv("HDFS_CHECKPOINT_DIR", "preprocessing_checkpoints")
+
+"""
+    Checkpoints for long preprocessing pipelines: the plan of the df grows with every step, so the analysis of the plan
+    (for every action) and the recomputation of the upstream lineage (for every fitted estimator) get slower.
+    A checkpoint materializes the df and continues from the materialized data, which cuts the lineage.
+    PreprocessingPlanner checkpoints after every CHECKPOINT_EVERY_STEPS steps, or after a step when the plan depth
+    crosses CHECKPOINT_MAX_PLAN_DEPTH. The planner counts the plan nodes it adds (get_plan_depth only for the input
+    and after barrier steps), so the plan is not built and printed after every step.
+"""
+
+def get_plan_depth(df):
+    """Number of nodes in the (not analyzed) logical plan of df, an estimate of the cost of analysing it"""
+    try:
+        return df._jdf.queryExecution().logical().treeString().count("\n")
+    except Exception as e:
+        print(f"Plan depth not available: {e}")
+        return 0
+
+
+class LineageCheckpointer:
+    """
+    Checkpoints of one job, parquet checkpoints are written under HDFS_CHECKPOINT_DIR/{job_name}_{uuid}
+    and must be removed with cleanup() once the output of the job is written.
+    """
+    def __init__(self, spark, hdfs_client, hdfs_base_url, job_name, mode=CHECKPOINT_MODE,
+                 every_steps=CHECKPOINT_EVERY_STEPS, max_plan_depth=CHECKPOINT_MAX_PLAN_DEPTH):
+        if mode not in CHECKPOINT_MODES:
+            raise ValueError(f"Invalid checkpoint mode: {mode}, supported modes: {CHECKPOINT_MODES}")
+        self.spark = spark
+        self.hdfs_client = hdfs_client
+        self.hdfs_base_url = hdfs_base_url
+        self.directory = f"{HDFS_CHECKPOINT_DIR}/{job_name}_{uuid4().hex[:8]}"
+        self.mode = mode
+        self.every_steps = every_steps
+        self.max_plan_depth = max_plan_depth
+        self.num_checkpoints = 0
+
+    def should_checkpoint(self, steps_since_checkpoint, plan_depth):
+        """plan_depth: (estimated) number of nodes in the logical plan of the df, see get_plan_depth"""
+        if self.mode == "off" or steps_since_checkpoint == 0:
+            return False
+        return steps_since_checkpoint >= self.every_steps or plan_depth > self.max_plan_depth
+
+    def checkpoint(self, df):
+        """Materializes df and returns a df reading the materialized data (eager)"""
+        self.num_checkpoints += 1
+        if self.mode == "local":
+            return df.localCheckpoint(eager=True)
+
+        path = f"{self.hdfs_base_url}/{self.directory}/checkpoint_{self.num_checkpoints}.parquet"
+        df.write.mode("overwrite").parquet(path)
+        return self.spark.read.parquet(path)
+
+    def cleanup(self):
+        """Removes the parquet checkpoints (local checkpoints are released by spark with the df)"""
+        if self.mode != "parquet" or self.num_checkpoints == 0:
+            return
+        try:
+            self.hdfs_client.delete_path(self.directory)
+            print(f"Removed {self.num_checkpoints} checkpoint(s) in {self.directory}")
+        except Exception as e:
+            print(f"Error removing checkpoints in {self.directory}: {e}")
@@ -0,0 +1,800 @@
+from utility.hdfs_services import HDFSServiceManager
+from utility.local_overview import pl, compute_local_overview, get_spark_type, get_lower_quantile, get_spark_min_max, get_sample_stddev
+from utility.overview_cache import overview_stats_cache
+from utility.parquet_writer import PARQUET_TARGET_FILE_SIZE_MB, PARQUET_COMPRESSION, PARQUET_COMPRESSION_CODECS
+from utility.dataset_readers import is_compressed_file
+from utility.preprocessing_planner import (
+    NORMALIZATION_OPERATIONS, PROJECTION_OPERATIONS, FILL_VALUES, ALL_COLUMNS_IMPUTATIONS, COLUMN_IMPUTATIONS,
+    VECTOR_NORMS, VECTOR_INVALID_VALUE_ERROR, RECIPE_FORMAT_VERSION, print_step_error, to_json_value
+)
+from utility.processing_helper_functions import get_step_lineage, get_outlier_params, get_outlier_bounds
+from utility.spark_services import get_raw_write_filename
+from utility.job_manager import get_current_job, add_job_output
+from contextlib import contextmanager
+from functools import reduce
+from dotenv import load_dotenv
+import pyarrow.parquet as pq
+import tempfile
+import threading
+import shutil
+import json
+import math
+import time
+import uuid
+import os
+
+load_dotenv()
+hdfs_client = HDFSServiceManager()
+
+HDFS_RAW_DATASETS_DIR = os.getenv("HDFS_RAW_DATASETS_DIR")
+HDFS_PROCESSED_DATASETS_DIR = os.getenv("HDFS_PROCESSED_DATASETS_DIR")
+RECENTLY_UPLOADED_DATASETS_DIR = os.getenv("RECENTLY_UPLOADED_DATASETS_DIR")
+PROCESSING_ENGINE = os.getenv("PROCESSING_ENGINE", "auto")  # auto, spark or local (a request can override it with "engine")
+# largest input run by the local engine in auto mode, estimated in memory size (see get_local_input_size)
+LOCAL_ENGINE_MAX_MB = float(os.getenv("LOCAL_ENGINE_MAX_MB", 256))
+# local engine jobs running at a time (each holds its input and output in the memory of this process)
+LOCAL_ENGINE_MAX_JOBS = int(os.getenv("LOCAL_ENGINE_MAX_JOBS", 1))
+LOCAL_ENGINE_TMP_DIR = os.getenv("LOCAL_ENGINE_TMP_DIR")  # local copies of the input and output (system temp dir if not set)
+
+"""
+    Local engine: most uploads are small (well under a GB), for them the spark jobs are mostly scheduling and JVM
+    overhead. The local engine runs create_new_dataset and preprocess_data in this process with polars (arrow memory):
+    the input is downloaded from HDFS, processed in memory and the parquet output is uploaded back, with the same
+    result as the spark jobs (same parquet schema, overview, recipe, column state and lineage), so the datasets it
+    writes are read, preprocessed and appended to by the spark jobs like any other.
+
+    Engine of a job (select_engine): "engine" of the request, else PROCESSING_ENGINE.
+        spark: always spark
+        local: the local engine, an error if it can't run the job
+        auto: the local engine if the input is at most LOCAL_ENGINE_MAX_MB in memory (uncompressed size of the parquet
+            row groups from the footers, the file size of a csv) and nothing below rules it out, else spark. At most
+            LOCAL_ENGINE_MAX_JOBS jobs run locally at a time, an auto job runs on spark when they are all taken
+            (a job requesting the local engine waits for one, see local_engine_slot)
+    The local engine can't run (spark does):
+        - formats other than csv and parquet, compressed files, a schema or schema hints (read options of spark)
+        - partitionBy or maxRecordsPerFile layouts
+        - operations outside LOCAL_OPERATIONS (Expression, Custom Function, One Hot Encoding, Expand Vector)
+        - columns without a spark type in parquet (structs such as ml vectors), found when the input is read: in auto
+            mode the job then runs on spark (LocalEngineUnsupportedError is raised before anything is written)
+    Differences from spark:
+        - csv types are inferred from all the rows (samplingRatio is ignored), ints are int when every value fits
+        - stats are exact (no percentile_approx / HLL error), see local_overview.py
+        - Drop Duplicates keeps the first row of every duplicate group (spark keeps any of them)
+    Recipes, the other job kinds (recipe application, partitions, compaction, qpd) and the preview stay on spark.
+"""
+
+PROCESSING_ENGINES = ["auto", "spark", "local"]
+LOCAL_ENGINE_SLOTS = threading.BoundedSemaphore(LOCAL_ENGINE_MAX_JOBS)
+LOCAL_FILE_FORMATS = ["csv", "parquet"]
+LOCAL_OPERATIONS = set(
+    NORMALIZATION_OPERATIONS + PROJECTION_OPERATIONS + list(FILL_VALUES) + list(ALL_COLUMNS_IMPUTATIONS) + list(COLUMN_IMPUTATIONS)
+    + ["Drop Null", "Drop Duplicates", "Remove Outliers", "Label Encoding", "Exclude from All Columns list"]
+)
+SPARK_ROW_METADATA_KEY = b"org.apache.spark.sql.parquet.row.metadata"
+INT32_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+class LocalEngineUnsupportedError(Exception):
+    pass
+
+class LocalEngineDataError(Exception):
+    """Error spark raises when the output is computed (not when the step is added), it fails the job, not the step"""
+    pass
+
+
+def get_local_engine_blockers(file_format="parquet", filename=None, read_options=None, layout=None, operations=None):
+    """Reasons the local engine can't run a job (empty if it can), from what is known before the input is read"""
+    blockers = []
+    if pl is None:
+        blockers.append("polars is not installed")
+    if file_format not in LOCAL_FILE_FORMATS:
+        blockers.append(f"{file_format} files are read by spark only")
+    if filename and is_compressed_file(filename):
+        blockers.append("compressed files are read by spark only")
+    if read_options and (read_options.get("schema") or read_options.get("schemaHints")):
+        blockers.append("schema and schemaHints are read options of spark only")
+    if layout and (layout.get("partitionBy") or layout.get("maxRecordsPerFile")):
+        blockers.append("partitionBy and maxRecordsPerFile layouts are written by spark only")
+    unsupported = sorted({step["operation"] for step in operations or [] if step["operation"] not in LOCAL_OPERATIONS})
+    if unsupported:
+        blockers.append(f"operations {unsupported} run on spark only")
+    return blockers
+
+def select_engine(engine=None, input_size=None, file_format="parquet", filename=None, read_options=None, layout=None, operations=None):
+    """(engine, reason) of a job: "spark" or "local", engine is the requested one (PROCESSING_ENGINE if None)"""
+    engine = engine or PROCESSING_ENGINE
+    if engine not in PROCESSING_ENGINES:
+        raise ValueError(f"Invalid engine: {engine}, supported engines: {PROCESSING_ENGINES}")
+    if engine == "spark":
+        return "spark", "requested"
+    blockers = get_local_engine_blockers(file_format, filename, read_options, layout, operations)
+    if blockers:
+        if engine == "local":
+            raise ValueError(f"The local engine can't run this job: {'; '.join(blockers)}")
+        return "spark", "; ".join(blockers)
+    if engine == "local":
+        return "local", "requested"
+    if input_size is None or input_size > LOCAL_ENGINE_MAX_MB * 1024 * 1024:
+        return "spark", f"input larger than {LOCAL_ENGINE_MAX_MB:g} MB in memory"
+    return "local", f"input of {input_size / (1024 * 1024):.1f} MB in memory"
+
+def get_local_input_size(hdfs_path, file_format="parquet"):
+    """
+    Estimated in memory size (bytes) of an input in HDFS for select_engine: uncompressed size of the row groups of a
+    parquet (footers only, compressed files can be several times smaller than their data), the size of other files.
+    None if not available.
+    """
+    try:
+        if file_format == "parquet":
+            footers = hdfs_client.read_parquet_footers(hdfs_path)
+            return sum(footer.row_group(i).total_byte_size for footer in footers for i in range(footer.num_row_groups))
+        return hdfs_client.get_size(hdfs_path)
+    except Exception as e:
+        print(f"Input size not available for the engine selection: {e}")
+        return None
+
+@contextmanager
+def local_engine_slot(wait=False):
+    """One of the LOCAL_ENGINE_MAX_JOBS slots of the local engine, yields False if none is free (without wait)"""
+    acquired = LOCAL_ENGINE_SLOTS.acquire(blocking=wait)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            LOCAL_ENGINE_SLOTS.release()
+
+
+###################### Reading and writing
+
+@contextmanager
+def local_workspace():
+    """Temporary local directory of a job, removed with everything in it when the job is done"""
+    path = tempfile.mkdtemp(prefix="local_engine_", dir=LOCAL_ENGINE_TMP_DIR)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def list_local_data_files(path):
+    """Data files of a local file or directory, hidden files (_SUCCESS, .crc etc.) are skipped"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names if not name.startswith(("_", "."))
+    )
+
+def read_local_csv(path):
+    """
+    CSV file(s) with header, types inferred from all the rows like spark's inferSchema: int when every value fits in
+    an int (else bigint), timestamps in UTC, all null columns and times of day as strings
+    """
+    frames = [pl.read_csv(file, try_parse_dates=True, infer_schema_length=None) for file in list_local_data_files(path)]
+    if not frames:
+        raise Exception("No csv files found")
+    df = pl.concat(frames, how="vertical_relaxed") if len(frames) > 1 else frames[0]
+    exprs = []
+    for c, dtype in df.schema.items():
+        if dtype == pl.Int64:
+            series = df.get_column(c)
+            if INT32_RANGE[0] <= series.min() and series.max() <= INT32_RANGE[1]:
+                exprs.append(pl.col(c).cast(pl.Int32))
+        elif dtype == pl.Null or dtype == pl.Time:
+            exprs.append(pl.col(c).cast(pl.String))
+        elif isinstance(dtype, pl.Datetime) and not dtype.time_zone:
+            exprs.append(pl.col(c).dt.replace_time_zone("UTC"))
+    return df.with_columns(exprs) if exprs else df
+
+def read_local_parquet(path):
+    """Parquet file or directory, timestamps written by spark (UTC) keep their time zone"""
+    table = pq.read_table(path)
+    df = pl.from_arrow(table)
+    metadata = (table.schema.metadata or {}).get(SPARK_ROW_METADATA_KEY)
+    spark_types = {field["name"]: field["type"] for field in json.loads(metadata)["fields"]} if metadata else {}
+    exprs = []
+    for c, dtype in df.schema.items():
+        if isinstance(dtype, pl.Datetime) and not dtype.time_zone and spark_types.get(c) == "timestamp":
+            exprs.append(pl.col(c).dt.replace_time_zone("UTC"))
+        elif dtype == pl.Categorical:
+            # dictionary encoded (e.g. key=value directories)
+            exprs.append(pl.col(c).cast(pl.String))
+    return df.with_columns(exprs) if exprs else df
+
+def read_hdfs_input(hdfs_path, file_format, workspace):
+    """polars df of a csv or parquet file / directory in HDFS (downloaded to the workspace)"""
+    local_path = os.path.join(workspace, "input")
+    hdfs_client.download_path(hdfs_path, local_path)
+    df = read_local_csv(local_path) if file_format == "csv" else read_local_parquet(local_path)
+    for c, dtype in df.schema.items():
+        try:
+            get_spark_type(dtype)
+        except ValueError:
+            raise LocalEngineUnsupportedError(f"Column {c} of type {dtype} is not supported by the local engine")
+    return df
+
+def write_local_parquet(df, local_dir, layout=None):
+    """
+    Writes df as parquet part files in local_dir with the layout keys of write_parquet (parquet_writer.py) except
+    partitionBy and maxRecordsPerFile, the number of files is the in memory size of df over the target file size.
+    Returns the layout used, with the number of files as numWriteTasks.
+    """
+    layout = layout or {}
+    target_file_size_mb = layout.get("targetFileSizeMb") or PARQUET_TARGET_FILE_SIZE_MB
+    sort_by = layout.get("sortBy") or []
+    compression = layout.get("compression") or PARQUET_COMPRESSION
+    if compression not in PARQUET_COMPRESSION_CODECS:
+        raise ValueError(f"Invalid compression codec: {compression}, supported codecs: {PARQUET_COMPRESSION_CODECS}")
+    if layout.get("partitionBy") or layout.get("maxRecordsPerFile"):
+        raise ValueError("partitionBy and maxRecordsPerFile layouts are written by spark only")
+    missing_columns = [c for c in sort_by if c not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Columns {missing_columns} of the layout are not in the dataset")
+
+    if sort_by:
+        df = df.sort(sort_by)
+    num_files = max(1, min(df.height, math.ceil(df.estimated_size() / (target_file_size_mb * 1024 * 1024))))
+    rows_per_file = math.ceil(df.height / num_files)
+    codec = "uncompressed" if compression == "none" else compression
+    os.makedirs(local_dir)
+    write_id = uuid.uuid4().hex
+    for i in range(num_files):
+        part = df.slice(i * rows_per_file, rows_per_file) if num_files > 1 else df
+        part.write_parquet(os.path.join(local_dir, f"part-{i:05d}-{write_id}.{codec}.parquet"), compression=codec)
+    open(os.path.join(local_dir, "_SUCCESS"), "w").close()
+
+    return {
+        "targetFileSizeMb": target_file_size_mb,
+        "partitionBy": [],
+        "sortBy": sort_by,
+        "compression": compression,
+        "maxRecordsPerFile": None,
+        "numWriteTasks": num_files,
+    }
+
+def write_hdfs_dataset(df, hdfs_path, workspace, layout=None):
+    """
+    Writes df as a parquet directory at hdfs_path (replaced if it exists), returns the layout used. A new directory is
+    removed if the job doesn't complete.
+    """
+    local_dir = os.path.join(workspace, "output")
+    written_layout = write_local_parquet(df, local_dir, layout)
+    if not hdfs_client.path_exists(hdfs_path):
+        add_job_output(hdfs_path)
+    hdfs_client.upload_path(local_dir, hdfs_path)
+    return written_layout
+
+
+###################### Operations (same semantics as PreprocessingPlanner)
+
+def is_float_dtype(dtype):
+    return dtype == pl.Float32 or dtype == pl.Float64
+
+def get_local_fill_expression(column_expr, dtype, value):
+    """Same as get_fill_expression (preprocessing_planner.py): the value is filled only in columns of a matching type"""
+    if isinstance(value, bool):
+        return column_expr.fill_null(value) if dtype == pl.Boolean else column_expr
+    if isinstance(value, (int, float)):
+        if not dtype.is_numeric():
+            return column_expr
+        # fillna treats NaN as null in float/double columns
+        if is_float_dtype(dtype):
+            column_expr = pl.when(column_expr.is_nan()).then(None).otherwise(column_expr)
+        return column_expr.fill_null(pl.lit(value).cast(dtype))
+    return column_expr.fill_null(value) if dtype == pl.String else column_expr
+
+def get_local_normalized_column(column_expr, method, stats):
+    """Same as get_normalized_column (processing_helper_functions.py) on a polars expression"""
+    if method == "Min-Max":
+        min_val, max_val = stats["min"], stats["max"]
+        if (max_val - min_val) == 0:
+            return pl.lit(0.0)
+        return (column_expr - min_val) / (max_val - min_val)
+    elif method == "Z-score":
+        stddev_val = stats["stddev"] or 0
+        if stddev_val == 0:
+            return pl.lit(0.0)
+        return (column_expr - stats["mean"]) / stddev_val
+    elif method == "L1 Norm":
+        if stats["abs_sum"] == 0:
+            return pl.lit(0.0)
+        return column_expr / stats["abs_sum"]
+    elif method == "L2 Norm":
+        if stats["squared_sum"] == 0:
+            return pl.lit(0.0)
+        return column_expr / math.sqrt(stats["squared_sum"])
+    elif method == "L inf Norm":
+        if stats["abs_max"] == 0:
+            return pl.lit(0.0)
+        return column_expr / stats["abs_max"]
+    raise Exception(f"Unknown normalization method: {method}")
+
+
+class LocalPreprocessingPlanner:
+    """
+    Runs an operations list on a polars df, usage (same as PreprocessingPlanner):
+        planner = LocalPreprocessingPlanner(df)
+        df = planner.run(operations)
+        recipe = planner.get_recipe()
+    The steps run one by one on the in memory df (eager, no plan to optimize), the recipe entries, column state and
+    lineage are the ones PreprocessingPlanner records, so the recipe can be applied by spark (apply_recipe) and a
+    later request can resume from the output. A failed step is printed and skipped, like in PreprocessingPlanner.
+    """
+    def __init__(self, df, column_state=None):
+        self.df = df
+        self.input_columns = [{"name": c, "type": get_spark_type(dtype)[1]} for c, dtype in df.schema.items()]
+        self.all_columns = list(df.columns)
+        self.numeric_columns = [c for c in self.all_columns if df.schema[c].is_numeric()]
+        if column_state is not None:
+            self.all_columns = list(column_state["allColumns"])
+            self.numeric_columns = list(column_state["numericColumns"])
+        self.rows_changed = False
+        self.modified_columns = set()
+        self.num_aggregations = 0
+        self._recipe = []
+        self.step_records = []
+        self.phase_records = []
+
+    def _require(self, columns):
+        missing = [c for c in columns if c not in self.df.columns]
+        if missing:
+            raise Exception(f"Column(s) {missing} not found in the dataframe")
+
+    def _require_numeric(self, columns):
+        if not columns:
+            raise Exception("No numeric columns for the operation")
+        self._require(columns)
+        non_numeric = [c for c in columns if not self.df.schema[c].is_numeric()]
+        if non_numeric:
+            raise Exception(f"Column(s) {non_numeric} are not numeric")
+
+    def _valid_values(self, column):
+        """Non null values of the column as double without NaN (values used by Imputer and approxQuantile)"""
+        self.num_aggregations += 1
+        return self.df.get_column(column).cast(pl.Float64, strict=False).drop_nulls().drop_nans()
+
+    def _values(self, column):
+        """The column as spark aggregates it: a non numeric column is cast to double"""
+        self.num_aggregations += 1
+        series = self.df.get_column(column)
+        return series if series.dtype.is_numeric() else series.cast(pl.Float64, strict=False)
+
+    def _record_apply(self, entry):
+        self._apply_entry(entry)
+        self._recipe.append(to_json_value(entry))
+
+    @contextmanager
+    def _measure(self, record):
+        """Wall time and rows before / after a step, the step is also a cancellation point of the current job"""
+        job = get_current_job()
+        if job is not None:
+            job.raise_if_cancelled()
+            job.current_step = record.get("label") or f"Step {record['index']}: {record['operation']} on {record['column']}"
+        rows_in, t1 = self.df.height, time.time()
+        try:
+            yield record
+        finally:
+            record["wallTime"] = round(time.time() - t1, 3)
+            if "index" in record:
+                record["rowsIn"], record["rowsOut"] = rows_in, self.df.height
+
+    def measure(self, label):
+        """Measures a phase after the steps (write, overview), reported in "phases" like the spark report"""
+        record = {"label": label}
+        self.phase_records.append(record)
+        return self._measure(record)
+
+    ###################### Transforms with known (fitted) params
+
+    def _apply_drop_null(self, columns):
+        """Same as df.dropna(subset=columns): NaN counts as null in float/double columns"""
+        self._require(columns)
+        conditions = []
+        for c in columns:
+            condition = pl.col(c).is_not_null()
+            if is_float_dtype(self.df.schema[c]):
+                condition = condition & pl.col(c).is_not_nan()
+            conditions.append(condition)
+        if conditions:
+            self.df = self.df.filter(pl.all_horizontal(conditions))
+
+    def _apply_fill(self, columns, values):
+        self._require(columns)
+        exprs = []
+        for c in columns:
+            column_expr = pl.col(c)
+            for value in values:
+                column_expr = get_local_fill_expression(column_expr, self.df.schema[c], value)
+            exprs.append(column_expr.alias(c))
+        if exprs:
+            self.df = self.df.with_columns(exprs)
+
+    def _apply_projection(self, operation, column):
+        if operation == "Drop Column":
+            # df.drop ignores a missing column
+            if column in self.df.columns:
+                self.df = self.df.drop(column)
+            return
+
+        self._require([column])
+        column_expr, dtype = pl.col(column), self.df.schema[column]
+        double_expr = column_expr.cast(pl.Float64, strict=False)
+        if operation == "Log":
+            # spark log is null for values <= 0
+            self.df = self.df.with_columns(pl.when(double_expr > 0).then(double_expr.log()).otherwise(None).alias(column))
+        elif operation == "Square":
+            # same as Column_Operations
+            self.df = self.df.with_columns(((column_expr if dtype.is_numeric() else double_expr) * 2).alias(column))
+        elif operation == "Square Root":
+            self.df = self.df.with_columns(double_expr.sqrt().alias(column))
+
+    def _apply_imputation(self, surrogates):
+        """Same as ImputerModel.transform with the output in the input columns"""
+        self._require_numeric(list(surrogates))
+        empty = [c for c, surrogate in surrogates.items() if surrogate is None]
+        if empty:
+            raise Exception(f"surrogate cannot be computed. All the values in {empty} are Null, Nan or missingValue")
+        exprs = []
+        for c, surrogate in surrogates.items():
+            double_expr = pl.col(c).cast(pl.Float64)
+            imputed = pl.when(double_expr.is_null() | double_expr.is_nan()).then(pl.lit(float(surrogate))).otherwise(double_expr)
+            exprs.append(imputed.cast(self.df.schema[c], strict=False).alias(c))
+        self.df = self.df.with_columns(exprs)
+
+    def _apply_normalization(self, column, method, stats):
+        self._require([column])
+        normalized = get_local_normalized_column(pl.col(column).cast(pl.Float64, strict=False), method, stats)
+        self.df = self.df.with_columns(normalized.cast(pl.Float64).alias(column))
+
+    def _apply_vector_scaling(self, method, columns, stats):
+        """Same values as _apply_vector_scaling of PreprocessingPlanner (vector normalization of All Columns)"""
+        self._require_numeric(columns)
+        values = {c: pl.col(c).cast(pl.Float64) for c in columns}
+        if self._count_invalid_vector_rows(columns):
+            raise LocalEngineDataError(VECTOR_INVALID_VALUE_ERROR)
+        scaled = {}
+        if method == "Min-Max":
+            for c in columns:
+                min_val, max_val = stats[c]["min"], stats[c]["max"]
+                if min_val is None or max_val is None:
+                    raise Exception(f"No values in {c} column for Min-Max scaling")
+                scaled[c] = pl.lit(0.5) if max_val == min_val else (values[c] - min_val) / (max_val - min_val)
+        elif method == "Z-score":
+            for c in columns:
+                stddev_val = stats[c]["stddev"] or 0
+                scaled[c] = pl.lit(0.0) if stddev_val == 0 else values[c] / stddev_val
+        else:
+            p = VECTOR_NORMS[method]
+            if p == 1.0:
+                norm = reduce(lambda a, b: a + b, [v.abs() for v in values.values()])
+            elif p == 2.0:
+                norm = reduce(lambda a, b: a + b, [v * v for v in values.values()]).sqrt()
+            else:
+                norm = pl.max_horizontal([v.abs() for v in values.values()])
+            scaled = {c: pl.when(norm == 0).then(values[c]).otherwise(values[c] / norm) for c in columns}
+        self.df = self.df.with_columns([scaled[c].cast(pl.Float64).alias(c) for c in columns])
+
+    def _count_invalid_vector_rows(self, columns):
+        """Rows with a null or NaN in any of the columns, VectorAssembler fails on them"""
+        values = [pl.col(c).cast(pl.Float64) for c in columns]
+        return self.df.select(pl.any_horizontal([v.is_null() | v.is_nan() for v in values]).sum()).item()
+
+    def _apply_range_filter(self, bounds):
+        """Keeps the rows with every column within its [lower, upper] bounds (a null is not within)"""
+        if not bounds:
+            return
+        self._require(list(bounds))
+        conditions = [pl.col(c).is_between(lower, upper) for c, (lower, upper) in bounds.items()]
+        self.df = self.df.filter(pl.all_horizontal(conditions))
+
+    def _apply_clip(self, bounds):
+        """Winsorizes every column to its [lower, upper] bounds (Remove Outliers in clip mode), rows are kept"""
+        self._require_numeric(list(bounds))
+        exprs = []
+        for c, (lower, upper) in bounds.items():
+            column_expr = pl.col(c)
+            clipped = pl.when(column_expr < lower).then(pl.lit(lower)).when(column_expr > upper).then(pl.lit(upper)).otherwise(column_expr)
+            if self.df.schema[c].is_float():
+                # NaN stays NaN, like get_clipped_column (polars also orders NaN above every value)
+                clipped = pl.when(column_expr.is_nan()).then(column_expr).otherwise(clipped)
+            exprs.append(clipped.cast(self.df.schema[c], strict=False).alias(c))
+        if exprs:
+            self.df = self.df.with_columns(exprs)
+
+    def _apply_label_encoding(self, column, labels):
+        """Same as StringIndexerModel.from_labels: index (double) of the value as a string, an unknown value is an error"""
+        self._require([column])
+        indexes = [float(i) for i in range(len(labels))]
+        self.df = self.df.with_columns(
+            pl.col(column).cast(pl.String).replace_strict(labels, indexes, return_dtype=pl.Float64).alias(column)
+        )
+
+    def _apply_entry(self, entry):
+        kind, step, columns, params = entry["kind"], entry["step"], entry["columns"], entry["params"]
+        if kind == "drop_null":
+            self._apply_drop_null(columns)
+        elif kind == "fill":
+            self._apply_fill(columns, params["values"])
+        elif kind == "projection":
+            self._apply_projection(step["operation"], columns[0])
+        elif kind == "imputation":
+            self._apply_imputation(params["surrogates"])
+        elif kind == "normalization":
+            self._apply_normalization(columns[0], step["operation"], params["stats"])
+        elif kind == "vector_scaling":
+            self._apply_vector_scaling(step["operation"], columns, params["stats"])
+        elif kind == "range_filter":
+            self._apply_range_filter(params["bounds"])
+        elif kind == "clip":
+            self._apply_clip(params["bounds"])
+        elif kind == "label_encoding":
+            self._apply_label_encoding(columns[0], params["labels"])
+        elif kind == "replay" and step["operation"] == "Drop Duplicates":
+            subset = None if step["column"] == "All Columns" else columns
+            self.df = self.df.unique(subset=subset, keep="first", maintain_order=True)
+        else:
+            raise Exception(f"Recipe step kind {kind} ({step['operation']}) is not supported by the local engine")
+
+    ###################### Fitting steps
+
+    def _impute(self, step, columns, strategy):
+        """Same as Imputer(strategy): mean, median (exact) or mode (most frequent value, the smallest on a tie)"""
+        self._require_numeric(columns)
+        surrogates = {}
+        for c in columns:
+            values = self._valid_values(c)
+            if len(values) == 0:
+                surrogates[c] = None
+            elif strategy == "mean":
+                surrogates[c] = values.mean()
+            elif strategy == "median":
+                surrogates[c] = get_lower_quantile(values.sort(), 0.5)
+            else:
+                counts = values.value_counts()
+                counts.columns = ["value", "count"]
+                surrogates[c] = counts.sort(["count", "value"], descending=[True, False])["value"][0]
+        self._record_apply({"kind": "imputation", "step": step, "columns": columns, "params": {"surrogates": surrogates}})
+
+    def _get_normalization_stats(self, column, method):
+        """Same stats as get_normalization_aggregations (processing_helper_functions.py)"""
+        series = self._values(column)
+        non_null = series.drop_nulls()
+        if method == "Min-Max":
+            min_val, max_val = get_spark_min_max(series)
+            return {"min": min_val, "max": max_val}
+        elif method == "Z-score":
+            return {"mean": series.mean(), "stddev": get_sample_stddev(series)}
+        elif method == "L1 Norm":
+            return {"abs_sum": non_null.abs().sum() if len(non_null) else None}
+        elif method == "L2 Norm":
+            return {"squared_sum": (non_null.cast(pl.Float64) ** 2).sum() if len(non_null) else None}
+        elif method == "L inf Norm":
+            return {"abs_max": non_null.abs().max() if len(non_null) else None}
+        return {}
+
+    def _normalize(self, step):
+        column, method = step["column"], step["operation"]
+        self._require([column])
+        stats = self._get_normalization_stats(column, method)
+        self._record_apply({"kind": "normalization", "step": step, "columns": [column], "params": {"stats": stats}})
+
+    def _scale_vectors(self, step, columns):
+        method = step["operation"]
+        self._require_numeric(columns)
+        entry = {"kind": "vector_scaling", "step": step, "columns": columns, "params": {"stats": {}}}
+        if method not in VECTOR_NORMS:
+            # the scaler fit fails on a null or NaN (VectorAssembler), so does the step
+            if self._count_invalid_vector_rows(columns):
+                raise Exception(VECTOR_INVALID_VALUE_ERROR)
+            for c in columns:
+                series = self._values(c)
+                if method == "Min-Max":
+                    min_val, max_val = get_spark_min_max(series)
+                    stats = {"min": min_val, "max": max_val}
+                else:
+                    # StandardScaler uses the sample standard deviation
+                    stats = {"stddev": get_sample_stddev(series)}
+                entry["params"]["stats"][c] = {stat: float(value) if value is not None else None for stat, value in stats.items()}
+        self._record_apply(entry)
+
+    def _remove_outliers(self, step, columns):
+        """Same bounds as remove_outliers of processing_helper_functions (exact quartiles / medians)"""
+        method, factor, mode = get_outlier_params(step)
+        self._require_numeric(columns)
+        bounds = {}
+        for c in columns:
+            values = self._valid_values(c)
+            if method == "IQR":
+                sorted_values = values.sort()
+                stats = {"quartiles": [get_lower_quantile(sorted_values, 0.25), get_lower_quantile(sorted_values, 0.75)] if len(values) else None}
+            elif method == "Z-score":
+                stats = {"mean": values.mean(), "stddev": get_sample_stddev(values)}
+            else:
+                median = get_lower_quantile(values.sort(), 0.5)
+                stats = {"median": median}
+                if median is not None:
+                    stats["mad"] = get_lower_quantile((values - median).abs().sort(), 0.5)
+            try:
+                column_bounds = get_outlier_bounds(method, stats, factor)
+            except ValueError as e:
+                raise Exception(f"{c}: {e}")
+            if column_bounds is not None:
+                bounds[c] = column_bounds
+        params = {"method": method, "factor": factor, "bounds": bounds}
+        self._record_apply({"kind": "range_filter" if mode == "remove" else "clip", "step": step, "columns": columns, "params": params})
+
+    def _encode(self, step):
+        column, operation = step["column"], step["operation"]
+        self._require([column])
+        if operation != "Label Encoding":
+            raise Exception(f"{operation} is not supported by the local engine")
+        if self.df.get_column(column).null_count() > 0:
+            print(f"error: Null values found in {column} column for {operation}")
+            return
+        # StringIndexer (frequencyDesc): most frequent first, ties in alphabetical order
+        counts = self.df.get_column(column).cast(pl.String).value_counts()
+        counts.columns = ["value", "count"]
+        labels = counts.sort(["count", "value"], descending=[True, False])["value"].to_list()
+        self._record_apply({"kind": "label_encoding", "step": step, "columns": [column], "params": {"labels": labels}})
+
+    def _all_columns_step(self, step):
+        operation = step["operation"]
+        if operation == "Drop Null":
+            self._record_apply({"kind": "drop_null", "step": step, "columns": list(self.all_columns), "params": {}})
+        elif operation == "Fill 0 Unknown False":
+            self._record_apply({"kind": "fill", "step": step, "columns": list(self.all_columns), "params": {"values": FILL_VALUES[operation]}})
+        elif operation in ALL_COLUMNS_IMPUTATIONS:
+            self._impute(step, list(self.numeric_columns), ALL_COLUMNS_IMPUTATIONS[operation])
+        elif operation in NORMALIZATION_OPERATIONS:
+            self._scale_vectors(step, list(self.numeric_columns))
+        elif operation == "Remove Outliers":
+            self._remove_outliers(step, list(self.numeric_columns))
+        elif operation == "Drop Duplicates":
+            self._record_apply({"kind": "replay", "step": step, "columns": list(self.all_columns), "params": {}})
+        elif operation not in LOCAL_OPERATIONS:
+            raise Exception(f"{operation} is not supported by the local engine")
+        else:
+            print(f"error: Operation not defined in All_Column_Operations function for {step['column']} column: {operation} \n")
+
+    def _column_step(self, step):
+        operation, column = step["operation"], step["column"]
+        if operation == "Drop Null":
+            self._record_apply({"kind": "drop_null", "step": step, "columns": [column], "params": {}})
+        elif operation in FILL_VALUES:
+            self._record_apply({"kind": "fill", "step": step, "columns": [column], "params": {"values": FILL_VALUES[operation]}})
+        elif operation in PROJECTION_OPERATIONS:
+            self._record_apply({"kind": "projection", "step": step, "columns": [column], "params": {}})
+        elif operation in COLUMN_IMPUTATIONS:
+            self._impute(step, [column], COLUMN_IMPUTATIONS[operation])
+        elif operation in NORMALIZATION_OPERATIONS:
+            self._normalize(step)
+        elif operation in ["Label Encoding", "One Hot Encoding"]:
+            self._encode(step)
+        elif operation == "Remove Outliers":
+            self._remove_outliers(step, [column])
+        elif operation == "Drop Duplicates":
+            self._record_apply({"kind": "replay", "step": step, "columns": [column], "params": {}})
+        elif operation not in LOCAL_OPERATIONS:
+            raise Exception(f"{operation} is not supported by the local engine")
+        else:
+            print(f"error: Operation not defined in Column_Operations function for {step['column']} column: {operation} \n")
+
+    def run(self, operations):
+        for index, step in enumerate(operations):
+            if step["operation"] == "Exclude from All Columns list":
+                self.all_columns.remove(step['column'])
+                if step['column'] in self.numeric_columns:
+                    self.numeric_columns.remove(step['column'])
+                continue
+
+            step_lineage = get_step_lineage(step, self.numeric_columns, self.all_columns)
+            record = {"index": index, "column": step["column"], "operation": step["operation"], "status": "applied"}
+            self.step_records.append(record)
+            with self._measure(record):
+                try:
+                    if step["column"] == "All Columns":
+                        self._all_columns_step(step)
+                    else:
+                        self._column_step(step)
+                except LocalEngineDataError:
+                    raise
+                except Exception as e:
+                    print_step_error(step, e)
+                    record["status"] = "failed"
+                    record["error"] = str(e)
+                    continue
+            self.rows_changed = self.rows_changed or step_lineage[0]
+            self.modified_columns |= step_lineage[1]
+
+        print(f"Local preprocessing: {len(operations)} steps, {self.num_aggregations} column scans")
+        return self.df
+
+    def get_column_state(self):
+        return {"allColumns": list(self.all_columns), "numericColumns": list(self.numeric_columns)}
+
+    def get_recipe(self):
+        """Same format as PreprocessingPlanner.get_recipe, applied by spark like any other recipe"""
+        return {
+            "recipeVersion": RECIPE_FORMAT_VERSION,
+            "inputColumns": self.input_columns,
+            "outputColumns": self.df.columns,
+            "steps": list(self._recipe),
+        }
+
+    def get_report(self):
+        """Per step report (rows are always known, the df is in memory) and the phases after the steps"""
+        return {
+            "numSteps": len(self.step_records),
+            "numAggregations": self.num_aggregations,
+            "numBarriers": 0,
+            "numCheckpoints": 0,
+            "steps": self.step_records,
+            "phases": self.phase_records,
+        }
+
+
+class LocalEngine:
+    """
+    create_new_dataset and preprocess_data of SparkSessionManager (same arguments and result, with "engine": "local")
+    run in this process, for the jobs select_engine gives to the local engine.
+    """
+    async def create_new_dataset(self, filename, filetype, overview_mode="exact", relative_error=0.05, with_overview=True, layout=None, read_options=None):
+        """Same as SparkSessionManager.create_new_dataset, the overview is computed on the df in memory"""
+        print(f"in local create_new_dataset {filename} is {filetype}")
+        try:
+            with local_workspace() as workspace:
+                df = read_hdfs_input(f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}", filetype, workspace)
+                write_filename = get_raw_write_filename(filename, filetype)
+                written_layout = write_hdfs_dataset(df, f"{HDFS_RAW_DATASETS_DIR}/{write_filename}", workspace, layout)
+                print(f"Successfully created new dataset in HDFS (local engine): {HDFS_RAW_DATASETS_DIR}/{write_filename}")
+
+                if not with_overview:
+                    return {"filename": write_filename, "layout": written_layout, "engine": "local"}
+
+                dataset_overview = compute_local_overview(df, overview_mode, relative_error)
+                fingerprint = hdfs_client.get_fingerprint(f"{HDFS_RAW_DATASETS_DIR}/{write_filename}")
+                overview_stats_cache.put_overview(fingerprint, dataset_overview)
+                dataset_overview["fingerprint"] = fingerprint
+                dataset_overview["filename"] = write_filename
+                dataset_overview["layout"] = written_layout
+                dataset_overview["engine"] = "local"
+                if read_options:
+                    dataset_overview["readOptions"] = read_options
+                return dataset_overview
+        except Exception as e:
+            print(f"Error creating new dataset (local engine): {e}")
+            raise e
+
+    async def preprocess_data(self, directory: str, filename: str, operations: list, overview_mode: str = "exact", relative_error: float = 0.05, input_overview: dict = None, column_state: dict = None, layout: dict = None):
+        """
+        Same as SparkSessionManager.preprocess_data, the steps run one by one on the df in memory (see
+        LocalPreprocessingPlanner) and every column of the output is profiled (input_overview is not needed)
+        """
+        t1 = time.time()
+        try:
+            with local_workspace() as workspace:
+                print(f"Starting local preprocessing for {directory}/{filename}...")
+                df = read_hdfs_input(f"{directory}/{filename}", "parquet", workspace)
+                planner = LocalPreprocessingPlanner(df, column_state=column_state)
+                df = planner.run(operations)
+
+                newfilename = f"{filename}_{uuid.uuid4().hex}.parquet"
+                with planner.measure("Write parquet"):
+                    written_layout = write_hdfs_dataset(df, f"{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}", workspace, layout)
+                with planner.measure("Overview"):
+                    overview = compute_local_overview(df, overview_mode, relative_error)
+
+                fingerprint = hdfs_client.get_fingerprint(f"{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}")
+                overview_stats_cache.put_overview(fingerprint, overview)
+                overview["fingerprint"] = fingerprint
+                overview["filename"] = newfilename
+                overview["layout"] = written_layout
+                overview["engine"] = "local"
+                overview["processingReport"] = planner.get_report()
+                overview["processingReport"]["totalTime"] = round(time.time() - t1, 3)
+                print(f"Preprocessed dataset saved to: {HDFS_PROCESSED_DATASETS_DIR}/{newfilename} (local engine) and time taken: ", overview["processingReport"]["totalTime"])
+
+                overview["recipe"] = planner.get_recipe()
+                overview["columnState"] = planner.get_column_state()
+                return overview
+        except Exception as e:
+            print(f"Error preprocessing dataset (local engine): {e}")
+            raise e
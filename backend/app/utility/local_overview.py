@@ -0,0 +1,191 @@
+from utility.overview_common import OVERVIEW_MODES, QUARTILE_PROBS, TOP_CATEGORIES, get_column_kind, infer_array_shape, truncate_category
+import math
+
+try:
+    import polars as pl
+except ImportError:  # optional, only the local engine needs it (see local_engine.py)
+    pl = None
+
+
+"""
+    Overview of a polars df (local engine, see local_engine.py) with the same structure as compute_overview of
+    overview_helper_functions.py, so a dataset gets the same datastats whichever engine created it:
+        - "type" is the spark type the written parquet is read back as (get_spark_type)
+        - null is a distinct value in the unique counts and top categories, NaN is not a null
+        - stddev is the sample standard deviation (null for less than 2 values), array value std is the population one
+        - histograms are the same 10 equal width bins (the max value goes to the last bin, nulls and NaNs skipped)
+        - min/max of float columns follow spark (NaN is larger than any value)
+    The data is in memory, so every stat is exact: quartiles and medians are the value percentile_approx returns with
+    no error (lower nearest rank), unique counts are exact in approx mode too, and "approximate" is empty.
+"""
+
+def get_spark_type(dtype):
+    """(str of the spark type, simpleString) the polars dtype is read back as by spark from parquet"""
+    if isinstance(dtype, pl.List) or isinstance(dtype, pl.Array):
+        name, simple = get_spark_type(dtype.inner)
+        return f"ArrayType({name}, True)", f"array<{simple}>"
+    if isinstance(dtype, pl.Decimal):
+        return f"DecimalType({dtype.precision},{dtype.scale})", f"decimal({dtype.precision},{dtype.scale})"
+    if isinstance(dtype, pl.Datetime):
+        # timestamps with a time zone are stored adjusted to UTC (spark TimestampType), naive ones as timestamp_ntz
+        return ("TimestampType()", "timestamp") if dtype.time_zone else ("TimestampNTZType()", "timestamp_ntz")
+    for polars_type, name, simple in [
+        (pl.Int8, "ByteType()", "tinyint"), (pl.Int16, "ShortType()", "smallint"), (pl.Int32, "IntegerType()", "int"),
+        (pl.Int64, "LongType()", "bigint"), (pl.UInt8, "ShortType()", "smallint"), (pl.UInt16, "IntegerType()", "int"),
+        (pl.UInt32, "LongType()", "bigint"), (pl.UInt64, "DecimalType(20,0)", "decimal(20,0)"),
+        (pl.Float32, "FloatType()", "float"), (pl.Float64, "DoubleType()", "double"), (pl.String, "StringType()", "string"),
+        (pl.Boolean, "BooleanType()", "boolean"), (pl.Date, "DateType()", "date"), (pl.Binary, "BinaryType()", "binary"),
+    ]:
+        if dtype == polars_type:
+            return name, simple
+    raise ValueError(f"No spark type for polars type {dtype}")
+
+def get_lower_quantile(sorted_values, p):
+    """Value of rank ceil(p * n) of sorted values (what percentile_approx returns without error), None if empty"""
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[max(math.ceil(p * len(sorted_values)) - 1, 0)]
+
+def get_spark_min_max(series):
+    """(min, max) of a column as spark computes them, NaN is larger than any other value"""
+    values = series.drop_nulls()
+    if len(values) == 0:
+        return None, None
+    if values.dtype.is_float():
+        non_nan = values.drop_nans()
+        if len(non_nan) < len(values):
+            return (non_nan.min() if len(non_nan) else float("nan")), float("nan")
+    return values.min(), values.max()
+
+def get_sample_stddev(series):
+    """Sample standard deviation (spark stddev), None for less than 2 values"""
+    return series.std(ddof=1) if series.drop_nulls().len() > 1 else None
+
+def compute_local_histogram(series, min_val, max_val, num_bins=10):
+    """Same bins and counts as compute_histograms (overview_helper_functions.py) of one column"""
+    values = series.cast(pl.Float64).drop_nulls().drop_nans()
+    bin_width = (max_val - min_val) / num_bins
+    buckets = ((values - min_val) / bin_width).floor().cast(pl.Int64).clip(upper_bound=num_bins - 1)
+    counts = [0] * num_bins
+    for bucket, count in buckets.value_counts().iter_rows():
+        counts[bucket] = count
+    return {"bins": [min_val + i * bin_width for i in range(num_bins + 1)], "counts": counts}
+
+def get_array_leaf_dtype(dtype):
+    """(nesting depth, leaf dtype) of a (nested) list dtype"""
+    depth = 0
+    while isinstance(dtype, (pl.List, pl.Array)):
+        depth += 1
+        dtype = dtype.inner
+    return depth, dtype
+
+def compute_local_array_stats(series):
+    """Shape, LengthStats and value stats of an array column, same keys as compute_overview"""
+    non_null = series.drop_nulls()
+    if isinstance(non_null.dtype, pl.Array):
+        non_null = non_null.cast(pl.List(non_null.dtype.inner))
+    sample = non_null[0].to_list() if len(non_null) else None
+    lengths = non_null.list.len()
+    stats = {
+        "Shape": infer_array_shape(sample),
+        "LengthStats": {
+            "min": int(lengths.min() or 0),
+            "max": int(lengths.max() or 0),
+            "mean": float(lengths.mean() or 0),
+            "std": float(get_sample_stddev(lengths) or 0)
+        }
+    }
+
+    depth, leaf_dtype = get_array_leaf_dtype(series.dtype)
+    if sample is None:
+        stats["valueStats"] = "Not detected"
+        return stats
+    if not leaf_dtype.is_numeric():
+        stats["valueStats"] = "Not numeric"
+        return stats
+
+    values = non_null
+    for _ in range(depth):
+        values = values.explode()
+    values = values.drop_nulls().cast(pl.Float64)
+    if len(values) == 0:
+        stats["valueStats"] = None
+        return stats
+    min_val, max_val = get_spark_min_max(values)
+    stats["sampleSize"] = f"{len(values)} values (full column)"
+    stats["valueCount"] = len(values)
+    stats["approximate"] = []
+    stats["valueStats"] = {
+        "min": min_val,
+        "max": max_val,
+        "mean": values.mean(),
+        "std": values.std(ddof=0),
+        "median": get_lower_quantile(values.sort(), 0.5),
+        "sparsity": (values == 0).mean()  # Fraction of zeros
+    }
+    return stats
+
+def compute_local_overview(df, mode="exact", relative_error=0.05):
+    """
+    Overview of a polars df, same structure as compute_overview (overviewMode and relativeError are kept as
+    requested, the stats themselves are exact)
+    """
+    if mode not in OVERVIEW_MODES:
+        raise ValueError(f"Invalid overview mode: {mode}, supported modes: {OVERVIEW_MODES}")
+
+    num_rows = df.height
+    column_stats = []
+    for name, dtype in df.schema.items():
+        try:
+            series = df.get_column(name)
+            type_name = get_spark_type(dtype)[0]
+            kind = get_column_kind(type_name)
+            stats = {"name": name, "type": type_name, "entries": num_rows, "nullCount": series.null_count()}
+
+            if kind == "numeric":
+                min_val, max_val = get_spark_min_max(series)
+                stats.update({
+                    "mean": series.mean(),
+                    "stddev": get_sample_stddev(series),
+                    "min": min_val,
+                    "max": max_val,
+                    "uniqueCount": series.n_unique()
+                })
+                stats["approximate"] = []
+
+                sorted_values = series.drop_nulls().cast(pl.Float64).sort()
+                if len(sorted_values):
+                    quantiles = [get_lower_quantile(sorted_values, p) for p in QUARTILE_PROBS]
+                    stats["quartiles"] = {
+                        "Q1": quantiles[0],
+                        "median": quantiles[1],
+                        "Q3": quantiles[2],
+                        "IQR": quantiles[2] - quantiles[0]
+                    }
+
+                if min_val is not None and max_val is not None and max_val > min_val:
+                    stats["histogram"] = compute_local_histogram(series, min_val, max_val)
+
+            elif kind == "string":
+                stats["uniqueCount"] = series.n_unique()
+                stats["approximate"] = []
+                frequencies = series.value_counts(sort=True).head(TOP_CATEGORIES)
+                stats["topCategories"] = [
+                    {"value": truncate_category(value), "count": count} for value, count in frequencies.iter_rows()
+                ]
+
+            elif kind == "array":
+                stats.update(compute_local_array_stats(series))
+
+            column_stats.append(stats)
+        except Exception as e:
+            print(f"Error processing column {name}: {e}")
+            continue
+
+    return {
+        "numRows": num_rows,
+        "numColumns": len(df.columns),
+        "overviewMode": mode,
+        "relativeError": relative_error,
+        "columnStats": column_stats
+    }
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import threading
+import copy
+import os
+
+load_dotenv()
+
+OVERVIEW_CACHE_MAX_COLUMNS = int(os.getenv("OVERVIEW_CACHE_MAX_COLUMNS", 5000))
+
+"""
+    Per column statistics cache of dataset overviews.
+    An entry is keyed by the fingerprint of the profiled data (see HDFSServiceManager.get_fingerprint), the column name,
+    and the overview mode, so the stats of a column are reused only for the same physical data profiled the same way.
+    Preprocessing uses it for columns whose values provably did not change (see get_step_lineage).
+"""
+
+class OverviewStatsCache:
+    """
+    Thread-safe LRU cache of column stats, bounded by number of columns (least recently used column is evicted first).
+    """
+    def __init__(self, max_columns=OVERVIEW_CACHE_MAX_COLUMNS):
+        self.max_columns = max_columns
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(fingerprint, column, mode, relative_error):
+        return (fingerprint, column, mode, relative_error)
+
+    @staticmethod
+    def is_cacheable(overview):
+        """Only full overviews are cached (not sampled previews or footer overviews, they don't have all the stats)"""
+        return (
+            isinstance(overview, dict) and not overview.get("preview")
+            and overview.get("overviewMode") in ("exact", "approx") and "columnStats" in overview
+        )
+
+    def put_overview(self, fingerprint, overview):
+        if not fingerprint or not self.is_cacheable(overview):
+            return
+        with self._lock:
+            for stats in overview["columnStats"]:
+                key = self._key(fingerprint, stats["name"], overview["overviewMode"], overview["relativeError"])
+                self._entries[key] = (copy.deepcopy(stats), overview["numRows"])
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_columns:
+                self._entries.popitem(last=False)
+
+    def get_column(self, fingerprint, column, column_type, mode, relative_error):
+        """Returns (column stats, number of rows) or None, stats are only returned if the column type is also the same"""
+        with self._lock:
+            key = self._key(fingerprint, column, mode, relative_error)
+            entry = self._entries.get(key)
+            if entry is None or entry[0]["type"] != column_type:
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry[0]), entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+overview_stats_cache = OverviewStatsCache()
@@ -0,0 +1,37 @@
+"""
+    Constants and plain python helpers of the overview shared by the spark overview (overview_helper_functions.py)
+    and the local engine overview (local_overview.py), kept free of pyspark so the local engine can be used without it.
+"""
+
+NUMERIC_TYPES = ["IntegerType()", "DoubleType()", "FloatType()", "LongType()"]
+# exact: unique counts with a shuffle over all values, approx: HyperLogLog unique counts (no shuffle for numeric columns)
+OVERVIEW_MODES = ["exact", "approx"]
+# approx_count_distinct fails for an rsd above ~0.39, and percentile_approx accuracy int(1 / relative_error) is 1 above 0.5
+MAX_RELATIVE_ERROR = 0.2
+QUARTILE_PROBS = [0.25, 0.5, 0.75]
+TOP_CATEGORIES = 10
+
+def get_column_kind(data_type) -> str:
+    """Returns one of 'numeric', 'string', 'array' or 'other' for a spark datatype"""
+    type_name = str(data_type)
+    if type_name in NUMERIC_TYPES:
+        return "numeric"
+    elif "StringType" in type_name:
+        return "string"
+    elif "ArrayType" in type_name:
+        return "array"
+    return "other"
+
+def infer_array_shape(arr):
+    """Shape of a (nested) list, following the first element at every level"""
+    shape = []
+    temp = arr
+    while isinstance(temp, list):
+        shape.append(len(temp))
+        if len(temp) == 0:
+            break
+        temp = temp[0] if isinstance(temp[0], list) else None
+    return tuple(shape) if shape else None
+
+def truncate_category(value):
+    return value[:50] + "..." if isinstance(value, str) and len(value) > 50 else value
@@ -0,0 +1,803 @@
+from pyspark.sql import functions as F
+from pyspark.sql.types import ArrayType, NumericType
+from pyspark.sql.window import Window
+from pyspark.sql.pandas.types import from_arrow_type
+from utility.overview_common import (
+    NUMERIC_TYPES, OVERVIEW_MODES, MAX_RELATIVE_ERROR, QUARTILE_PROBS, TOP_CATEGORIES, get_column_kind, infer_array_shape, truncate_category
+)
+from statistics import NormalDist
+import math
+
+
+"""
+    Helper functions to build the dataset overview (the "columnStats" structure stored in datastats).
+    All statistics of all columns are computed in a small fixed number of passes over the data, so the
+    cost of profiling does not grow with number of jobs per column:
+        pass 1: one fused aggregation for counts, nulls, moments, min/max, quartiles and array lengths
+        pass 2: one shuffle over (column, value) pairs for unique counts and top categories
+        pass 3: bucketized histograms of numeric columns (needs min/max of pass 1), one job
+        pass 4: value statistics of numeric array columns over exploded values, one job
+"""
+
+def stat_alias(idx: int, stat: str) -> str:
+    """Alias of a statistic in the fused aggregation (column names can't be used as they may contain any character)"""
+    return f"c{idx}__{stat}"
+
+def build_scalar_aggregations(columns, mode="exact", relative_error=0.05):
+    """
+    Builds the aggregate expressions of pass 1 for all the columns.
+
+    :param columns: list of (idx, name, kind) tuples
+    :param mode: one of OVERVIEW_MODES, in approx mode HyperLogLog unique counts are also added here
+    :param relative_error: relative error of the quartiles (same meaning as in approxQuantile) and of the HLL counts
+    :return: list of aggregate expressions, to be used in a single df.agg(...)
+    """
+    accuracy = int(1 / relative_error) if relative_error > 0 else 1000000
+    aggregations = [F.count(F.lit(1)).alias("__rows")]
+    for idx, name, kind in columns:
+        column_expr = F.col(f"`{name}`")
+        aggregations.append(F.sum(F.when(column_expr.isNull(), 1).otherwise(0)).alias(stat_alias(idx, "nullCount")))
+        if mode == "approx" and kind in ("numeric", "string"):
+            aggregations.append(F.approx_count_distinct(column_expr, rsd=relative_error).alias(stat_alias(idx, "uniqueCount")))
+
+        if kind == "numeric":
+            aggregations += [
+                F.mean(column_expr).alias(stat_alias(idx, "mean")),
+                F.stddev(column_expr).alias(stat_alias(idx, "stddev")),
+                F.min(column_expr).alias(stat_alias(idx, "min")),
+                F.max(column_expr).alias(stat_alias(idx, "max")),
+                F.percentile_approx(column_expr.cast("double"), QUARTILE_PROBS, accuracy).alias(stat_alias(idx, "quartiles")),
+            ]
+
+        elif kind == "array":
+            # size(null) is -1 in spark, so null rows are kept out of the length stats
+            length_expr = F.when(column_expr.isNotNull(), F.size(column_expr))
+            aggregations += [
+                F.first(column_expr, ignorenulls=True).alias(stat_alias(idx, "sample")),
+                F.min(length_expr).alias(stat_alias(idx, "lenMin")),
+                F.max(length_expr).alias(stat_alias(idx, "lenMax")),
+                F.mean(length_expr).alias(stat_alias(idx, "lenMean")),
+                F.stddev(length_expr).alias(stat_alias(idx, "lenStd")),
+            ]
+    return aggregations
+
+def compute_value_frequencies(df, columns, top_k=TOP_CATEGORIES):
+    """
+    Pass 2: unique counts and top categories of many columns in one shuffle.
+    Every row is exploded into (column idx, value) pairs, which are counted once, and then summarized per column.
+    Null is counted as a distinct value (same as df.select(col).distinct().count()).
+
+    :param columns: list of (idx, name) tuples
+    :return: {idx: {"uniqueCount": int, "topCategories": [(value, count), ...]}}
+    """
+    if not columns:
+        return {}
+
+    pairs = F.explode(F.array(*[
+        F.struct(F.lit(idx).alias("idx"), F.col(f"`{name}`").cast("string").alias("value"))
+        for idx, name in columns
+    ]))
+    frequencies = df.select(pairs.alias("pair")).select("pair.idx", "pair.value").groupBy("idx", "value").count()
+
+    rank_window = Window.partitionBy("idx").orderBy(F.col("count").desc())
+    rows = (
+        frequencies
+        .withColumn("rank", F.row_number().over(rank_window))
+        .groupBy("idx")
+        .agg(
+            F.count(F.lit(1)).alias("uniqueCount"),
+            F.collect_list(F.when(F.col("rank") <= top_k, F.struct("rank", "value", "count"))).alias("top")
+        )
+        .collect()
+    )
+
+    result = {}
+    for row in rows:
+        top = sorted(row["top"], key=lambda item: item["rank"])
+        result[row["idx"]] = {
+            "uniqueCount": row["uniqueCount"],
+            "topCategories": [(item["value"], item["count"]) for item in top]
+        }
+    return result
+
+def compute_histograms(df, columns, num_bins=10):
+    """
+    Equal width histograms (between min and max) of many numeric columns in one job.
+    Every value is bucketized in the JVM, and (column idx, bucket) pairs are counted with a single groupBy,
+    the max value goes to the last bin (same as rdd.histogram), nulls and NaNs are skipped.
+
+    :param columns: list of (idx, name, min, max) tuples, with max > min
+    :return: {idx: {"bins": [...], "counts": [...]}}
+    """
+    if not columns:
+        return {}
+
+    pairs = []
+    for idx, name, min_val, max_val in columns:
+        value = F.col(f"`{name}`").cast("double")
+        bin_width = (max_val - min_val) / num_bins
+        bucket = F.least(F.floor((value - F.lit(min_val)) / F.lit(bin_width)).cast("int"), F.lit(num_bins - 1))
+        pairs.append(F.struct(F.lit(idx).alias("idx"), F.when(value.isNotNull() & ~F.isnan(value), bucket).alias("bucket")))
+
+    rows = (
+        df.select(F.explode(F.array(*pairs)).alias("pair"))
+        .select("pair.idx", "pair.bucket")
+        .where(F.col("bucket").isNotNull())
+        .groupBy("idx", "bucket")
+        .count()
+        .collect()
+    )
+
+    histograms = {}
+    for idx, name, min_val, max_val in columns:
+        bin_width = (max_val - min_val) / num_bins
+        histograms[idx] = {
+            "bins": [min_val + i * bin_width for i in range(num_bins + 1)],
+            "counts": [0] * num_bins
+        }
+    for row in rows:
+        histograms[row["idx"]]["counts"][row["bucket"]] = row["count"]
+    return histograms
+
+def get_array_leaf(data_type):
+    """Returns (nesting depth, leaf datatype) of a (nested) ArrayType"""
+    depth = 0
+    while isinstance(data_type, ArrayType):
+        depth += 1
+        data_type = data_type.elementType
+    return depth, data_type
+
+def tag_values_with_idx(idx):
+    """Lambda for F.transform (a default argument can't be used to bind idx, spark counts it as a lambda parameter)"""
+    return lambda v: F.struct(F.lit(idx).alias("idx"), v.cast("double").alias("value"))
+
+def compute_array_value_stats(df, columns, relative_error=0.05):
+    """
+    Value level statistics of numeric array columns over the whole column, in one job.
+    Nested arrays are flattened, and all values of all columns are exploded into (column idx, value) pairs
+    which are aggregated per column, so nothing is collected or pickled through python workers.
+
+    :param columns: list of (idx, name, depth) tuples, depth is the nesting depth of the array
+    :return: {idx: {"count", "min", "max", "mean", "std", "median", "sparsity"}}
+    """
+    if not columns:
+        return {}
+
+    accuracy = int(1 / relative_error) if relative_error > 0 else 1000000
+    pair_type = "array<struct<idx:int,value:double>>"
+    per_column_pairs = []
+    for idx, name, depth in columns:
+        values = F.col(f"`{name}`")
+        for _ in range(depth - 1):
+            values = F.flatten(values)
+        pairs = F.transform(values, tag_values_with_idx(idx))
+        # concat returns null if any input is null, so null rows contribute an empty array
+        per_column_pairs.append(F.coalesce(pairs, F.array().cast(pair_type)))
+
+    value = F.col("value")
+    rows = (
+        df.select(F.explode(F.concat(*per_column_pairs)).alias("pair"))
+        .select("pair.idx", "pair.value")
+        .groupBy("idx")
+        .agg(
+            F.count(value).alias("count"),
+            F.min(value).alias("min"),
+            F.max(value).alias("max"),
+            F.mean(value).alias("mean"),
+            F.stddev_pop(value).alias("std"),
+            F.percentile_approx(value, 0.5, accuracy).alias("median"),
+            F.mean(F.when(value.isNotNull(), F.when(value == 0, 1.0).otherwise(0.0))).alias("sparsity")
+        )
+        .collect()
+    )
+    return {row["idx"]: row.asDict() for row in rows}
+
+def get_unique_count(summary, frequencies, idx, mode):
+    if mode == "approx":
+        # HLL ignores nulls, whereas exact distinct count counts null as a value
+        return summary[stat_alias(idx, "uniqueCount")] + (1 if summary[stat_alias(idx, "nullCount")] else 0)
+    return frequencies.get(idx, {}).get("uniqueCount", 0)
+
+def compute_overview(df, mode="exact", relative_error=0.05):
+    """
+    Get an overview of the dataset given pyspark dataframe.
+    Returns the same structure as before: {"numRows", "numColumns", "columnStats": [...]},
+    see the sample at the bottom of spark_services.py
+
+    mode="approx" uses HyperLogLog unique counts (with relative_error as relative standard deviation)
+    instead of the exact count, quartiles are always sketch based (percentile_approx with relative_error).
+    Every column records the figures which are approximate in "approximate".
+    """
+    if mode not in OVERVIEW_MODES:
+        raise ValueError(f"Invalid overview mode: {mode}, supported modes: {OVERVIEW_MODES}")
+    if not 0 < relative_error <= MAX_RELATIVE_ERROR:
+        raise ValueError(f"Invalid relative error: {relative_error}, it should be in (0, {MAX_RELATIVE_ERROR}]")
+
+    columns = [(idx, field.name, get_column_kind(field.dataType)) for idx, field in enumerate(df.schema.fields)]
+
+    # pass 1 (single job for all columns)
+    summary = df.agg(*build_scalar_aggregations(columns, mode, relative_error)).first()
+    num_rows = summary["__rows"]
+
+    # pass 2 (single shuffle for all string columns, and numeric columns in exact mode)
+    frequency_kinds = ("numeric", "string") if mode == "exact" else ("string",)
+    frequencies = compute_value_frequencies(df, [(idx, name) for idx, name, kind in columns if kind in frequency_kinds])
+
+    # pass 3 (single job for histograms of all numeric columns with a non empty range)
+    histogram_columns = []
+    for idx, name, kind in columns:
+        if kind != "numeric":
+            continue
+        min_val, max_val = summary[stat_alias(idx, "min")], summary[stat_alias(idx, "max")]
+        if min_val is not None and max_val is not None and max_val > min_val:
+            histogram_columns.append((idx, name, min_val, max_val))
+    histograms = compute_histograms(df, histogram_columns)
+
+    # pass 4 (single job for value stats of all numeric array columns that have at least one non null entry)
+    array_columns = {}
+    for idx, name, kind in columns:
+        if kind == "array":
+            depth, leaf_type = get_array_leaf(df.schema[name].dataType)
+            if isinstance(leaf_type, NumericType):
+                array_columns[idx] = (idx, name, depth)
+    try:
+        value_stats = compute_array_value_stats(df, [
+            column for idx, column in array_columns.items() if summary[stat_alias(idx, "sample")] is not None
+        ], relative_error)
+    except Exception as e:
+        print(f"Error computing array value stats: {e}")
+        value_stats = {}
+
+    column_stats = []
+    for idx, name, kind in columns:
+        try:
+            stats = {"name": name, "type": str(df.schema[name].dataType), "entries": num_rows}
+            stats["nullCount"] = summary[stat_alias(idx, "nullCount")]
+
+            if kind == "numeric":
+                stats.update({
+                    "mean": summary[stat_alias(idx, "mean")],
+                    "stddev": summary[stat_alias(idx, "stddev")],
+                    "min": summary[stat_alias(idx, "min")],
+                    "max": summary[stat_alias(idx, "max")],
+                    "uniqueCount": get_unique_count(summary, frequencies, idx, mode)
+                })
+                stats["approximate"] = ["uniqueCount", "quartiles"] if mode == "approx" else ["quartiles"]
+
+                quantiles = summary[stat_alias(idx, "quartiles")]
+                if quantiles:
+                    stats["quartiles"] = {
+                        "Q1": quantiles[0],
+                        "median": quantiles[1],
+                        "Q3": quantiles[2],
+                        "IQR": quantiles[2] - quantiles[0]
+                    }
+
+                if idx in histograms:
+                    stats["histogram"] = histograms[idx]
+
+            elif kind == "string":
+                stats["uniqueCount"] = get_unique_count(summary, frequencies, idx, mode)
+                stats["approximate"] = ["uniqueCount"] if mode == "approx" else []
+                stats["topCategories"] = [
+                    {"value": truncate_category(value), "count": count}
+                    for value, count in frequencies.get(idx, {}).get("topCategories", [])
+                ]
+
+            elif kind == "array":
+                sample = summary[stat_alias(idx, "sample")]
+                stats["Shape"] = infer_array_shape(sample)
+                stats["LengthStats"] = {
+                    "min": int(summary[stat_alias(idx, "lenMin")] or 0),
+                    "max": int(summary[stat_alias(idx, "lenMax")] or 0),
+                    "mean": float(summary[stat_alias(idx, "lenMean")] or 0),
+                    "std": float(summary[stat_alias(idx, "lenStd")] or 0)
+                }
+
+                if sample is None:
+                    stats["valueStats"] = "Not detected"
+                elif idx not in array_columns:
+                    stats["valueStats"] = "Not numeric"
+                elif idx in value_stats:
+                    values = value_stats[idx]
+                    stats["sampleSize"] = f"{values['count']} values (full column)"
+                    stats["valueCount"] = values["count"]
+                    stats["approximate"] = ["valueStats.median"]
+                    stats["valueStats"] = {
+                        "min": values["min"],
+                        "max": values["max"],
+                        "mean": values["mean"],
+                        "std": values["std"],
+                        "median": values["median"],
+                        "sparsity": values["sparsity"]  # Fraction of zeros
+                    }
+                else:
+                    stats["valueStats"] = None
+
+            column_stats.append(stats)
+        except Exception as e:
+            print(f"Error processing column {name}: {e}")
+            continue
+
+    return {
+        "numRows": num_rows,
+        "numColumns": len(df.columns),
+        "overviewMode": mode,
+        "relativeError": relative_error,
+        "columnStats": column_stats
+    }
+
+
+def compute_preview_stats(df, relative_error=0.05):
+    """
+    Quick approximate stats of a (small) preview df in a single pass (pass 1 only, HLL unique counts),
+    used by the preprocessing preview instead of the full overview.
+    """
+    columns = [(idx, field.name, get_column_kind(field.dataType)) for idx, field in enumerate(df.schema.fields)]
+    summary = df.agg(*build_scalar_aggregations(columns, "approx", relative_error)).first()
+
+    column_stats = []
+    for idx, name, kind in columns:
+        stats = {"name": name, "type": str(df.schema[name].dataType), "nullCount": summary[stat_alias(idx, "nullCount")]}
+        if kind in ("numeric", "string"):
+            stats["uniqueCount"] = get_unique_count(summary, {}, idx, "approx")
+        if kind == "numeric":
+            for stat in ["mean", "stddev", "min", "max"]:
+                stats[stat] = summary[stat_alias(idx, stat)]
+            quantiles = summary[stat_alias(idx, "quartiles")]
+            if quantiles:
+                stats["quartiles"] = {"Q1": quantiles[0], "median": quantiles[1], "Q3": quantiles[2], "IQR": quantiles[2] - quantiles[0]}
+        column_stats.append(stats)
+
+    return {
+        "numRows": summary["__rows"],
+        "numColumns": len(df.columns),
+        "overviewMode": "approx",
+        "relativeError": relative_error,
+        "columnStats": column_stats
+    }
+
+def get_quantile_bound(stats, quantile_name, p, z):
+    """
+    Half width of the confidence interval of a sample quantile: z * sqrt(p(1-p)/n) / density(q),
+    the density at q is estimated from the (sample) histogram bin containing q.
+    """
+    histogram = stats.get("histogram")
+    value = stats.get("quartiles", {}).get(quantile_name)
+    if not histogram or value is None:
+        return None
+    n = sum(histogram["counts"])
+    bins = histogram["bins"]
+    for i, count in enumerate(histogram["counts"]):
+        if bins[i] <= value <= bins[i + 1]:
+            density = count / (n * (bins[i + 1] - bins[i])) if n and count else 0
+            return z * math.sqrt(p * (1 - p) / n) / density if density else None
+    return None
+
+def compute_file_totals(df, file_column):
+    """
+    Per file totals of a sample of whole files (file_column: input_file_name() of the rows), one job:
+    [{"rows", "nulls": {column: count}, "counts": {numeric column: non null count}, "sums": {numeric column: sum}}]
+    """
+    columns = [(idx, field.name, get_column_kind(field.dataType)) for idx, field in enumerate(df.schema.fields) if field.name != file_column]
+    aggregations = [F.count(F.lit(1)).alias("__rows")]
+    for idx, name, kind in columns:
+        c = F.col(f"`{name}`")
+        aggregations.append(F.count(F.when(c.isNull(), 1)).alias(stat_alias(idx, "nullCount")))
+        if kind == "numeric":
+            aggregations += [F.count(c).alias(stat_alias(idx, "count")), F.sum(c.cast("double")).alias(stat_alias(idx, "sum"))]
+    totals = []
+    for row in df.groupBy(file_column).agg(*aggregations).collect():
+        numeric = [(idx, name) for idx, name, kind in columns if kind == "numeric"]
+        totals.append({
+            "rows": row["__rows"],
+            "nulls": {name: row[stat_alias(idx, "nullCount")] for idx, name, _ in columns},
+            "counts": {name: row[stat_alias(idx, "count")] for idx, name in numeric},
+            "sums": {name: row[stat_alias(idx, "sum")] for idx, name in numeric},
+        })
+    return totals
+
+def get_cluster_total_bound(values, fraction, z):
+    """
+    Half width of the confidence interval of the total of a value over all the files, from its values in a simple
+    random sample of the files (fraction of the files), None for a single sampled file
+    """
+    m = len(values)
+    if m < 2:
+        return None
+    mean = sum(values) / m
+    variance = sum((v - mean) ** 2 for v in values) / (m - 1)
+    return z * (m / fraction) * math.sqrt((1 - fraction) * variance / m)
+
+def get_cluster_mean_bound(counts, sums, mean, fraction, z):
+    """Half width of the confidence interval of a mean (ratio of the sums to the counts) from the sampled files"""
+    m = len(counts)
+    if m < 2 or mean is None or not math.isfinite(mean) or any(s is None for s in sums) or not sum(counts):
+        return None
+    residuals = [s - mean * c for c, s in zip(counts, sums)]
+    variance = sum(r ** 2 for r in residuals) / (m - 1)
+    return z * math.sqrt((1 - fraction) * variance / m) / (sum(counts) / m)
+
+def attach_sample_bounds(overview, fraction, confidence=0.95, file_totals=None):
+    """
+    Scales an overview computed on a sample of rows (taken with sampling fraction) to the full dataset,
+    and attaches confidence bounds to every column as "errorBounds".
+    Numeric bounds are half widths of the confidence interval (estimate +/- bound), they assume the sample
+    is a bernoulli sample of rows. A sample of whole files (file_totals of compute_file_totals) is a cluster sample,
+    the rows of a file are correlated: the bounds of the row count, null counts and means are computed between the
+    files instead, the other stats get no numeric bound.
+    Min, max and unique count of a sample can only bound the true value from one side, which is recorded as text.
+    """
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    n = overview["numRows"]
+    estimated_rows = round(n / fraction)
+
+    overview["numRows"] = estimated_rows
+    overview["sample"] = {
+        "fraction": fraction,
+        "sampleRows": n,
+        "confidence": confidence,
+        "numRowsBound": z * math.sqrt(n * (1 - fraction)) / fraction
+    }
+    if file_totals is not None:
+        overview["sample"]["sampledFiles"] = len(file_totals)
+        overview["sample"]["numRowsBound"] = get_cluster_total_bound([t["rows"] for t in file_totals], fraction, z)
+
+    for stats in overview["columnStats"]:
+        bounds = {}
+        stats["entries"] = estimated_rows
+        sample_nulls = stats["nullCount"]
+        non_null = n - sample_nulls
+
+        if n:
+            p = sample_nulls / n
+            stats["nullCount"] = round(p * estimated_rows)
+            bounds["nullCount"] = z * math.sqrt(p * (1 - p) / n) * estimated_rows
+
+        if file_totals is not None:
+            name = stats["name"]
+            bounds["nullCount"] = get_cluster_total_bound([t["nulls"][name] for t in file_totals], fraction, z)
+            if name in file_totals[0]["counts"]:
+                bounds["mean"] = get_cluster_mean_bound(
+                    [t["counts"][name] for t in file_totals], [t["sums"][name] for t in file_totals], stats.get("mean"), fraction, z
+                )
+        elif stats.get("mean") is not None and stats.get("stddev") is not None and non_null > 1:
+            bounds["mean"] = z * stats["stddev"] / math.sqrt(non_null)
+            bounds["stddev"] = z * stats["stddev"] / math.sqrt(2 * (non_null - 1))
+        if "min" in stats:
+            bounds["min"] = "upper bound (true min <= sample min)"
+            bounds["max"] = "lower bound (true max >= sample max)"
+        if "uniqueCount" in stats:
+            bounds["uniqueCount"] = "lower bound (true unique count >= sample unique count)"
+
+        if stats.get("quartiles") and file_totals is None:
+            bounds["quartiles"] = {
+                name: get_quantile_bound(stats, name, p, z)
+                for name, p in [("Q1", 0.25), ("median", 0.5), ("Q3", 0.75)]
+            }
+        if stats.get("histogram"):
+            sample_counts = stats["histogram"]["counts"]
+            stats["histogram"]["counts"] = [round(count / fraction) for count in sample_counts]
+            if file_totals is None:
+                bounds["histogram"] = [z * math.sqrt(count * (1 - count / n)) / fraction if n else 0 for count in sample_counts]
+        if stats.get("topCategories"):
+            category_bounds = []
+            for category in stats["topCategories"]:
+                count = category["count"]
+                category["count"] = round(count / fraction)
+                category_bounds.append(z * math.sqrt(count * (1 - count / n)) / fraction if n else 0)
+            if file_totals is None:
+                bounds["topCategories"] = category_bounds
+
+        value_stats = stats.get("valueStats")
+        if isinstance(value_stats, dict) and stats.get("valueCount", 0) > 1:
+            if file_totals is None:
+                bounds["valueStats"] = {"mean": z * value_stats["std"] / math.sqrt(stats["valueCount"])}
+            stats["sampleSize"] = f"{stats['valueCount']} values (sampled)"
+
+        stats["errorBounds"] = bounds
+        stats.setdefault("approximate", [])
+        stats["approximate"] = sorted(set(stats["approximate"]) | set(bounds))
+
+    return overview
+
+def attach_prefix_sample(overview, fraction):
+    """
+    Marks an overview computed on the first rows of a file (fraction of its bytes): not a random sample, so the counts
+    are left as they are in the sample and no bounds are attached
+    """
+    overview["sample"] = {"fraction": fraction, "sampleRows": overview["numRows"], "biased": True}
+    return overview
+
+
+def count_arrow_leaves(arrow_type) -> int:
+    """Number of parquet leaf columns of an arrow type (lists have the leaves of their values, structs of all fields)"""
+    if hasattr(arrow_type, "value_type"):
+        return count_arrow_leaves(arrow_type.value_type)
+    if hasattr(arrow_type, "num_fields") and arrow_type.num_fields > 0:
+        return sum(count_arrow_leaves(arrow_type.field(i).type) for i in range(arrow_type.num_fields))
+    return 1
+
+def merge_footer_statistics(footers, num_leaves):
+    """
+    Merges the column chunk statistics of all row groups of all files, per leaf column.
+    null count is None if any chunk has no statistics, min/max are None if any chunk has no min/max.
+    """
+    leaves = [{"nullCount": 0, "numValues": 0, "min": None, "max": None, "hasMinMax": True} for _ in range(num_leaves)]
+    for footer in footers:
+        for rg in range(footer.num_row_groups):
+            row_group = footer.row_group(rg)
+            for leaf_idx in range(row_group.num_columns):
+                chunk, leaf = row_group.column(leaf_idx), leaves[leaf_idx]
+                leaf["numValues"] += chunk.num_values
+                statistics = chunk.statistics
+                if statistics is None or not statistics.has_null_count:
+                    leaf["nullCount"] = None
+                elif leaf["nullCount"] is not None:
+                    leaf["nullCount"] += statistics.null_count
+
+                if statistics is None or not statistics.has_min_max:
+                    leaf["hasMinMax"] = False
+                elif leaf["hasMinMax"]:
+                    leaf["min"] = statistics.min if leaf["min"] is None else min(leaf["min"], statistics.min)
+                    leaf["max"] = statistics.max if leaf["max"] is None else max(leaf["max"], statistics.max)
+    for leaf in leaves:
+        if not leaf["hasMinMax"]:
+            leaf["min"] = leaf["max"] = None
+    return leaves
+
+def overview_from_parquet_footers(footers):
+    """
+    Overview of a parquet dataset from the footers of its files only, no data is read.
+    Parquet footers store num_rows, null_count, min and max of every column chunk of every row group,
+    so row count, null counts, min/max of numeric columns, the schema and the number of array values per row are exact.
+    Everything else (mean, stddev, quartiles, histograms, unique counts, top categories) needs a spark pass.
+
+    :param footers: list of pyarrow.parquet.FileMetaData, one per file of the dataset (same schema)
+    """
+    if not footers:
+        return {"message": "No parquet files found."}
+
+    arrow_schema = footers[0].schema.to_arrow_schema()
+    num_rows = sum(footer.num_rows for footer in footers)
+    leaves = merge_footer_statistics(footers, footers[0].num_columns)
+
+    column_stats = []
+    leaf_idx = 0
+    for field in arrow_schema:
+        num_field_leaves = count_arrow_leaves(field.type)
+        field_leaves = leaves[leaf_idx:leaf_idx + num_field_leaves]
+        leaf_idx += num_field_leaves
+        try:
+            try:
+                spark_type = from_arrow_type(field.type)
+                type_name = str(spark_type)
+            except Exception:
+                spark_type, type_name = None, str(field.type)
+            kind = get_column_kind(type_name)
+
+            stats = {"name": field.name, "type": type_name, "entries": num_rows}
+            if kind == "numeric":
+                leaf = field_leaves[0]
+                stats.update({"nullCount": leaf["nullCount"], "min": leaf["min"], "max": leaf["max"]})
+
+            elif kind == "string":
+                stats["nullCount"] = field_leaves[0]["nullCount"]
+
+            elif kind == "array":
+                # leaf null count also has null elements (and null/empty arrays), so row level null count is unknown
+                leaf = field_leaves[0]
+                depth, leaf_type = get_array_leaf(spark_type)
+                stats["Shape"] = None
+                stats["valuesPerRow"] = leaf["numValues"] / num_rows if num_rows else 0
+                stats["nestingDepth"] = depth
+                if isinstance(leaf_type, NumericType) and leaf["min"] is not None:
+                    stats["valueStats"] = {"min": leaf["min"], "max": leaf["max"], "nullValues": leaf["nullCount"]}
+                else:
+                    stats["valueStats"] = "Not numeric" if not isinstance(leaf_type, NumericType) else "Not detected"
+
+            column_stats.append(stats)
+        except Exception as e:
+            print(f"Error processing column {field.name}: {e}")
+            continue
+
+    return {
+        "numRows": num_rows,
+        "numColumns": len(arrow_schema),
+        "overviewMode": "footer",
+        "numFiles": len(footers),
+        "numRowGroups": sum(footer.num_row_groups for footer in footers),
+        "columnStats": column_stats
+    }
+
+
+"""
+    Merging overviews of appended partitions (see append_raw_partition in spark_services.py): the overview of a dataset
+    with a new partition is the merge of the stored overview and the overview of the new partition only.
+    Counts, nulls, min/max, mean and stddev merge exactly, the rest are estimates recorded in "approximate":
+    histograms are re-binned over the merged range, quartiles are read off the merged histogram, unique counts are
+    exact only for string columns whose categories are all in topCategories, otherwise a lower bound.
+"""
+
+def add_counts(a, b):
+    return a + b if a is not None and b is not None else None
+
+def merge_min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def merge_max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+def merge_moments(n_a, mean_a, std_a, n_b, mean_b, std_b, ddof=1):
+    """Mean and stddev of the union of two groups from their counts, means and stddevs (ddof=1 sample, 0 population)"""
+    if not n_b or mean_b is None:
+        return mean_a, std_a
+    if not n_a or mean_a is None:
+        return mean_b, std_b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    m2 = (std_a or 0) ** 2 * max(n_a - ddof, 0) + (std_b or 0) ** 2 * max(n_b - ddof, 0) + delta ** 2 * n_a * n_b / n
+    return mean_a + delta * n_b / n, math.sqrt(m2 / (n - ddof)) if n > ddof else None
+
+def merge_histograms(stats_a, stats_b, min_val, max_val, num_bins=10):
+    """
+    Histogram over [min_val, max_val] of the values of both partitions, counts of a bin are spread over the new bins
+    in proportion to the overlap (values assumed uniform within a bin), exact if the bins are the same.
+    A partition with a single value has no histogram, its values go to the bin of the value.
+    None if a partition has values but no histogram (e.g. a footer overview).
+    """
+    if min_val is None or max_val is None or max_val <= min_val:
+        return None
+    histograms = []
+    for stats in (stats_a, stats_b):
+        if stats.get("histogram"):
+            histograms.append(stats["histogram"])
+        elif stats.get("min") is not None and stats["min"] == stats.get("max"):
+            histograms.append({"bins": [stats["min"], stats["min"]], "counts": [stats["entries"] - (stats.get("nullCount") or 0)]})
+        elif stats.get("min") is not None:
+            return None
+    if len(histograms) == 2 and histograms[0]["bins"] == histograms[1]["bins"]:
+        return {"bins": histograms[0]["bins"], "counts": [a + b for a, b in zip(histograms[0]["counts"], histograms[1]["counts"])]}
+
+    bin_width = (max_val - min_val) / num_bins
+    bins = [min_val + i * bin_width for i in range(num_bins + 1)]
+    counts = [0.0] * num_bins
+    for histogram in histograms:
+        for i, count in enumerate(histogram["counts"]):
+            low, high = histogram["bins"][i], histogram["bins"][i + 1]
+            if high == low:
+                counts[min(int((low - min_val) / bin_width), num_bins - 1)] += count
+                continue
+            for j in range(num_bins):
+                overlap = min(high, bins[j + 1]) - max(low, bins[j])
+                if overlap > 0:
+                    counts[j] += count * overlap / (high - low)
+    return {"bins": bins, "counts": [round(count) for count in counts]}
+
+def get_histogram_quantile(histogram, p):
+    """Quantile p of the values of a histogram (linear interpolation within the bin)"""
+    total = sum(histogram["counts"])
+    if not total:
+        return None
+    target, cumulative = p * total, 0
+    for i, count in enumerate(histogram["counts"]):
+        if count and cumulative + count >= target:
+            low, high = histogram["bins"][i], histogram["bins"][i + 1]
+            return low + (high - low) * (target - cumulative) / count
+        cumulative += count
+    return histogram["bins"][-1]
+
+def merge_categories(stats_a, stats_b):
+    """(topCategories, uniqueCount, exact) of the union, exact when both lists hold all the categories of the column"""
+    counts = {}
+    for stats in (stats_a, stats_b):
+        for category in stats.get("topCategories") or []:
+            counts[category["value"]] = counts.get(category["value"], 0) + category["count"]
+    top = sorted(counts.items(), key=lambda item: -item[1])[:TOP_CATEGORIES]
+    complete = all(
+        stats.get("uniqueCount") is not None and len(stats.get("topCategories") or []) >= stats["uniqueCount"]
+        for stats in (stats_a, stats_b)
+    )
+    unique_count = len(counts) if complete else merge_max(stats_a.get("uniqueCount"), stats_b.get("uniqueCount"))
+    return [{"value": value, "count": count} for value, count in top], unique_count, complete
+
+def merge_column_stats(stats_a, stats_b):
+    """Stats of a column over two partitions, from the stats of each (as in compute_overview)"""
+    if stats_a["type"] != stats_b["type"]:
+        raise ValueError(f"Column {stats_a['name']} has type {stats_a['type']} and {stats_b['type']} in the partitions")
+    kind = get_column_kind(stats_a["type"])
+    approximate = set(stats_a.get("approximate", [])) | set(stats_b.get("approximate", []))
+    merged = dict(stats_a)
+    merged["entries"] = stats_a["entries"] + stats_b["entries"]
+    merged["nullCount"] = add_counts(stats_a.get("nullCount"), stats_b.get("nullCount"))
+
+    if kind == "numeric":
+        n_a = stats_a["entries"] - (stats_a.get("nullCount") or 0)
+        n_b = stats_b["entries"] - (stats_b.get("nullCount") or 0)
+        merged["mean"], merged["stddev"] = merge_moments(
+            n_a, stats_a.get("mean"), stats_a.get("stddev"), n_b, stats_b.get("mean"), stats_b.get("stddev")
+        )
+        merged["min"] = merge_min(stats_a.get("min"), stats_b.get("min"))
+        merged["max"] = merge_max(stats_a.get("max"), stats_b.get("max"))
+
+        unique_a, unique_b = stats_a.get("uniqueCount"), stats_b.get("uniqueCount")
+        if unique_a is not None and unique_b is not None:
+            merged["uniqueCount"] = max(unique_a, unique_b)
+            merged["uniqueCountBounds"] = [max(unique_a, unique_b), unique_a + unique_b]
+            approximate.add("uniqueCount")
+
+        merged.pop("histogram", None)
+        histogram = merge_histograms(stats_a, stats_b, merged["min"], merged["max"])
+        if histogram is not None:
+            merged["histogram"] = histogram
+            approximate.add("histogram")
+
+        merged.pop("quartiles", None)
+        if histogram is not None:
+            q1, median, q3 = [get_histogram_quantile(histogram, p) for p in QUARTILE_PROBS]
+            if q1 is not None:
+                merged["quartiles"] = {"Q1": q1, "median": median, "Q3": q3, "IQR": q3 - q1}
+                approximate.add("quartiles")
+        elif merged["min"] is not None and merged["min"] == merged["max"]:
+            value = merged["min"]
+            merged["quartiles"] = {"Q1": value, "median": value, "Q3": value, "IQR": 0}
+
+    elif kind == "string":
+        merged["topCategories"], merged["uniqueCount"], exact = merge_categories(stats_a, stats_b)
+        if not exact:
+            approximate |= {"uniqueCount", "topCategories"}
+
+    elif kind == "array":
+        length_a, length_b = stats_a.get("LengthStats"), stats_b.get("LengthStats")
+        if length_a and length_b:
+            n_a = stats_a["entries"] - (stats_a.get("nullCount") or 0)
+            n_b = stats_b["entries"] - (stats_b.get("nullCount") or 0)
+            mean, std = merge_moments(n_a, length_a["mean"], length_a["std"], n_b, length_b["mean"], length_b["std"])
+            merged["LengthStats"] = {
+                "min": min(length_a["min"], length_b["min"]), "max": max(length_a["max"], length_b["max"]),
+                "mean": float(mean or 0), "std": float(std or 0)
+            }
+
+        values_a, values_b = stats_a.get("valueStats"), stats_b.get("valueStats")
+        if isinstance(values_a, dict) and isinstance(values_b, dict) and "valueCount" in stats_a and "valueCount" in stats_b:
+            n_a, n_b = stats_a["valueCount"], stats_b["valueCount"]
+            n = n_a + n_b
+            mean, std = merge_moments(n_a, values_a["mean"], values_a["std"], n_b, values_b["mean"], values_b["std"], ddof=0)
+            merged["valueCount"] = n
+            merged["sampleSize"] = f"{n} values (full column)"
+            merged["valueStats"] = {
+                "min": merge_min(values_a["min"], values_b["min"]),
+                "max": merge_max(values_a["max"], values_b["max"]),
+                "mean": mean,
+                "std": std,
+                # weighted mean of the medians of the partitions, an estimate
+                "median": (values_a["median"] * n_a + values_b["median"] * n_b) / n if n and values_a["median"] is not None and values_b["median"] is not None else None,
+                "sparsity": (values_a["sparsity"] * n_a + values_b["sparsity"] * n_b) / n if n else 0
+            }
+        elif values_a is None or isinstance(values_a, str):
+            merged["valueStats"] = values_b if isinstance(values_b, dict) else values_a
+            if isinstance(values_b, dict):
+                merged["valueCount"] = stats_b.get("valueCount")
+                merged["sampleSize"] = stats_b.get("sampleSize")
+
+    merged["approximate"] = sorted(approximate)
+    return merged
+
+def merge_overviews(overview, partition_overview):
+    """
+    Overview of a dataset with an appended partition, from the stored overview and the overview of the partition,
+    the partition must have the same columns (and types) as the dataset.
+    """
+    partition_stats = {stats["name"]: stats for stats in partition_overview["columnStats"]}
+    column_stats = []
+    for stats in overview["columnStats"]:
+        if stats["name"] not in partition_stats:
+            raise ValueError(f"Column {stats['name']} is not in the appended partition")
+        column_stats.append(merge_column_stats(stats, partition_stats[stats["name"]]))
+
+    return {
+        **overview,
+        "numRows": overview["numRows"] + partition_overview["numRows"],
+        "columnStats": column_stats,
+        "mergedPartitions": overview.get("mergedPartitions", 1) + 1
+    }
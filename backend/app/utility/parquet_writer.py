@@ -0,0 +1,117 @@
+from dotenv import load_dotenv
+import math
+import os
+
+load_dotenv()
+
+PARQUET_TARGET_FILE_SIZE_MB = float(os.getenv("PARQUET_TARGET_FILE_SIZE_MB", 128))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+PARQUET_COMPRESSION_CODECS = ["none", "uncompressed", "snappy", "gzip", "lz4", "zstd"]
+
+"""
+    Layout of the parquet datasets written to HDFS (raw datasets, processed datasets, compaction).
+    A layout is a dict (stored in datastats["layout"], keys as in the request json):
+        targetFileSizeMb: approximate size of the output files, the number of files is the estimated size of the df
+            (size of the optimized plan, so the size of the input files scaled by the projections, filters are not
+            counted) divided by it, and the df is repartitioned to that many tasks (one file per task)
+        partitionBy: columns to partition the output directory by (key=value sub directories), the df is repartitioned
+            by these columns so every directory is written by one task (instead of a small file from every task). The
+            files of a directory are split at about the target size by maxRecordsPerFile (rows of the target size, from
+            the row count given by the caller or in the plan statistics), without a row count a directory is one file
+        sortBy: columns to sort by within every file, so the min/max of the row groups allow predicate pushdown
+        compression: parquet compression codec (PARQUET_COMPRESSION_CODECS)
+        maxRecordsPerFile: upper limit of rows in a file (splits the files of large partitionBy values), overrides the
+            limit derived from the target size
+    Note: partition columns are read back as the last columns of the df (partition discovery).
+"""
+
+def get_estimated_size(df):
+    """Estimated size in bytes of df from the statistics of its optimized plan, None if not available"""
+    try:
+        return int(df._jdf.queryExecution().optimizedPlan().stats().sizeInBytes().toString())
+    except Exception as e:
+        print(f"Size estimate not available: {e}")
+        return None
+
+def get_estimated_rows(df):
+    """Row count of df from the statistics of its optimized plan, None if not available (no table statistics)"""
+    try:
+        row_count = df._jdf.queryExecution().optimizedPlan().stats().rowCount()
+        return int(row_count.get().toString()) if row_count.isDefined() else None
+    except Exception as e:
+        print(f"Row count estimate not available: {e}")
+        return None
+
+def get_num_files(df, target_file_size_mb, estimated_size=None):
+    """Number of output files of about target_file_size_mb, None if the size of df can't be estimated"""
+    estimated_size = estimated_size if estimated_size is not None else get_estimated_size(df)
+    if not estimated_size:
+        return None
+    return max(1, math.ceil(estimated_size / (target_file_size_mb * 1024 * 1024)))
+
+def get_layout_key(layout):
+    """The layout options as write_parquet uses them (defaults filled in), to compare a requested and a written layout"""
+    layout = layout or {}
+    return (
+        float(layout.get("targetFileSizeMb") or PARQUET_TARGET_FILE_SIZE_MB),
+        list(layout.get("partitionBy") or []),
+        list(layout.get("sortBy") or []),
+        layout.get("compression") or PARQUET_COMPRESSION,
+        layout.get("maxRecordsPerFile"),
+    )
+
+def is_same_layout(layout, written_layout):
+    """Whether a dataset written with written_layout (datastats["layout"]) has the requested layout"""
+    return get_layout_key(layout) == get_layout_key(written_layout)
+
+def write_parquet(df, path, layout=None, mode="overwrite", estimated_size=None, estimated_rows=None):
+    """
+    Writes df as parquet at path with the layout (see above), a missing key uses the default (target file size and
+    compression from the env, no partitioning or sorting). Returns the layout used, with the number of write tasks.
+    estimated_size (bytes) overrides the plan estimate, e.g. the size of the files of a dataset being compacted,
+    estimated_rows (e.g. numRows of the stored overview) sizes the files of a partitionBy layout.
+    """
+    layout = layout or {}
+    target_file_size_mb = layout.get("targetFileSizeMb") or PARQUET_TARGET_FILE_SIZE_MB
+    partition_by = layout.get("partitionBy") or []
+    sort_by = layout.get("sortBy") or []
+    compression = layout.get("compression") or PARQUET_COMPRESSION
+    if compression not in PARQUET_COMPRESSION_CODECS:
+        raise ValueError(f"Invalid compression codec: {compression}, supported codecs: {PARQUET_COMPRESSION_CODECS}")
+    missing_columns = [c for c in partition_by + sort_by if c not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Columns {missing_columns} of the layout are not in the dataset")
+
+    # one shuffle to get files of the target size, it also keeps the upstream stages parallel (unlike coalesce)
+    num_files = get_num_files(df, target_file_size_mb, estimated_size)
+    columns = [df[f"`{c}`"] for c in partition_by]
+    if num_files is not None:
+        df = df.repartition(num_files, *columns)
+    elif columns:
+        df = df.repartition(*columns)
+    if partition_by or sort_by:
+        # partition columns first, so every task writes its directories one after the other
+        df = df.sortWithinPartitions(*[df[f"`{c}`"] for c in partition_by + sort_by])
+
+    max_records_per_file = layout.get("maxRecordsPerFile")
+    if partition_by and not max_records_per_file and num_files is not None:
+        # a task writes all the rows of its values, split into files of about the target size
+        estimated_rows = estimated_rows if estimated_rows is not None else get_estimated_rows(df)
+        if estimated_rows:
+            max_records_per_file = math.ceil(estimated_rows / num_files)
+
+    writer = df.write.mode(mode).option("compression", compression)
+    if max_records_per_file:
+        writer = writer.option("maxRecordsPerFile", int(max_records_per_file))
+    if partition_by:
+        writer = writer.partitionBy(*partition_by)
+    writer.parquet(path)
+
+    return {
+        "targetFileSizeMb": target_file_size_mb,
+        "partitionBy": partition_by,
+        "sortBy": sort_by,
+        "compression": compression,
+        "maxRecordsPerFile": layout.get("maxRecordsPerFile"),
+        "numWriteTasks": num_files if num_files is not None else df.rdd.getNumPartitions(),
+    }
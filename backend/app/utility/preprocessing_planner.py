@@ -0,0 +1,874 @@
+from pyspark.ml.feature import Imputer
+from pyspark.ml.linalg import Vector, VectorUDT
+from pyspark.sql import functions as F, Observation
+from pyspark.sql.types import NumericType, FloatType, DoubleType, StringType, BooleanType, ArrayType
+from utility.processing_helper_functions import (
+    All_Column_Operations, Column_Operations, get_normalization_aggregations, get_normalized_column,
+    fit_string_indexer_labels, apply_string_indexer, fit_one_hot_encoding, apply_one_hot_encoding, get_step_lineage,
+    get_outlier_params, get_outlier_aggregations, get_mad_aggregations, get_outlier_bounds, get_clipped_column,
+    VECTOR_EXPAND_FORMATS, get_vector_size, get_expanded_vector_columns
+)
+from utility.column_expressions import get_expression_columns, compile_expression, get_function_column
+from utility.lineage_checkpoints import get_plan_depth
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import reduce
+from decimal import Decimal
+from datetime import date, datetime
+import math
+
+
+"""
+    Planner for the operations list of preprocess_data, it gives the same result as applying All_Column_Operations /
+    Column_Operations step by step but with a smaller plan and fewer scans:
+    i) Projection steps (fills, Log, Square, Square Root, Drop Column, Expression, Custom Function, Expand Vector and
+        the output of normalization/imputation) are composed into one expression per column over the current df and materialized by a single select, instead of a
+        withColumn (and a new analyzed plan) per step. The expressions of a step are analyzed over the current df when the
+        step is added (driver only), so a step with a type error fails (and is skipped) on its own.
+    ii) Stats needed by steps (normalization, imputation, IQR bounds, null check before encoding) are requested and
+        computed together by one df.agg(...), the batch is computed only when a step needs the result of a pending
+        request (touches a column with pending stats, filters rows, or fits an estimator).
+    iii) Row filters (Drop Null, Remove Outliers) are applied on the df below the composed projections,
+        so the projections and the stats of later steps run only on the remaining rows.
+    iv) Steps which fit spark ML estimators or shuffle rows (encoding, Drop Duplicates) are barriers: pending stats are computed and the projections are materialized before them.
+    v) A failed step is printed and skipped (df unchanged by it), like in the step by step loop.
+
+    Every applied step is also recorded with its fitted params (means, min/max, stddevs, category labels, IQR bounds)
+    in a recipe, apply_recipe replays a recipe on another df as a transform-only pass (no fitting scans).
+
+    With known_stats (full data columnStats of the input overview) the stats of steps on unchanged input columns (before
+    any row filter) are taken from it instead of the df, used by the preview which runs the steps on a small sample.
+
+    With a LineageCheckpointer the df is checkpointed (materialized and read back) after every N steps, or when the plan
+    of the df gets too deep, so that later steps don't re-analyze and recompute the whole lineage (see lineage_checkpoints.py).
+
+    With a SparkJobInstrumentation every step is measured (wall time, spark jobs and stages, shuffle bytes), and the rows
+    after every row changing step are counted by df.observe (computed by the next action without an extra scan, and read
+    once by collect_observations after the write). The phases after the steps (write, overview) are measured by the caller
+    and reported as "phases", the "stageIds" of a record are the spark stages of its jobs.
+"""
+
+NORMALIZATION_OPERATIONS = ["L1 Norm", "L2 Norm", "L inf Norm", "Min-Max", "Z-score"]
+PROJECTION_OPERATIONS = ["Drop Column", "Fill 0", "Fill Unknown", "Fill False", "Log", "Square", "Square Root"]
+FILL_VALUES = {"Fill 0": [0], "Fill Unknown": ['Unknown'], "Fill False": [False], "Fill 0 Unknown False": [0, 'unknown', False]}
+ALL_COLUMNS_IMPUTATIONS = {"Fill Mean": "mean", "Fill Median": "median"}
+COLUMN_IMPUTATIONS = {"Fill mean": "mean", "Fill Median": "median", "Fill Mode": "mode"}
+VECTOR_NORMS = {"L1 Norm": 1.0, "L2 Norm": 2.0, "L inf Norm": float("inf")}
+# VectorAssembler (handleInvalid="error") of the vector normalization of All Columns fails on these rows
+VECTOR_INVALID_VALUE_ERROR = "Encountered null or NaN while assembling a row with handleInvalid = \"error\" (vector normalization of All Columns)"
+
+IMPUTER_RELATIVE_ERROR = 0.001  # default relativeError of pyspark.ml.feature.Imputer (used for median)
+
+RECIPE_FORMAT_VERSION = 1
+QUARTILE_NAMES = ["Q1", "median", "Q3"]
+
+
+def print_step_error(step, e):
+    print(f"error: Error in {step['operation']} operation for {step['column']} column: {str(e)} \n")
+
+def is_floating_type(data_type):
+    return isinstance(data_type, (FloatType, DoubleType))
+
+def get_invalid_vector_row(values):
+    """Whether a row has a null or NaN in any of values (double columns), like VectorAssembler checks it"""
+    return reduce(lambda a, b: a | b, [v.isNull() | F.isnan(v) for v in values])
+
+def to_json_value(value):
+    """Fitted params (and preview rows) as json values (decimal as float, vector as list, NaN as null)"""
+    if isinstance(value, dict):
+        return {k: to_json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(v) for v in value]
+    if isinstance(value, Vector):
+        return to_json_value(value.toArray().tolist())
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def get_fill_expression(column_expr, data_type, value):
+    """Same as df.fillna(value, subset=column): the value is filled only in columns of a matching type"""
+    if isinstance(value, bool):
+        return F.coalesce(column_expr, F.lit(value)) if isinstance(data_type, BooleanType) else column_expr
+    if isinstance(value, (int, float)):
+        if not isinstance(data_type, NumericType):
+            return column_expr
+        # fillna treats NaN as null in float/double columns
+        if is_floating_type(data_type):
+            column_expr = F.when(~F.isnan(column_expr), column_expr)
+        return F.coalesce(column_expr, F.lit(value).cast(data_type))
+    return F.coalesce(column_expr, F.lit(value)) if isinstance(data_type, StringType) else column_expr
+
+
+class PreprocessingPlanner:
+    """
+    Runs an operations list on df, usage:
+        planner = PreprocessingPlanner(df)
+        df = planner.run(operations)
+        recipe = planner.get_recipe()
+    or replays a recipe: df = PreprocessingPlanner(other_df).apply_recipe(recipe)
+    column_state (get_column_state of an earlier run) continues the operations of that run on its output.
+    get_report gives the per step report (after the output is written, when instrumentation is given).
+
+    rows_changed and modified_columns give the lineage of the run (see get_step_lineage), a deferred step which fails
+    later is still counted in it, which only makes the lineage more conservative.
+    """
+    def __init__(self, df, instrumentation=None, known_stats=None, checkpointer=None, column_state=None):
+        self.df = df
+        self.instrumentation = instrumentation
+        self.checkpointer = checkpointer
+        self.known_stats = {stats["name"]: stats for stats in known_stats} if known_stats else {}
+        self._pristine = set(df.columns) if known_stats else set()  # input columns not changed yet, before any row filter
+        self.input_columns = [{"name": field.name, "type": field.dataType.simpleString()} for field in df.schema.fields]
+        self.all_columns = df.columns
+        self.numeric_columns = [c for c in self.all_columns if isinstance(df.schema[c].dataType, NumericType)]
+        if column_state is not None:
+            # resumed run (df is the output of earlier steps), "All Columns" lists as they were after those steps
+            self.all_columns = list(column_state["allColumns"])
+            self.numeric_columns = list(column_state["numericColumns"])
+        self.rows_changed = False
+        self.modified_columns = set()
+        self.num_aggregations = 0
+        self.num_barriers = 0
+        self.num_checkpoints = 0
+        self._steps_since_checkpoint = 0
+        # nodes in the logical plan of self.df, counted as the planner adds them (see _checkpoint)
+        self._plan_depth = get_plan_depth(df) if checkpointer is not None and checkpointer.mode != "off" else 0
+        self._pending = []           # steps waiting for stats: {"step", "aggregations": {name: (alias, agg)}, "apply"}
+        self._pending_columns = set()  # columns whose expression will be set by a pending step
+        self._num_aliases = 0
+        self._recipe = []            # recipe entries, None for a reserved slot of a pending (or failed) step
+        self.step_records = []       # per step report
+        self._current_record = None
+        self._observations = []      # (record, Observation) of the row changing steps, see collect_observations
+        self._reset_projection()
+
+    def _reset_projection(self):
+        """Expressions (and their types) of the current columns over self.df"""
+        self.exprs = OrderedDict((c, F.col(f"`{c}`")) for c in self.df.columns)
+        self.types = {field.name: field.dataType for field in self.df.schema.fields}
+        self._projected = False
+
+    def _set_columns(self, column_exprs):
+        """
+        Sets the expressions of columns, they are analyzed over self.df right away (on the driver, no spark job), so a
+        step with a type error (e.g. Log of an array column) fails as its own step instead of failing the final select.
+        Types are the analyzed ones.
+        """
+        schema = self.df.select([column_expr.alias(c) for c, column_expr in column_exprs.items()]).schema
+        for field, (c, column_expr) in zip(schema.fields, column_exprs.items()):
+            self.exprs[c] = column_expr
+            self.types[c] = field.dataType
+            self._pristine.discard(c)
+        self._projected = True
+
+    def _set_column(self, column, column_expr):
+        self._set_columns({column: column_expr})
+
+    def _get_known_stats(self, columns, stat_names):
+        """
+        {column: {stat: value}} from known_stats if every column is unchanged and has all the stats, else None
+        (a null or NaN stat is treated as unknown, it is computed on the df instead)
+        """
+        if not self._pristine.issuperset(columns):
+            return None
+        known = {}
+        for c in columns:
+            stats = self.known_stats.get(c, {})
+            known[c] = {}
+            for stat in stat_names:
+                value = (stats.get("quartiles") or {}).get(stat) if stat in QUARTILE_NAMES else stats.get(stat)
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    return None
+                known[c][stat] = value
+        return known
+
+    def _require(self, columns):
+        """Columns must exist, and their pending stats are computed before the expressions are used again"""
+        missing = [c for c in columns if c not in self.exprs]
+        if missing:
+            raise Exception(f"Column(s) {missing} not found in the dataframe")
+        if self._pending_columns.intersection(columns):
+            self._resolve()
+
+    def _require_numeric(self, columns):
+        if not columns:
+            raise Exception("No numeric columns for the operation")
+        self._require(columns)
+        non_numeric = [c for c in columns if not isinstance(self.types[c], NumericType)]
+        if non_numeric:
+            raise Exception(f"Column(s) {non_numeric} are not numeric")
+
+    def _valid_values(self, column):
+        """Column values as double with NaN as null (values used by Imputer and approxQuantile)"""
+        double_expr = self.exprs[column].cast("double")
+        return F.when(~F.isnan(double_expr), double_expr)
+
+    def _record(self, entry, slot=None):
+        entry = to_json_value(entry)
+        if slot is None:
+            self._recipe.append(entry)
+        else:
+            self._recipe[slot] = entry
+
+    def _record_apply(self, entry, slot=None):
+        self._apply_entry(entry)
+        self._record(entry, slot)
+
+    def _request(self, step, columns, aggregations, apply):
+        """
+        Defers apply(stats) until the aggregations are computed, columns are the ones apply will set.
+        A recipe slot is reserved, so the recipe keeps the order of the steps.
+        """
+        named_aggregations = {}
+        for name, agg in aggregations.items():
+            named_aggregations[name] = (f"__stat{self._num_aliases}", agg)
+            self._num_aliases += 1
+        self._recipe.append(None)
+        self._pending.append({
+            "step": step, "aggregations": named_aggregations, "apply": apply, "slot": len(self._recipe) - 1,
+            "record": self._current_record
+        })
+        self._pending_columns |= set(columns)
+
+    def _aggregate(self, entries):
+        self.num_aggregations += 1
+        return self.df.agg(*[agg.alias(alias) for entry in entries for alias, agg in entry["aggregations"].values()]).first()
+
+    def _resolve(self):
+        """Computes the pending stats in one scan and applies the pending steps in order"""
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_columns = self._pending, [], set()
+        if self._current_record is not None:
+            self._current_record.setdefault("resolvedSteps", []).extend(
+                entry["record"]["index"] for entry in pending if entry["record"] is not None
+            )
+
+        try:
+            rows = [self._aggregate(pending)] * len(pending)
+        except Exception as e:
+            if len(pending) == 1:
+                rows = [e]
+            else:
+                # one failing aggregation should fail only its own step
+                print(f"Batched aggregation of {len(pending)} steps failed, computing them one by one: {e}")
+                rows = []
+                for entry in pending:
+                    try:
+                        rows.append(self._aggregate([entry]))
+                    except Exception as step_error:
+                        rows.append(step_error)
+
+        for entry, row in zip(pending, rows):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                entry["apply"]({name: row[alias] for name, (alias, _) in entry["aggregations"].items()}, entry["slot"])
+            except Exception as e:
+                print_step_error(entry["step"], e)
+                self._mark_failed(entry["record"], e)
+
+    def _mark_failed(self, record, e):
+        if record is not None:
+            record["status"] = "failed"
+            record["error"] = str(e)
+
+    def _measure(self, record):
+        self.step_records.append(record)
+        self._current_record = record
+        if self.instrumentation is None:
+            return nullcontext(record)
+        return self.instrumentation.measure(f"Step {record['index']}: {record['operation']} on {record['column']}", record)
+
+    def _observe_rows(self):
+        """Counts the rows of the current df when it is computed by the next action (no extra scan)"""
+        if self.instrumentation is None or self._current_record is None:
+            return
+        observation = Observation()
+        self.df = self.df.observe(observation, F.count(F.lit(1)).alias("rows"))
+        self._plan_depth += 1
+        self._observations.append((self._current_record, observation))
+
+    def _projected_df(self):
+        return self.df.select([column_expr.alias(c) for c, column_expr in self.exprs.items()]) if self._projected else self.df
+
+    def _materialize(self):
+        """Computes pending stats and applies the composed projections with a single select"""
+        self._resolve()
+        if self._projected:
+            self.df = self._projected_df()
+            self._plan_depth += 1
+            self._reset_projection()
+
+    def _barrier(self, transform):
+        self._materialize()
+        self.num_barriers += 1
+        self.df = transform(self.df)
+        if self.checkpointer is not None and self.checkpointer.mode != "off":
+            # a transformer adds an unknown number of nodes, the df is already materialized here
+            self._plan_depth = get_plan_depth(self.df)
+        self._reset_projection()
+
+    def _checkpoint(self, index):
+        """Checkpoints the df (after materializing it) if the checkpointer asks for it, measured as its own record"""
+        if self.checkpointer is None:
+            return
+        self._steps_since_checkpoint += 1
+        # the composed projection is one more node once materialized
+        if not self.checkpointer.should_checkpoint(self._steps_since_checkpoint, self._plan_depth + int(self._projected)):
+            return
+
+        record = {"index": index, "column": "All Columns", "operation": "Checkpoint", "status": "applied"}
+        with self._measure(record):
+            try:
+                self._materialize()
+                self.df = self.checkpointer.checkpoint(self.df)
+                self._plan_depth = 1
+                self._reset_projection()
+                self.num_checkpoints += 1
+                self._steps_since_checkpoint = 0
+            except Exception as e:
+                # the lineage is still valid, the job only continues without the checkpoint
+                print(f"error: Checkpoint after step {index} failed: {str(e)} \n")
+                self._mark_failed(record, e)
+
+    ###################### Transforms with known (fitted) params, used by run and apply_recipe
+
+    def _apply_drop_null(self, columns):
+        """Same as df.dropna(subset=columns): NaN counts as null in float/double columns"""
+        self._require(columns)
+        conditions = []
+        for c in columns:
+            condition = self.exprs[c].isNotNull()
+            if is_floating_type(self.types[c]):
+                condition = condition & ~F.isnan(self.exprs[c])
+            conditions.append(condition)
+        if conditions:
+            self.df = self.df.where(reduce(lambda a, b: a & b, conditions))
+            self._plan_depth += 1
+            self._pristine.clear()
+            self._observe_rows()
+
+    def _apply_fill(self, columns, values):
+        self._require(columns)
+        filled = {}
+        for c in columns:
+            column_expr = self.exprs[c]
+            for value in values:
+                column_expr = get_fill_expression(column_expr, self.types[c], value)
+            filled[c] = column_expr
+        if filled:
+            self._set_columns(filled)
+
+    def _apply_projection(self, operation, column):
+        if operation == "Drop Column":
+            # df.drop ignores a missing column
+            if column in self._pending_columns:
+                self._resolve()
+            if column in self.exprs:
+                del self.exprs[column]
+                del self.types[column]
+                self._projected = True
+                self._pristine.discard(column)
+            return
+
+        self._require([column])
+        column_expr = self.exprs[column]
+        if operation == "Log":
+            self._set_column(column, F.log(column_expr))
+        elif operation == "Square":
+            # same as Column_Operations
+            self._set_column(column, column_expr * 2)
+        elif operation == "Square Root":
+            self._set_column(column, F.sqrt(column_expr))
+
+    def _apply_expression(self, column, expression):
+        """Expression over the composed expressions of the columns it uses (see column_expressions.py)"""
+        self._require(get_expression_columns(expression, column))
+        self._set_column(column, compile_expression(expression, column, lambda c: self.exprs[c]))
+
+    def _apply_custom_function(self, column, function_name, params):
+        """Registered function as a pandas UDF, it stays in the composed projection (no barrier)"""
+        self._require([column])
+        column_expr, _ = get_function_column(function_name, params, self.exprs[column])
+        self._set_column(column, column_expr)
+
+    def _apply_imputation(self, surrogates):
+        """Same as ImputerModel.transform with the output in the input columns"""
+        self._require_numeric(list(surrogates))
+        empty = [c for c, surrogate in surrogates.items() if surrogate is None]
+        if empty:
+            raise Exception(f"surrogate cannot be computed. All the values in {empty} are Null, Nan or missingValue")
+        imputed = {}
+        for c, surrogate in surrogates.items():
+            double_expr = self.exprs[c].cast("double")
+            imputed[c] = F.when(double_expr.isNull() | F.isnan(double_expr), surrogate).otherwise(double_expr).cast(self.types[c])
+        self._set_columns(imputed)
+
+    def _apply_normalization(self, column, method, stats):
+        self._require([column])
+        self._set_column(column, get_normalized_column(self.exprs[column], method, stats))
+
+    def _apply_vector_scaling(self, method, columns, stats):
+        """
+        Same values as the vector normalization of All Columns (VectorAssembler + scaler, vector assigned back to the
+        columns): MinMaxScaler gives 0.5 for a constant column, StandardScaler (withMean=False) gives 0.0 for zero std,
+        Normalizer keeps a row with zero norm as it is. A row with a null or NaN in any of the columns fails when it is
+        computed, as VectorAssembler does (Min-Max and Z-score already fail when fitted, see _scale_vectors).
+        """
+        self._require_numeric(columns)
+        values = {c: self.exprs[c].cast("double") for c in columns}
+        scaled = {}
+        if method == "Min-Max":
+            for c in columns:
+                min_val, max_val = stats[c]["min"], stats[c]["max"]
+                if min_val is None or max_val is None:
+                    raise Exception(f"No values in {c} column for Min-Max scaling")
+                scaled[c] = F.lit(0.5) if max_val == min_val else (values[c] - min_val) / (max_val - min_val)
+        elif method == "Z-score":
+            for c in columns:
+                stddev_val = stats[c]["stddev"] or 0
+                scaled[c] = F.lit(0.0) if stddev_val == 0 else values[c] / stddev_val
+        else:
+            p = VECTOR_NORMS[method]
+            if p == 1.0:
+                norm = reduce(lambda a, b: a + b, [F.abs(v) for v in values.values()])
+            elif p == 2.0:
+                norm = F.sqrt(reduce(lambda a, b: a + b, [v * v for v in values.values()]))
+            else:
+                abs_values = [F.abs(v) for v in values.values()]
+                norm = abs_values[0] if len(abs_values) == 1 else F.greatest(*abs_values)
+            scaled = {c: F.when(norm == 0, values[c]).otherwise(values[c] / norm) for c in columns}
+
+        invalid = get_invalid_vector_row(values.values())
+        self._set_columns({c: F.when(invalid, F.raise_error(VECTOR_INVALID_VALUE_ERROR)).otherwise(scaled[c]) for c in columns})
+
+    def _apply_range_filter(self, bounds):
+        """Keeps the rows with every column within its [lower, upper] bounds"""
+        if not bounds:
+            return
+        self._require(list(bounds))
+        conditions = [self.exprs[c].between(lower, upper) for c, (lower, upper) in bounds.items()]
+        self.df = self.df.where(reduce(lambda a, b: a & b, conditions))
+        self._plan_depth += 1
+        self._pristine.clear()
+        self._observe_rows()
+
+    def _apply_clip(self, bounds):
+        """Winsorizes every column to its [lower, upper] bounds (Remove Outliers in clip mode), rows are kept"""
+        self._require_numeric(list(bounds))
+        self._set_columns({
+            c: get_clipped_column(self.exprs[c], lower, upper).cast(self.types[c]) for c, (lower, upper) in bounds.items()
+        })
+
+    def _apply_vector_expansion(self, output_format, sizes):
+        """Replaces the vector columns (in place, keeping the column order) by arrays or a column per element"""
+        self._require(list(sizes))
+        non_vector = [c for c in sizes if not isinstance(self.types[c], VectorUDT)]
+        if non_vector:
+            raise Exception(f"Column(s) {non_vector} are not vector columns")
+        exprs, types = OrderedDict(), {}
+        for c, column_expr in self.exprs.items():
+            if c not in sizes:
+                exprs[c], types[c] = column_expr, self.types[c]
+                continue
+            for name, expanded in get_expanded_vector_columns(c, column_expr, sizes[c], output_format).items():
+                if name != c and name in self.exprs:
+                    raise Exception(f"Column {name} for the elements of {c} already exists")
+                exprs[name] = expanded
+                types[name] = ArrayType(FloatType()) if output_format == "array" else DoubleType()
+        self.exprs, self.types = exprs, types
+        self._projected = True
+        self._pristine.difference_update(sizes)
+
+    def _apply_entry(self, entry):
+        kind, step, columns, params = entry["kind"], entry["step"], entry["columns"], entry["params"]
+        if kind == "drop_null":
+            self._apply_drop_null(columns)
+        elif kind == "fill":
+            self._apply_fill(columns, params["values"])
+        elif kind == "projection":
+            self._apply_projection(step["operation"], columns[0])
+        elif kind == "expression":
+            self._apply_expression(columns[0], params["expression"])
+        elif kind == "custom_function":
+            self._apply_custom_function(columns[0], params["function"], params["params"])
+        elif kind == "imputation":
+            self._apply_imputation(params["surrogates"])
+        elif kind == "normalization":
+            self._apply_normalization(columns[0], step["operation"], params["stats"])
+        elif kind == "vector_scaling":
+            self._apply_vector_scaling(step["operation"], columns, params["stats"])
+        elif kind == "range_filter":
+            self._apply_range_filter(params["bounds"])
+        elif kind == "clip":
+            self._apply_clip(params["bounds"])
+        elif kind == "vector_expansion":
+            self._apply_vector_expansion(params["format"], params["sizes"])
+        elif kind == "label_encoding":
+            self._require(columns)
+            self._barrier(lambda df: apply_string_indexer(df, columns[0], params["labels"]))
+            self._pristine.discard(columns[0])
+        elif kind == "one_hot_encoding":
+            self._require(columns)
+            self._barrier(lambda df: apply_one_hot_encoding(df, columns[0], params["labels"], params["categorySize"]))
+            self._pristine.discard(columns[0])
+        elif kind == "replay":
+            # steps without fitted params
+            if step["column"] == "All Columns":
+                self._barrier(lambda df: All_Column_Operations(df, step, columns, columns))
+            else:
+                self._barrier(lambda df: Column_Operations(df, step))
+            self._pristine.clear()
+            self._observe_rows()
+        else:
+            raise Exception(f"Unknown recipe step kind: {kind}")
+
+    ###################### Fitting steps
+
+    def _drop_null(self, step, columns):
+        self._require(columns)
+        # pending stats were requested before this filter, so they are computed on the unfiltered rows
+        self._resolve()
+        self._record_apply({"kind": "drop_null", "step": step, "columns": list(columns), "params": {}})
+
+    def _impute(self, step, columns, strategy):
+        """Same as Imputer(strategy) with the output in the input columns"""
+        self._require_numeric(columns)
+
+        if strategy == "mode":
+            # most frequent value needs a group by, the surrogate comes from the Imputer itself
+            self._resolve()
+            imputer = Imputer(inputCols=columns, outputCols=columns, strategy="mode").fit(self._projected_df())
+            surrogates = imputer.surrogateDF.first().asDict()
+            self._record_apply({"kind": "imputation", "step": step, "columns": columns, "params": {"surrogates": surrogates}})
+            return
+
+        known = self._get_known_stats(columns, [strategy])
+        if known is not None:
+            surrogates = {c: known[c][strategy] for c in columns}
+            self._record_apply({"kind": "imputation", "step": step, "columns": columns, "params": {"surrogates": surrogates}})
+            return
+
+        accuracy = int(1 / IMPUTER_RELATIVE_ERROR)
+        aggregations = {
+            c: F.avg(self._valid_values(c)) if strategy == "mean" else F.percentile_approx(self._valid_values(c), 0.5, accuracy)
+            for c in columns
+        }
+
+        def apply(stats, slot):
+            entry = {"kind": "imputation", "step": step, "columns": columns, "params": {"surrogates": {c: stats[c] for c in columns}}}
+            self._record_apply(entry, slot)
+
+        self._request(step, columns, aggregations, apply)
+
+    def _normalize(self, step):
+        column, method = step["column"], step["operation"]
+        self._require([column])
+        known = self._get_known_stats([column], {"Min-Max": ["min", "max"], "Z-score": ["mean", "stddev"]}.get(method, []))
+        if known is not None and known[column]:
+            self._record_apply({"kind": "normalization", "step": step, "columns": [column], "params": {"stats": known[column]}})
+            return
+        aggregations = get_normalization_aggregations(self.exprs[column], method)
+
+        def apply(stats, slot):
+            entry = {"kind": "normalization", "step": step, "columns": [column], "params": {"stats": stats}}
+            self._record_apply(entry, slot)
+
+        self._request(step, [column], aggregations, apply)
+
+    def _scale_vectors(self, step, columns):
+        method = step["operation"]
+        self._require_numeric(columns)
+        entry = {"kind": "vector_scaling", "step": step, "columns": columns, "params": {"stats": {}}}
+        if method in VECTOR_NORMS:
+            # row wise norms, nothing to fit
+            self._record_apply(entry)
+            return
+
+        # known stats without NaN (min / max / stddev would be NaN) of columns without nulls
+        known = self._get_known_stats(columns, (["min", "max"] if method == "Min-Max" else ["stddev"]) + ["nullCount"])
+        if known is not None and not any(known[c].pop("nullCount") for c in columns):
+            entry["params"]["stats"] = known
+            self._record_apply(entry)
+            return
+
+        if method == "Min-Max":
+            aggregations = {(c, stat): agg(self.exprs[c]) for c in columns for stat, agg in [("min", F.min), ("max", F.max)]}
+        else:
+            # StandardScaler uses the sample standard deviation
+            aggregations = {(c, "stddev"): F.stddev(self.exprs[c]) for c in columns}
+        # the scaler fit fails on a null or NaN (VectorAssembler), so does the step
+        aggregations[(None, "invalidRows")] = F.count(F.when(get_invalid_vector_row([self.exprs[c].cast("double") for c in columns]), 1))
+
+        def apply(stats, slot):
+            if stats.pop((None, "invalidRows")):
+                raise Exception(VECTOR_INVALID_VALUE_ERROR)
+            for (c, stat), value in stats.items():
+                entry["params"]["stats"].setdefault(c, {})[stat] = float(value) if value is not None else None
+            self._record_apply(entry, slot)
+
+        self._request(step, columns, aggregations, apply)
+
+    def _remove_outliers(self, step, columns):
+        """
+        Same as remove_outliers of processing_helper_functions, the stats of all the columns come from one aggregation
+        (batched with the pending stats of earlier steps), MAD needs one more aggregation for the deviations.
+        """
+        method, factor, mode = get_outlier_params(step)
+        self._require_numeric(columns)
+        kind = "range_filter" if mode == "remove" else "clip"
+
+        def record_bounds(stats, slot=None):
+            bounds = {}
+            for c in columns:
+                try:
+                    column_bounds = get_outlier_bounds(method, stats[c], factor)
+                except ValueError as e:
+                    raise Exception(f"{c}: {e}")
+                if column_bounds is not None:
+                    bounds[c] = column_bounds
+            params = {"method": method, "factor": factor, "bounds": bounds}
+            self._record_apply({"kind": kind, "step": step, "columns": columns, "params": params}, slot)
+
+        known_names = {"IQR": ["Q1", "Q3"], "Z-score": ["mean", "stddev"]}.get(method)
+        known = self._get_known_stats(columns, known_names) if known_names else None
+        if known is not None:
+            self._resolve()
+            if method == "IQR":
+                known = {c: {"quartiles": [known[c]["Q1"], known[c]["Q3"]]} for c in columns}
+            record_bounds(known)
+            return
+
+        aggregations = {
+            (c, name): agg for c in columns for name, agg in get_outlier_aggregations(self._valid_values(c), method).items()
+        }
+
+        def apply(stats, slot):
+            column_stats = {c: {} for c in columns}
+            for (c, name), value in stats.items():
+                column_stats[c][name] = value
+            if method == "MAD":
+                # the deviations need the medians, computed on the same rows (no step changed them since)
+                mad_aggregations = {
+                    c: ("__mad" + str(i), get_mad_aggregations(self._valid_values(c), column_stats[c]["median"])["mad"])
+                    for i, c in enumerate(columns) if column_stats[c]["median"] is not None
+                }
+                if mad_aggregations:
+                    row = self._aggregate([{"aggregations": mad_aggregations}])
+                    for c, (alias, _) in mad_aggregations.items():
+                        column_stats[c]["mad"] = row[alias]
+            record_bounds(column_stats, slot)
+
+        # clip sets the columns, remove filters the rows seen by the next steps
+        self._request(step, columns if mode == "clip" else [], aggregations, apply)
+        if mode == "remove":
+            self._resolve()
+
+    def _expand_vectors(self, step, columns):
+        """
+        Sizes of the vectors come from the ml attribute metadata of the fields, or from the first vector (a short job).
+        The "All Columns" lists follow the new columns, so later steps on All Columns use the expanded values.
+        """
+        output_format = step.get("format") or "array"
+        if output_format not in VECTOR_EXPAND_FORMATS:
+            raise Exception(f"Invalid vector expansion format: {output_format}, supported formats: {VECTOR_EXPAND_FORMATS}")
+        if not columns:
+            raise Exception("No vector columns to expand")
+        self._require(columns)
+        # vector columns come from barriers (encoding) or the input, so they are columns of self.df
+        non_vector = [c for c in columns if c not in self.df.columns or not isinstance(self.types[c], VectorUDT)]
+        if non_vector:
+            raise Exception(f"Column(s) {non_vector} are not vector columns")
+        sizes = {c: get_vector_size(self.df, c) for c in columns}
+        self._record_apply({"kind": "vector_expansion", "step": step, "columns": columns, "params": {"format": output_format, "sizes": sizes}})
+
+        if output_format == "columns":
+            for c in columns:
+                names = [f"{c}_{i}" for i in range(sizes[c])]
+                if c in self.all_columns:
+                    index = self.all_columns.index(c)
+                    self.all_columns[index:index + 1] = names
+                self.numeric_columns.extend(names)
+
+    def _encode(self, step):
+        column, operation = step["column"], step["operation"]
+        self._require([column])
+        null_check = {}
+        known = self._get_known_stats([column], ["nullCount"])
+        if known is not None:
+            null_check["nulls"] = known[column]["nullCount"]
+
+        def apply(stats, slot):
+            null_check["nulls"] = stats["nulls"]
+
+        if not null_check:
+            self._request(step, [], {"nulls": F.count(F.when(self.exprs[column].isNull(), 1))}, apply)
+        self._resolve()
+        if "nulls" not in null_check:
+            return  # the null check failed (already printed)
+        if null_check["nulls"] > 0:
+            print(f"error: Null values found in {column} column for {operation}")
+            return
+
+        self._materialize()
+        if operation == "Label Encoding":
+            params = {"labels": fit_string_indexer_labels(self.df, column)}
+            self._record_apply({"kind": "label_encoding", "step": step, "columns": [column], "params": params})
+        else:
+            labels, category_size = fit_one_hot_encoding(self.df, column)
+            params = {"labels": labels, "categorySize": category_size}
+            self._record_apply({"kind": "one_hot_encoding", "step": step, "columns": [column], "params": params})
+
+    def _all_columns_step(self, step):
+        operation = step["operation"]
+        if operation == "Drop Null":
+            self._drop_null(step, list(self.all_columns))
+        elif operation == "Fill 0 Unknown False":
+            self._record_apply({"kind": "fill", "step": step, "columns": list(self.all_columns), "params": {"values": FILL_VALUES[operation]}})
+        elif operation in ALL_COLUMNS_IMPUTATIONS:
+            self._impute(step, list(self.numeric_columns), ALL_COLUMNS_IMPUTATIONS[operation])
+        elif operation in NORMALIZATION_OPERATIONS:
+            self._scale_vectors(step, list(self.numeric_columns))
+        elif operation == "Remove Outliers":
+            self._remove_outliers(step, list(self.numeric_columns))
+        elif operation == "Drop Duplicates":
+            self._record_apply({"kind": "replay", "step": step, "columns": list(self.all_columns), "params": {}})
+        elif operation == "Expand Vector":
+            self._expand_vectors(step, [c for c in self.all_columns if isinstance(self.types.get(c), VectorUDT)])
+        else:
+            print(f"error: Operation not defined in All_Column_Operations function for {step['column']} column: {operation} \n")
+
+    def _column_step(self, step):
+        operation, column = step["operation"], step["column"]
+        if operation == "Drop Null":
+            self._drop_null(step, [column])
+        elif operation in FILL_VALUES:
+            self._record_apply({"kind": "fill", "step": step, "columns": [column], "params": {"values": FILL_VALUES[operation]}})
+        elif operation in PROJECTION_OPERATIONS:
+            self._record_apply({"kind": "projection", "step": step, "columns": [column], "params": {}})
+        elif operation == "Expression":
+            self._record_apply({"kind": "expression", "step": step, "columns": [column], "params": {"expression": step.get("expression")}})
+        elif operation == "Custom Function":
+            params = {"function": step.get("function"), "params": step.get("params") or {}}
+            self._record_apply({"kind": "custom_function", "step": step, "columns": [column], "params": params})
+        elif operation in COLUMN_IMPUTATIONS:
+            self._impute(step, [column], COLUMN_IMPUTATIONS[operation])
+        elif operation in NORMALIZATION_OPERATIONS:
+            self._normalize(step)
+        elif operation in ["Label Encoding", "One Hot Encoding"]:
+            self._encode(step)
+        elif operation == "Remove Outliers":
+            self._remove_outliers(step, [column])
+        elif operation == "Expand Vector":
+            self._expand_vectors(step, [column])
+        elif operation == "Drop Duplicates":
+            self._record_apply({"kind": "replay", "step": step, "columns": [column], "params": {}})
+        else:
+            print(f"error: Operation not defined in Column_Operations function for {step['column']} column: {operation} \n")
+
+    def run(self, operations):
+        for index, step in enumerate(operations):
+            if step["operation"] == "Exclude from All Columns list":
+                self.all_columns.remove(step['column'])
+                if step['column'] in self.numeric_columns:
+                    self.numeric_columns.remove(step['column'])
+                continue
+
+            step_lineage = get_step_lineage(step, self.numeric_columns, self.all_columns)
+            record = {"index": index, "column": step["column"], "operation": step["operation"], "status": "applied"}
+            with self._measure(record):
+                try:
+                    if step["column"] == "All Columns":
+                        self._all_columns_step(step)
+                    else:
+                        self._column_step(step)
+                except Exception as e:
+                    print_step_error(step, e)
+                    self._mark_failed(record, e)
+                    continue
+            self.rows_changed = self.rows_changed or step_lineage[0]
+            self.modified_columns |= step_lineage[1]
+            self._checkpoint(index)
+
+        # stats still pending are computed here, the final select itself runs with the write
+        with self._measure({"index": len(operations), "column": "All Columns", "operation": "Final projection", "status": "applied"}):
+            self._materialize()
+        self._current_record = None
+        print(f"Preprocessing plan: {len(operations)} steps, {self.num_aggregations} aggregation scans, {self.num_barriers} barrier steps, {self.num_checkpoints} checkpoints")
+        return self.df
+
+    def get_column_state(self):
+        """Lists of the "All Columns" operations after the run, to resume with more operations on the output (see dataset_lineage.py)"""
+        return {"allColumns": list(self.all_columns), "numericColumns": list(self.numeric_columns)}
+
+    def get_recipe(self):
+        """Fitted params of the applied steps (json), to apply the same transform on another dataset"""
+        return {
+            "recipeVersion": RECIPE_FORMAT_VERSION,
+            "inputColumns": self.input_columns,
+            "outputColumns": self.df.columns,
+            "steps": [entry for entry in self._recipe if entry is not None],
+        }
+
+    def apply_recipe(self, recipe):
+        """Transform-only pass of a recipe (see get_recipe), unlike run a failed step is an error"""
+        if recipe.get("recipeVersion") != RECIPE_FORMAT_VERSION:
+            raise Exception(f"Unsupported recipe version: {recipe.get('recipeVersion')}")
+
+        for index, entry in enumerate(recipe["steps"]):
+            step = entry["step"]
+            record = {"index": index, "column": step["column"], "operation": step["operation"], "status": "applied"}
+            with self._measure(record):
+                try:
+                    self._apply_entry(entry)
+                except Exception as e:
+                    raise Exception(f"Error in {step['operation']} operation for {step['column']} column: {str(e)}") from e
+            rows_changed, modified_columns = get_step_lineage(step, entry["columns"], entry["columns"])
+            self.rows_changed = self.rows_changed or rows_changed
+            self.modified_columns |= modified_columns
+            self._checkpoint(index)
+
+        self._current_record = None
+        self._materialize()
+        return self.df
+
+    def collect_observations(self):
+        """
+        Reads the observed row counts into the step records once, call it right after the action which writes the
+        output (Observation.get blocks until that action has computed them)
+        """
+        for record, observation in self._observations:
+            record["observedRows"] = observation.get.get("rows")
+        self._observations = []
+
+    def get_report(self, rows_in=None, rows_out=None):
+        """
+        Per step report, call it only after the output is written (observed row counts are collected by that action).
+        rowsIn / rowsOut of a step are known if the rows were counted before it (rows_in of the input, or observed after
+        a row changing step), the rows of the output are rows_out.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.finalize()
+        self.collect_observations()
+
+        rows = rows_in
+        for record in self.step_records:
+            record["rowsIn"] = rows
+            if "observedRows" in record:
+                rows = record.pop("observedRows")
+            elif record["operation"] == "Final projection":
+                rows = rows_out
+            record["rowsOut"] = rows
+
+        return {
+            "numSteps": len(self.step_records),
+            "numAggregations": self.num_aggregations,
+            "numBarriers": self.num_barriers,
+            "numCheckpoints": self.num_checkpoints,
+            "steps": self.step_records,
+        }
@@ -1,9 +1,10 @@
-from pyspark.ml.feature import Imputer, MinMaxScaler, Normalizer, StandardScaler, VectorAssembler, OneHotEncoder, StringIndexer
-from pyspark.ml.linalg import Vectors
+from pyspark.ml.feature import Imputer, MinMaxScaler, Normalizer, StandardScaler, VectorAssembler, OneHotEncoder, StringIndexer, StringIndexerModel
+from pyspark.ml.linalg import Vectors, VectorUDT
 from pyspark.ml.functions import vector_to_array
 from pyspark.sql.types import DoubleType, IntegerType, LongType, FloatType, DecimalType, StringType, BooleanType
 from pyspark.sql.functions import col, udf, lit
 from pyspark.sql import functions as F
+from utility.column_expressions import compile_expression, get_function_column
 from functools import reduce
 import math
 import time
@@ -15,91 +16,333 @@ from uuid import uuid4
     multiple executors effectively. if there is a need to change please ensure the same thing for the new code.
 """
 
+ROW_FILTER_OPERATIONS = ["Drop Null", "Drop Duplicates", "Remove Outliers"]
+
+def get_step_lineage(step, numericCols, allCols):
+    """
+    Effect of a preprocessing step on the data, used to find the columns whose values provably did not change.
+    Returns (rows_changed, modified_columns), a step which may remove rows changes the values of every column.
+    """
+    if step["operation"] == "Exclude from All Columns list":
+        return False, set()
+    if is_row_filter_step(step):
+        return True, set()
+    if step["column"] == "All Columns":
+        return False, set(allCols) if step["operation"] in ["Fill 0 Unknown False", "Expand Vector"] else set(numericCols)
+    return False, {step["column"]}
+
 def get_temp_col(base: str) -> str:
     """Generates unique temp column names using UUID"""
     return f"{base}_{uuid4().hex[:8]}"
 
+###################### Outlier detection
+
+# method: default factor (IQR: factor * IQR beyond the quartiles, Z-score: factor * stddev around the mean,
+# MAD: modified z-score |0.6745 * (x - median) / MAD| above factor)
+OUTLIER_METHODS = {"IQR": 1.5, "Z-score": 3.0, "MAD": 3.5}
+OUTLIER_MODES = ["remove", "clip"]
+OUTLIER_RELATIVE_ERROR = 0.01
+MAD_SCALE = 0.6745
+
+def get_outlier_params(step):
+    """(method, factor, mode) of a Remove Outliers step, defaults to IQR with factor 1.5 removing the rows"""
+    method = step.get("method") or "IQR"
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"Invalid outlier method: {method}, supported methods: {list(OUTLIER_METHODS)}")
+    mode = step.get("mode") or "remove"
+    if mode not in OUTLIER_MODES:
+        raise ValueError(f"Invalid outlier mode: {mode}, supported modes: {OUTLIER_MODES}")
+    factor = float(step["factor"]) if step.get("factor") is not None else OUTLIER_METHODS[method]
+    return method, factor, mode
+
+def is_row_filter_step(step):
+    """Whether the step may remove rows (Remove Outliers in clip mode only changes values)"""
+    if step["operation"] == "Remove Outliers":
+        return (step.get("mode") or "remove") == "remove"
+    return step["operation"] in ROW_FILTER_OPERATIONS
+
+def get_outlier_aggregations(column_expr, method, relative_error=OUTLIER_RELATIVE_ERROR):
+    """
+    Aggregations (stat name -> aggregate column) of column_expr for the outlier bounds, the aggregations of all the
+    columns are computed by one df.agg (percentile_approx of every column in the same pass, unlike an approxQuantile
+    call per column). MAD needs a second pass for the median of the deviations, see get_mad_aggregations.
+    """
+    accuracy = int(1 / relative_error)
+    if method == "IQR":
+        return {"quartiles": F.percentile_approx(column_expr, [0.25, 0.75], accuracy)}
+    elif method == "Z-score":
+        return {"mean": F.mean(column_expr), "stddev": F.stddev(column_expr)}
+    elif method == "MAD":
+        return {"median": F.percentile_approx(column_expr, 0.5, accuracy)}
+    return {}
+
+def get_mad_aggregations(column_expr, median, relative_error=OUTLIER_RELATIVE_ERROR):
+    return {"mad": F.percentile_approx(F.abs(column_expr - median), 0.5, int(1 / relative_error))}
+
+def get_outlier_bounds(method, stats, factor):
+    """[lower, upper] bounds from the stats of get_outlier_aggregations (and get_mad_aggregations), None if a MAD is 0"""
+    if method == "IQR":
+        if not stats.get("quartiles"):
+            raise ValueError("No values in the column to compute the quartiles")
+        q1, q3 = stats["quartiles"]
+        iqr = q3 - q1
+        return [q1 - factor * iqr, q3 + factor * iqr]
+    elif method == "Z-score":
+        if stats.get("mean") is None:
+            raise ValueError("No values in the column to compute the mean")
+        stddev = stats.get("stddev") or 0.0  # null for a single value
+        return [stats["mean"] - factor * stddev, stats["mean"] + factor * stddev]
+    elif method == "MAD":
+        if stats.get("median") is None:
+            raise ValueError("No values in the column to compute the median")
+        if not stats.get("mad"):
+            # more than half the values are equal, every other value would be an outlier
+            return None
+        spread = factor * stats["mad"] / MAD_SCALE
+        return [stats["median"] - spread, stats["median"] + spread]
+
+def get_valid_values(column_expr):
+    """Column values as double with NaN as null, as used by approxQuantile"""
+    double_expr = column_expr.cast("double")
+    return F.when(~F.isnan(double_expr), double_expr)
+
+def compute_outlier_bounds(dataframe, columns, method="IQR", factor=None, relative_error=OUTLIER_RELATIVE_ERROR):
+    """{column: [lower, upper]} of all the columns in one scan (two for MAD), columns with no bounds are left out"""
+    factor = factor if factor is not None else OUTLIER_METHODS[method]
+    values = {c: get_valid_values(F.col(f"`{c}`")) for c in columns}
+    aggregations = [
+        agg.alias(f"{i}_{name}") for i, c in enumerate(columns)
+        for name, agg in get_outlier_aggregations(values[c], method, relative_error).items()
+    ]
+    row = dataframe.agg(*aggregations).first().asDict()
+    stats = {c: {} for c in columns}
+    for key, value in row.items():
+        i, name = key.split("_", 1)
+        stats[columns[int(i)]][name] = value
+
+    if method == "MAD":
+        mad_aggregations = [
+            get_mad_aggregations(values[c], stats[c]["median"], relative_error)["mad"].alias(f"{i}_mad")
+            for i, c in enumerate(columns) if stats[c]["median"] is not None
+        ]
+        if mad_aggregations:
+            row = dataframe.agg(*mad_aggregations).first().asDict()
+            for i, c in enumerate(columns):
+                stats[c]["mad"] = row.get(f"{i}_mad")
+
+    bounds = {}
+    for c in columns:
+        try:
+            column_bounds = get_outlier_bounds(method, stats[c], factor)
+        except ValueError as e:
+            raise ValueError(f"{c}: {e}")
+        if column_bounds is not None:
+            bounds[c] = column_bounds
+    return bounds
+
+def get_clipped_column(column_expr, lower, upper):
+    """column_expr winsorized to [lower, upper], nulls and NaN stay as they are (spark orders NaN above every value)"""
+    return F.when(F.isnan(column_expr), column_expr).when(column_expr < lower, lower).when(column_expr > upper, upper).otherwise(column_expr)
+
+def remove_outliers(dataframe, columns, method="IQR", factor=None, mode="remove", relative_error=OUTLIER_RELATIVE_ERROR):
+    """
+    Detects outliers of the columns by method (OUTLIER_METHODS), the stats of all the columns come from one scan.
+    mode "remove" removes the whole row if any column has an outlier, "clip" sets the outliers to the bounds (keeps rows).
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    bounds = compute_outlier_bounds(dataframe, columns, method, factor, relative_error)
+    if not bounds:
+        return dataframe
+    if mode == "clip":
+        types = dict(dataframe.dtypes)
+        return dataframe.select([
+            get_clipped_column(F.col(f"`{c}`"), *bounds[c]).cast(types[c]).alias(c) if c in bounds else F.col(f"`{c}`")
+            for c in dataframe.columns
+        ])
+    conditions = [F.col(f"`{c}`").between(lower, upper) for c, (lower, upper) in bounds.items()]
+    return dataframe.where(reduce(lambda a, b: a & b, conditions))
+
 def remove_outlier_by_IQR(dataframe, columns, factor=1.5):
     """
     Detects and treats outliers using IQR for multiple variables in a PySpark DataFrame, 
     Removes the whole row if any column has an outlier.
 
     :param dataframe: The input PySpark DataFrame
-    :param columns: A list of columns to apply IQR outlier treatment
+    :param columns: A list of columns (or a column name) to apply IQR outlier treatment
     :param factor: The IQR factor to use for detecting outliers (default is 1.5)
     :return: The processed DataFrame with outliers treated
     """
-    conditions = []
-    for column in columns:
-        # Calculate Q1, Q3, and IQR
-        quantiles = dataframe.approxQuantile(column, [0.25, 0.75], 0.01)
-        q1, q3 = quantiles[0], quantiles[1]
-        iqr = q3 - q1
-
-        # Define the upper and lower bounds for outliers
-        lower_bound = q1 - factor * iqr
-        upper_bound = q3 + factor * iqr
-
-        conditions.append(F.col(column).between(lower_bound, upper_bound))
+    return remove_outliers(dataframe, columns, "IQR", factor)
 
-    return dataframe.where(reduce(lambda a, b: a & b, conditions))
-
-def normalize_column(df, column_name, method):
+def get_normalization_aggregations(column_expr, method):
     """
-    i) Normalizes a column in a PySpark DataFrame using specified normalization method
-    Supported methods: 'min-max', 'z-score', 'l1', 'l2', 'linf'
-    ii) It removes entire rows if any of the specified columns contains an outlier.
-    iii) I'm calculating stats multiple times as required(it seems this will cause multiple scans),
-        but a user will normalize a column only once (by any given method), so this is better, 
-        same reason for not computing stats for every column at once
+    Aggregations (stat name -> aggregate column) needed to normalize column_expr by the given method,
+    empty dict for an unsupported method. Used by normalize_column and by the preprocessing planner (which
+    computes the aggregations of many steps in one scan).
     """
+    if method == "Min-Max":
+        return {"min": F.min(column_expr), "max": F.max(column_expr)}
+    elif method == "Z-score":
+        return {"mean": F.mean(column_expr), "stddev": F.stddev(column_expr)}
+    elif method == "L1 Norm":
+        return {"abs_sum": F.sum(F.abs(column_expr))}
+    elif method == "L2 Norm":
+        return {"squared_sum": F.sum(F.pow(column_expr, 2))}
+    elif method == "L inf Norm":
+        return {"abs_max": F.max(F.abs(column_expr))}
+    return {}
 
+def get_normalized_column(column_expr, method, stats):
+    """Normalized column_expr given the stats of get_normalization_aggregations"""
     if method == "Min-Max":
-        stats = df.agg(
-            F.min(F.col(column_name)).alias('min'),
-            F.max(F.col(column_name)).alias('max')
-        ).first()
         min_val = stats['min']
         max_val = stats['max']
         
         # Handle constant column
         if (max_val - min_val) == 0:
-            return df.withColumn(column_name, F.lit(0.0))
-        return df.withColumn(column_name, (F.col(column_name) - min_val) / (max_val - min_val))
+            return F.lit(0.0)
+        return (column_expr - min_val) / (max_val - min_val)
     
     elif method == "Z-score":
-        stats = df.agg(
-            F.mean(F.col(column_name)).alias('mean'),
-            F.stddev(F.col(column_name)).alias('stddev')
-        ).first()
         mean_val = stats['mean']
         stddev_val = stats['stddev'] or 0  # Handle null for constant column
         
         if stddev_val == 0:
-            return df.withColumn(column_name, F.lit(0.0))
-        return df.withColumn(column_name, (F.col(column_name) - mean_val) / stddev_val)
+            return F.lit(0.0)
+        return (column_expr - mean_val) / stddev_val
     
     elif method == "L1 Norm":
-        abs_sum = df.agg(F.sum(F.abs(F.col(column_name)))).first()[0]
+        abs_sum = stats['abs_sum']
         if abs_sum == 0:
-            return df.withColumn(column_name, F.lit(0.0))
-        return df.withColumn(column_name, F.col(column_name) / abs_sum)
+            return F.lit(0.0)
+        return column_expr / abs_sum
     
     elif method == "L2 Norm":
-        squared_sum = df.agg(F.sum(F.pow(F.col(column_name), 2))).first()[0]
+        squared_sum = stats['squared_sum']
         if squared_sum == 0:
-            return df.withColumn(column_name, F.lit(0.0))
+            return F.lit(0.0)
         l2_norm = math.sqrt(squared_sum)
-        return df.withColumn(column_name, F.col(column_name) / l2_norm)
+        return column_expr / l2_norm
     
     elif method == "L inf Norm":
-        abs_max = df.agg(F.max(F.abs(F.col(column_name)))).first()[0]
+        abs_max = stats['abs_max']
         if abs_max == 0:
-            return df.withColumn(column_name, F.lit(0.0))
-        return df.withColumn(column_name, F.col(column_name) / abs_max)
-    
-    else:
+            return F.lit(0.0)
+        return column_expr / abs_max
+
+def normalize_column(df, column_name, method):
+    """
+    i) Normalizes a column in a PySpark DataFrame using specified normalization method
+    Supported methods: 'min-max', 'z-score', 'l1', 'l2', 'linf'
+    ii) It removes entire rows if any of the specified columns contains an outlier.
+    iii) I'm calculating stats multiple times as required(it seems this will cause multiple scans),
+        but a user will normalize a column only once (by any given method), so this is better, 
+        same reason for not computing stats for every column at once
+        (preprocess_data batches the stats of many steps through preprocessing_planner.py instead)
+    """
+    aggregations = get_normalization_aggregations(F.col(column_name), method)
+    if not aggregations:
         print(f"Unsupported normalization method: {method} for the column {column_name}")
+        return
+
+    stats = df.agg(*[agg.alias(name) for name, agg in aggregations.items()]).first()
+    return df.withColumn(column_name, get_normalized_column(F.col(column_name), method, stats))
+
+
+###################### Vector expansion
+
+# array: one array<float> column of fixed size per vector column, columns: a double column per element ({column}_{i})
+VECTOR_EXPAND_FORMATS = ["array", "columns"]
+
+def get_vector_columns(df, columns):
+    """Columns of df (in the given order) holding spark ML vectors"""
+    return [c for c in columns if c in df.columns and isinstance(df.schema[c].dataType, VectorUDT)]
+
+def get_vector_size(df, column):
+    """
+    Size of the vectors of a column, from the ml attribute metadata of the field (written by OneHotEncoder,
+    VectorAssembler) or else from the first non null vector
+    """
+    num_attrs = df.schema[column].metadata.get("ml_attr", {}).get("num_attrs")
+    if num_attrs is not None:
+        return int(num_attrs)
+    column_expr = F.col(f"`{column}`")
+    row = df.where(column_expr.isNotNull()).select(F.size(vector_to_array(column_expr)).alias("size")).first()
+    if row is None:
+        raise ValueError(f"No vectors in {column} column to get their size")
+    return row["size"]
+
+def get_expanded_vector_columns(column, column_expr, size, output_format):
+    """
+    {name: expression} replacing a vector column (dense or sparse), vector_to_array is a plain expression so all the
+    vector columns are expanded by the same projection. The array keeps its size in the field metadata (vectorSize).
+    """
+    if output_format not in VECTOR_EXPAND_FORMATS:
+        raise ValueError(f"Invalid vector expansion format: {output_format}, supported formats: {VECTOR_EXPAND_FORMATS}")
+    if output_format == "array":
+        return {column: vector_to_array(column_expr, "float32").alias(column, metadata={"vectorSize": size})}
+    array_expr = vector_to_array(column_expr)
+    return {f"{column}_{i}": array_expr[i] for i in range(size)}
+
+def expand_vector_columns(df, columns, output_format="array"):
+    """Replaces the vector columns by arrays or fixed width numeric columns (see get_expanded_vector_columns)"""
+    non_vector = [c for c in columns if c not in get_vector_columns(df, columns)]
+    if non_vector:
+        raise ValueError(f"Column(s) {non_vector} are not vector columns")
+    sizes = {c: get_vector_size(df, c) for c in columns}
+    projection = []
+    for c in df.columns:
+        if c in sizes:
+            projection.extend(e.alias(name) for name, e in get_expanded_vector_columns(c, F.col(f"`{c}`"), sizes[c], output_format).items())
+        else:
+            projection.append(F.col(f"`{c}`"))
+    return df.select(projection)
+
+
+def fit_string_indexer_labels(df, column):
+    """Labels (categories ordered by frequency) of a StringIndexer fitted on the column"""
+    return StringIndexer(inputCol=column, outputCol=get_temp_col("features")).fit(df).labels
+
+def apply_string_indexer(df, column, labels):
+    """Replaces the column with its index in labels (a category not in labels is an error)"""
+    temp_col1 = get_temp_col("features")
+    indexer = StringIndexerModel.from_labels(labels, inputCol=column, outputCol=temp_col1)
+    df = indexer.transform(df)
+    return df.withColumn(column, col(temp_col1)).drop(temp_col1)
+
+def fit_one_hot_encoding(df, column):
+    """
+    Returns (labels, category_size) of one hot encoding: labels of the string indexer for a string column (None otherwise)
+    and the number of categories found by the encoder
+    """
+    labels = None
+    if isinstance(df.schema[column].dataType, StringType):
+        labels = fit_string_indexer_labels(df, column)
+        df = apply_string_indexer(df, column, labels)
+    encoder = OneHotEncoder(inputCol=column, outputCol=get_temp_col("features"))
+    return labels, encoder.fit(df).categorySizes[0]
+
+def apply_one_hot_encoding(df, column, labels, category_size):
+    """One hot encoding with known labels and category size (no scan to fit)"""
+    # this gives sparse vector, which if not compatible with ML model then have to encode in dense vectors
+    if labels is not None:
+        df = apply_string_indexer(df, column, labels)
+
+    # fitting on a single row with the largest category gives the same encoder
+    temp_col1 = get_temp_col("features")
+    category_df = df.sparkSession.createDataFrame([(float(category_size - 1),)], [column])
+    encoder = OneHotEncoder(inputCol=column, outputCol=temp_col1).fit(category_df)
+    df = encoder.transform(df)
+    return df.withColumn(column, col(temp_col1)).drop(temp_col1)
+
+def label_encode(df, column):
+    """Label encoding of a column (without null check, the column should not have nulls)"""
+    return apply_string_indexer(df, column, fit_string_indexer_labels(df, column))
+
+def one_hot_encode(df, column):
+    """One hot encoding of a column (without null check, the column should not have nulls)"""
+    labels, category_size = fit_one_hot_encoding(df, column)
+    return apply_one_hot_encoding(df, column, labels, category_size)
 
 
 def All_Column_Operations(df, step, numericCols, allCols):
@@ -149,7 +392,10 @@ def All_Column_Operations(df, step, numericCols, allCols):
 
         
     elif step["operation"] == "Remove Outliers":
-        return remove_outlier_by_IQR(df, numericCols)
+        return remove_outliers(df, numericCols, *get_outlier_params(step))
+
+    elif step["operation"] == "Expand Vector":
+        return expand_vector_columns(df, get_vector_columns(df, allCols), step.get("format") or "array")
     else:
         print(f"error: Operation not defined in All_Column_Operations function for {step['column']} column: {step['operation']} \n")
         return df
@@ -178,13 +424,16 @@ def Column_Operations(df,step):
         return df.fillna('Unknown',subset=column)
 
     elif step["operation"] == "Fill False":
-        df = df.fillna(False,subset=column)
+        return df.fillna(False,subset=column)
 
     elif step["operation"] in ["L1 Norm", "L2 Norm", "L inf Norm", "Min-Max", "Z-score"]:
         return normalize_column(df,column,step["operation"])
         
     elif step["operation"] == "Remove Outliers":
-        return remove_outlier_by_IQR(df, column)
+        return remove_outliers(df, [column], *get_outlier_params(step))
+
+    elif step["operation"] == "Expand Vector":
+        return expand_vector_columns(df, [column], step.get("format") or "array")
 
     elif step["operation"] == "Log":
         return df.withColumn(column, F.log(F.col(column)))
@@ -195,34 +444,27 @@ def Column_Operations(df,step):
     elif step["operation"] == "Square Root":
         return df.withColumn(column, F.sqrt(F.col(column)))
 
+    elif step["operation"] == "Expression":
+        return df.withColumn(column, compile_expression(step.get("expression"), column, lambda c: F.col(f"`{c}`")))
+
+    elif step["operation"] == "Custom Function":
+        return df.withColumn(column, get_function_column(step.get("function"), step.get("params"), F.col(f"`{column}`"))[0])
+
     elif step["operation"] == "Label Encoding":
 
         if df.filter(col(column).isNull()).count() > 0:
             print(f"error: Null values found in {column} column for Label Encoding")
             return df
         
-        temp_col1 = get_temp_col("features")
-        indexer = StringIndexer(inputCol=column, outputCol=temp_col1)
-        df = indexer.fit(df).transform(df)
-        return df.withColumn(column, col(temp_col1)).drop(temp_col1)
+        return label_encode(df, column)
 
     elif step["operation"] == "One Hot Encoding":
-        # this gives sparse vector, which if not compatible with ML model then have to encode in dense vectors
         
         if df.filter(col(column).isNull()).count() > 0:
             print(f"error: Null values found in {column} column for One Hot Encoding")
             return df
         
-        temp_col1 = get_temp_col("features")
-        # check if column is string type
-        if isinstance(df.schema[column].dataType, StringType):
-            indexer = StringIndexer(inputCol=column, outputCol=temp_col1)  
-            df = indexer.fit(df).transform(df)
-            df = df.withColumn(column, col(temp_col1)).drop(temp_col1)
-       
-        encoder = OneHotEncoder(inputCol=column,outputCol=temp_col1)
-        df = encoder.fit(df).transform(df)
-        return df.withColumn(column, col(temp_col1)).drop(temp_col1)
+        return one_hot_encode(df, column)
         
     else:
         print(f"error: Operation not defined in Column_Operations function for {step['column']} column: {step['operation']} \n")
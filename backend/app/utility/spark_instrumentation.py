@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+from utility.job_manager import get_current_job
+from urllib.request import urlopen
+from uuid import uuid4
+import json
+import time
+
+
+"""
+    Instrumentation of spark jobs (preprocessing steps, writes, overviews):
+    i) every measured block runs in its own spark job group, so the jobs it triggered are known from the status tracker
+    ii) stages of the jobs give the task counts, and the stage metrics (input, shuffle read/write) come from the REST API
+        of the spark ui (skipped if the ui is disabled or not reachable)
+    iii) a block measures the jobs triggered inside it, a step whose stats are computed later (batched by
+        PreprocessingPlanner) has its jobs counted in the block that computed them (see resolvedSteps in the report)
+"""
+
+STAGE_METRICS = ["inputBytes", "inputRecords", "outputBytes", "outputRecords", "shuffleReadBytes", "shuffleReadRecords",
+                 "shuffleWriteBytes", "shuffleWriteRecords", "executorRunTime"]
+SPARK_UI_TIMEOUT = 5
+
+
+class SparkJobInstrumentation:
+    """
+    Usage:
+        instrumentation = SparkJobInstrumentation(spark, "preprocess")
+        with instrumentation.measure("Step 0: Drop Null on col1", record):
+            ... spark actions ...
+        instrumentation.finalize()  # after all the actions, adds stage ids and metrics to the records
+    """
+    def __init__(self, spark, job_name):
+        self.sc = spark.sparkContext
+        self.job_name = f"{job_name}-{uuid4().hex[:8]}"
+        self.records = []
+        self.start_time = time.time()
+
+    @contextmanager
+    def measure(self, label, record=None):
+        record = record if record is not None else {}
+        record["label"] = label
+        group_id = f"{self.job_name}-{len(self.records)}"
+        self.records.append(record)
+
+        previous_group = self.sc.getLocalProperty("spark.jobGroup.id")
+        previous_description = self.sc.getLocalProperty("spark.job.description")
+        # the block runs in its own group, added to the background job (if any) so cancelling the job cancels it
+        job = get_current_job()
+        if job is not None:
+            job.raise_if_cancelled()
+            job.add_spark_group(group_id, label)
+        self.sc.setJobGroup(group_id, label, interruptOnCancel=True)
+        t1 = time.time()
+        try:
+            yield record
+        finally:
+            record["wallTime"] = round(time.time() - t1, 3)
+            record["jobIds"] = sorted(self.sc.statusTracker().getJobIdsForGroup(group_id))
+            self.sc.setLocalProperty("spark.jobGroup.id", previous_group)
+            self.sc.setLocalProperty("spark.job.description", previous_description)
+
+    def _get_stage_metrics(self, stage_id):
+        """Metrics of all attempts of a stage from the spark ui REST API, None if not available"""
+        if not self.sc.uiWebUrl:
+            return None
+        try:
+            url = f"{self.sc.uiWebUrl}/api/v1/applications/{self.sc.applicationId}/stages/{stage_id}"
+            with urlopen(url, timeout=SPARK_UI_TIMEOUT) as response:
+                attempts = json.loads(response.read())
+            return {metric: sum(attempt.get(metric, 0) for attempt in attempts) for metric in STAGE_METRICS}
+        except Exception as e:
+            print(f"Stage metrics of stage {stage_id} not available: {e}")
+            return None
+
+    def finalize(self):
+        """Adds stages, task counts and stage metrics (summed over the stages) of the jobs to every record"""
+        tracker = self.sc.statusTracker()
+        for record in self.records:
+            stage_ids = []
+            for job_id in record.get("jobIds", []):
+                job_info = tracker.getJobInfo(job_id)
+                if job_info is not None:
+                    stage_ids.extend(job_info.stageIds)
+            record["stageIds"] = sorted(set(stage_ids))
+
+            num_tasks, metrics = 0, {metric: 0 for metric in STAGE_METRICS}
+            metrics_available = True
+            for stage_id in record["stageIds"]:
+                stage_info = tracker.getStageInfo(stage_id)
+                num_tasks += stage_info.numTasks if stage_info is not None else 0
+                stage_metrics = self._get_stage_metrics(stage_id) if metrics_available else None
+                if stage_metrics is None:
+                    metrics_available = False
+                    continue
+                for metric in STAGE_METRICS:
+                    metrics[metric] += stage_metrics[metric]
+
+            record["numTasks"] = num_tasks
+            record.update(metrics if metrics_available else {metric: None for metric in STAGE_METRICS})
+        return self.records
+
+    def total_time(self):
+        return round(time.time() - self.start_time, 3)
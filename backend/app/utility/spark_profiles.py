@@ -0,0 +1,90 @@
+from pyspark.sql.types import ArrayType, BinaryType
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+SPARK_PROFILE = os.getenv("SPARK_PROFILE")  # forces a profile for every job, chosen by the input otherwise (checked at import)
+SPARK_LARGE_INPUT_MB = float(os.getenv("SPARK_LARGE_INPUT_MB", 10 * 1024))
+SPARK_WIDE_TABLE_COLUMNS = int(os.getenv("SPARK_WIDE_TABLE_COLUMNS", 500))
+
+"""
+    SQL configuration profiles of the jobs. Every job runs on its own spark.newSession() of the shared session
+    (SparkSessionManager.job_session): same SparkContext (executors, cached data), but its own SQL conf, so a profile
+    is applied per job without restarting the session and doesn't change the other running jobs.
+    Only runtime SQL settings can be set this way, static settings (executor / driver memory, packages) are set when the
+    shared session is created (env, see spark_services.py).
+
+    Profile of a job (select_spark_profile), the first that matches:
+        image: a binary or nested array column, or a column named image (big rows, small batches)
+        wide-table: at least SPARK_WIDE_TABLE_COLUMNS columns (smaller reader batches and input splits)
+        large: input of at least SPARK_LARGE_INPUT_MB (more shuffle partitions, skew join handling), the input of an
+            incremental run is the new partitions plus the processed dataset they are appended to
+        small: anything else (few shuffle partitions, no 200 tiny tasks for a small csv)
+"""
+
+COMMON_CONF = {
+    "spark.sql.adaptive.enabled": "true",
+    "spark.sql.adaptive.coalescePartitions.enabled": "true",
+    "spark.sql.execution.arrow.pyspark.enabled": "true",
+    "spark.sql.execution.arrow.pyspark.fallback.enabled": "true",
+}
+
+SPARK_PROFILES = {
+    "small": {
+        "spark.sql.shuffle.partitions": "16",
+        "spark.sql.adaptive.skewJoin.enabled": "false",
+        "spark.sql.autoBroadcastJoinThreshold": str(10 * 1024 * 1024),
+    },
+    "large": {
+        "spark.sql.shuffle.partitions": "400",
+        "spark.sql.adaptive.skewJoin.enabled": "true",
+        "spark.sql.adaptive.advisoryPartitionSizeInBytes": str(128 * 1024 * 1024),
+        "spark.sql.autoBroadcastJoinThreshold": str(64 * 1024 * 1024),
+        "spark.sql.files.maxPartitionBytes": str(256 * 1024 * 1024),
+    },
+    "wide-table": {
+        "spark.sql.shuffle.partitions": "200",
+        "spark.sql.adaptive.skewJoin.enabled": "true",
+        "spark.sql.parquet.columnarReaderBatchSize": "1024",
+        "spark.sql.files.maxPartitionBytes": str(64 * 1024 * 1024),
+    },
+    "image": {
+        "spark.sql.shuffle.partitions": "200",
+        "spark.sql.adaptive.skewJoin.enabled": "true",
+        "spark.sql.execution.arrow.maxRecordsPerBatch": "256",
+        "spark.sql.parquet.columnarReaderBatchSize": "256",
+        "spark.sql.files.maxPartitionBytes": str(32 * 1024 * 1024),
+    },
+}
+
+if SPARK_PROFILE and SPARK_PROFILE not in SPARK_PROFILES:
+    raise ValueError(f"Invalid SPARK_PROFILE: {SPARK_PROFILE}, profiles: {list(SPARK_PROFILES)}")
+
+def is_image_schema(schema):
+    for field in schema.fields:
+        if field.name.lower() == "image" or isinstance(field.dataType, BinaryType):
+            return True
+        if isinstance(field.dataType, ArrayType) and isinstance(field.dataType.elementType, ArrayType):
+            return True
+    return False
+
+def select_spark_profile(input_size=None, schema=None):
+    """Name of the profile of a job from the size (bytes, None if unknown) and schema of its input"""
+    if SPARK_PROFILE:
+        return SPARK_PROFILE
+    if schema is not None and is_image_schema(schema):
+        return "image"
+    if schema is not None and len(schema.fields) >= SPARK_WIDE_TABLE_COLUMNS:
+        return "wide-table"
+    if input_size is not None and input_size >= SPARK_LARGE_INPUT_MB * 1024 * 1024:
+        return "large"
+    return "small"
+
+def apply_spark_profile(session, profile):
+    """Sets the SQL conf of the profile on a job session (runtime settings, effective for its next queries)"""
+    if profile not in SPARK_PROFILES:
+        raise ValueError(f"Unknown spark profile: {profile}, profiles: {list(SPARK_PROFILES)}")
+    for key, value in {**COMMON_CONF, **SPARK_PROFILES[profile]}.items():
+        session.conf.set(key, value)
+    return profile
@@ -1,16 +1,31 @@
 from pyspark.sql import SparkSession
+from pyspark import SparkContext
+from pyspark import StorageLevel
 from dotenv import load_dotenv
-from pyspark.sql.functions import col, size, count, expr, mean, stddev, min, max, rand, lit, rank, when
-from pyspark.sql.types import NumericType, StringType, ArrayType
-import numpy as np
-from utility.processing_helper_functions import All_Column_Operations, Column_Operations
+from pyspark.sql.functions import col, rand, when, input_file_name, sum as spark_sum
+from pyspark.sql import Observation
+from utility.preprocessing_planner import PreprocessingPlanner, to_json_value
+from utility.spark_instrumentation import SparkJobInstrumentation
+from utility.lineage_checkpoints import LineageCheckpointer
+from utility.parquet_writer import write_parquet
+from utility.dataset_readers import read_dataset, read_lines, get_file_suffix, is_compressed_file
+from utility.overview_cache import overview_stats_cache
+from utility.overview_helper_functions import (
+    compute_overview, compute_preview_stats, attach_sample_bounds, attach_prefix_sample, compute_file_totals, overview_from_parquet_footers, merge_overviews
+)
+from utility.spark_profiles import select_spark_profile, apply_spark_profile
+from utility.job_manager import get_current_job, add_job_output
 from utility.hdfs_services import HDFSServiceManager
+from contextlib import nullcontext, contextmanager
 import threading
+import random
+import math
 import time
 import os
 import time
 import json
 import uuid
+from urllib.parse import urlparse
 
 load_dotenv()
 hdfs_client = HDFSServiceManager()
@@ -22,19 +37,47 @@ HDFS_PROCESSED_DATASETS_DIR = os.getenv("HDFS_PROCESSED_DATASETS_DIR")
 HDFS_FILE_READ_URL = f"hdfs://{HDFS_NAME_NODE_URL}/user/{HADOOP_USER_NAME}"
 RECENTLY_UPLOADED_DATASETS_DIR = os.getenv("RECENTLY_UPLOADED_DATASETS_DIR")
 SPARK_MASTER_URL = os.getenv("SPARK_MASTER_URL")
+SPARK_SESSION_IDLE_TTL = float(os.getenv("SPARK_SESSION_IDLE_TTL", 300))  # seconds a released session is kept warm
+SPARK_JARS_PACKAGES = os.getenv("SPARK_JARS_PACKAGES")  # e.g. org.apache.spark:spark-avro_2.12:3.5.1 for avro uploads
+SPARK_DRIVER_MEMORY = os.getenv("SPARK_DRIVER_MEMORY")
+SPARK_EXECUTOR_MEMORY = os.getenv("SPARK_EXECUTOR_MEMORY")
 BUCKET_NAME = os.getenv("BUCKET_NAME")  # "qpd-data"  
 S3_PREFIX = os.getenv("S3_PREFIX")  # "temp"  
+PREVIEW_SAMPLE_ROWS = int(os.getenv("PREVIEW_SAMPLE_ROWS", 1000))
+PREVIEW_TIME_BUDGET = float(os.getenv("PREVIEW_TIME_BUDGET", 2))  # seconds
+# least / most bytes read from the start of a single csv / json lines upload for its preview overview (the prefix is
+# read into the driver memory)
+PREVIEW_PREFIX_MIN_BYTES = int(os.getenv("PREVIEW_PREFIX_MIN_BYTES", 1024 * 1024))
+PREVIEW_PREFIX_MAX_BYTES = int(os.getenv("PREVIEW_PREFIX_MAX_BYTES", 64 * 1024 * 1024))
+PREVIEW_SAMPLE_SEED = 42  # same sample (rows or files) for every preview of a dataset
+PREVIEW_FILE_COLUMN = "__preview_file"
+PREVIEW_TIMEOUT = float(os.getenv("PREVIEW_TIMEOUT", 120))  # seconds, the spark jobs of a longer preview are cancelled
 
 # to see the docker hostname if running inside the docker container
 # import socket
 # host_ip = socket.gethostbyname(socket.gethostname())
 # print(f"Host IP of docker comtainer: {host_ip}")
 
+def get_raw_write_filename(filename, filetype):
+    """
+    Name of the raw dataset (in HDFS_RAW_DATASETS_DIR) created from an uploaded file (with __PROCESSING__ suffix),
+    the suffix of any other format than parquet is replaced by .parquet (data.csv.gz -> data.parquet)
+    """
+    filename = filename.replace("__PROCESSING__", "")
+    suffix = get_file_suffix(filename)
+    if filetype == "parquet" or suffix is None:
+        return filename
+    return filename[:-len(suffix)] + ".parquet"
+
 class SparkSessionManager:
     """
     Thread-safe singleton SparkSession manager with reference counting.
     Creates a new SparkSession object if not already created, and returns an active session if there is (for threads).
     This is thread safe implementation, and not process safe (pyspark limitation).
+
+    The session is kept warm for SPARK_SESSION_IDLE_TTL seconds after the last job releases it (0 stops it right
+    away), so the next job doesn't pay the JVM / executors startup. Every __enter__ checks the health of the kept
+    session and recreates it if the driver is gone (stopped by spark, or the JVM died).
     """
     # Class variables 
     _instance = None
@@ -42,6 +85,9 @@ class SparkSessionManager:
     _session = None
     _reference_count = 0
     _config_lock = threading.Lock()  
+    _idle_timer = None
+    _released_at = None
+    _num_sessions_created = 0
 
     def __new__(cls, app_name="default_app", master=SPARK_MASTER_URL):
         with cls._lock:
@@ -53,25 +99,164 @@ class SparkSessionManager:
 
     # Context Manager for SparkSession creation
     def __enter__(self):
+        cls = type(self)
+        # lock order: _config_lock then _lock (same as the idle timer)
         with self._config_lock:
+            if cls._session is not None and not self._is_healthy(cls._session):
+                print("Spark session is not healthy, recreating it...")
+                self._discard_session()
             # Double-checked locking pattern
-            if self._session is None:
-                self._session = SparkSession.builder.master(self.master).appName(self.app_name).getOrCreate()                   
+            if cls._session is None:
+                builder = SparkSession.builder.master(self.master).appName(self.app_name)
+                # static settings, the SQL settings of a job are set on its own session (see job_session)
+                for key, value in [("spark.jars.packages", SPARK_JARS_PACKAGES), ("spark.driver.memory", SPARK_DRIVER_MEMORY), ("spark.executor.memory", SPARK_EXECUTOR_MEMORY)]:
+                    if value:
+                        builder = builder.config(key, value)
+                cls._session = builder.getOrCreate()
+                cls._num_sessions_created += 1
                 print("Spark session created...")  
                 # # for standalone cluster (will not use YARN as resource manager)
                 # spark = SparkSession.builder.remote("sc://localhost:8080").getOrCreate() 
 
-        with self._lock:
-            self._reference_count += 1
-        return self._session
+            with self._lock:
+                cls._reference_count += 1
+                cls._released_at = None
+                if cls._idle_timer is not None:
+                    cls._idle_timer.cancel()
+                    cls._idle_timer = None
+            return cls._session
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        cls = type(self)
         with self._lock:
-            self._reference_count -= 1
-            if self._reference_count == 0:
-                self._session.stop()
-                self._session = None
+            cls._reference_count -= 1
+            if cls._reference_count > 0 or cls._session is None:
+                return
+            if SPARK_SESSION_IDLE_TTL <= 0:
+                cls._session.stop()
+                cls._session = None
                 print("Spark session stopped...")
+                return
+            # kept warm, stopped by the timer if no job takes it meanwhile
+            cls._released_at = time.monotonic()
+            cls._idle_timer = threading.Timer(SPARK_SESSION_IDLE_TTL, self._stop_if_idle)
+            cls._idle_timer.daemon = True
+            cls._idle_timer.start()
+
+    def _stop_if_idle(self):
+        cls = type(self)
+        with self._config_lock, self._lock:
+            if cls._session is None or cls._reference_count > 0 or cls._released_at is None:
+                return
+            if time.monotonic() - cls._released_at < SPARK_SESSION_IDLE_TTL:
+                return
+            try:
+                cls._session.stop()
+            except Exception as e:
+                print(f"Error stopping the idle spark session: {e}")
+            cls._session = None
+            cls._idle_timer = None
+            cls._released_at = None
+            print(f"Spark session stopped after {SPARK_SESSION_IDLE_TTL}s idle...")
+
+    @staticmethod
+    def _is_healthy(session):
+        """The driver (JVM and SparkContext) of the session is alive, a py4j call that doesn't run any job"""
+        try:
+            return not session.sparkContext._jsc.sc().isStopped()
+        except Exception as e:
+            print(f"Spark session health check failed: {e}")
+            return False
+
+    def _discard_session(self):
+        """Forgets a dead session, so that getOrCreate builds a new driver instead of returning the dead one"""
+        cls = type(self)
+        try:
+            cls._session.stop()
+        except Exception as e:
+            print(f"Error stopping the unhealthy spark session: {e}")
+        # pyspark keeps the gateway and the active context / session in class variables, a dead JVM needs a new gateway
+        try:
+            SparkContext._jvm.java.lang.System.currentTimeMillis()
+        except Exception:
+            SparkContext._gateway = None
+            SparkContext._jvm = None
+        SparkContext._active_spark_context = None
+        SparkSession._instantiatedSession = None
+        SparkSession._activeSession = None
+        cls._session = None
+
+    def health_check(self):
+        """State of the kept session (without creating one), for monitoring"""
+        cls = type(self)
+        with self._lock:
+            session, reference_count, released_at = cls._session, cls._reference_count, cls._released_at
+        status = {
+            "active": session is not None,
+            "healthy": None,
+            "referenceCount": reference_count,
+            "idleSeconds": round(time.monotonic() - released_at, 1) if released_at is not None else None,
+            "idleTtlSeconds": SPARK_SESSION_IDLE_TTL,
+            "sessionsCreated": cls._num_sessions_created,
+        }
+        if session is not None:
+            status["healthy"] = self._is_healthy(session)
+            if status["healthy"]:
+                status["applicationId"] = session.sparkContext.applicationId
+                status["sparkVersion"] = session.version
+        return status
+
+    @contextmanager
+    def job_session(self, timeout=None):
+        """
+        Session of a job: spark.newSession() of the shared session, it shares the SparkContext (executors, cached data)
+        but has its own SQL conf, temp views and UDFs, so the profile of a job (see _apply_profile) doesn't change the
+        settings of the other jobs running on the shared session. Inside a background job its spark jobs run in the
+        job group of the job. Outside of a job (synchronous requests) they run in a job group of their own, cancelled
+        after timeout seconds (if given), then TimeoutError is raised.
+        """
+        with self as spark:
+            session = spark.newSession()
+            sc = session.sparkContext
+            job = get_current_job()
+            timer = None
+            if job is not None:
+                # spark jobs of a background job run in its job group (cancelled with the job, see job_manager.py)
+                job.raise_if_cancelled()
+                sc.setJobGroup(job.spark_group, f"{job.kind} job {job.job_id}", interruptOnCancel=True)
+            else:
+                group = f"request-{uuid.uuid4().hex[:12]}"
+                sc.setJobGroup(group, "synchronous request", interruptOnCancel=True)
+                if timeout:
+                    timer = threading.Timer(timeout, sc.cancelJobGroup, (group,))
+                    timer.daemon = True
+                    timer.start()
+            try:
+                yield session
+            except Exception as e:
+                # finished is only set by a timer which ran (it's cancelled below)
+                if timer is not None and timer.finished.is_set():
+                    raise TimeoutError(f"Spark jobs cancelled after {timeout:g} seconds") from e
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                sc.setLocalProperty("spark.jobGroup.id", None)
+                sc.setLocalProperty("spark.job.description", None)
+
+    def _apply_profile(self, spark, df, hdfs_path=None, input_size=None):
+        """
+        Applies the configuration profile chosen by the size (of hdfs_path, or input_size in bytes) and schema of the
+        input, returns its name
+        """
+        if hdfs_path is not None and input_size is None:
+            try:
+                input_size = hdfs_client.get_size(hdfs_path)
+            except Exception as e:
+                print(f"Input size not available for the spark profile: {e}")
+        profile = apply_spark_profile(spark, select_spark_profile(input_size, df.schema))
+        print(f"Spark profile {profile} for {hdfs_path or 'the job'} ({input_size} bytes, {len(df.columns)} columns)")
+        return profile
 
     @classmethod
     def get_active_session(cls):
@@ -92,207 +277,96 @@ class SparkSessionManager:
 
     def spark_session_cleanup(self):
         """Stop the spark session and reset the reference count."""
+        cls = type(self)
         with self._lock:
-            self._reference_count = 0
-            self._session.stop()
-            self._session = None
-
-    def _get_overview(self, df):
+            cls._reference_count = 0
+            if cls._idle_timer is not None:
+                cls._idle_timer.cancel()
+                cls._idle_timer = None
+            if cls._session is not None:
+                cls._session.stop()
+            cls._session = None
+
+    def _get_overview(self, df, mode="exact", relative_error=0.05):
         """
         Get an overview of the dataset given pyspark dataframe.
+        All columns are profiled together in a fixed number of passes (see overview_helper_functions.py)
+        mode: "exact" or "approx" (HyperLogLog unique counts with relative_error)
         """
         if not df:
             return {"message": "Dataset not found."}
         
-        overview = None
-        column_stats = []
-        for column in df.columns:
-            try:
-                column_expr = col(f"`{column}`") #useful if col name contains special characters or spaces
-                column_type = df.schema[column].dataType
-                num_rows = df.select(column_expr).count()
-                stats = {"name": column, "type": str(column_type), "entries": num_rows}
-                
-                # Common statistics for all columns 
-                stats["nullCount"] = df.filter(column_expr.isNull()).count()
-                
-                # Column specific statistics
-                NumberTypes = ["IntegerType()", "DoubleType()", "FloatType()", "LongType()"]
-                if str(column_type) in NumberTypes:
-                    summary = df.select(
-                        mean(column_expr).alias("mean"),
-                        stddev(column_expr).alias("stddev"),
-                        min(column_expr).alias("min"),
-                        max(column_expr).alias("max")
-                    ).first()
-                    stats.update({
-                        "mean": summary["mean"],
-                        "stddev": summary["stddev"],
-                        "min": summary["min"],
-                        "max": summary["max"],
-                        "uniqueCount": df.select(column_expr).distinct().count()
-                    })
-                    
-                    # Quartile calculation
-                    quantiles = df.approxQuantile(column, [0.25, 0.5, 0.75], 0.05)
-                    stats["quartiles"] = {
-                        "Q1": quantiles[0],
-                        "median": quantiles[1],
-                        "Q3": quantiles[2],
-                        "IQR": quantiles[2] - quantiles[0]
-                    }
-                    
-                    # Histogram binning
-                    min_val = summary["min"]
-                    max_val = summary["max"]
-                    bin_width = (max_val - min_val) / 10
-                    bins = [min_val + i * bin_width for i in range(11)]
-                    histogram = (
-                        df.select(column_expr)
-                        .rdd.flatMap(lambda x: x)
-                        .histogram(bins)
-                    )
-                    stats["histogram"] = {
-                        "bins": histogram[0],
-                        "counts": histogram[1]
-                    }
-
-                # String columns
-                elif "StringType" in str(column_type):
-                    stats["uniqueCount"] = df.select(column_expr).distinct().count()
-                    
-                    # Frequency distribution for top 10 categories
-                    top_categories = (
-                        df.groupBy(column_expr)
-                        .count()
-                        .orderBy(col("count").desc())
-                        .limit(10)
-                        .collect()
-                    )
-
-                    stats["topCategories"] = [
-                        {   "value": row[column][:50] + "..." if isinstance(row[column], str) and len(row[column]) > 50 else row[column],
-                            "count": row["count"]
-                        }
-                        for row in top_categories
-                    ]
-                
-                elif "ArrayType" in str(column_type):
-                    # Get first non-null entry
-                    row = df.select(column_expr).filter(col(column).isNotNull()).limit(1).first()
-                    arr = row[column] if row else None
-                
-                    # Infer shape
-                    shape = []
-                    temp = arr
-                    while isinstance(temp, list):
-                        shape.append(len(temp))
-                        if len(temp) == 0:
-                            break
-                        temp = temp[0] if isinstance(temp[0], list) else None
-                    stats["Shape"] = tuple(shape) if shape else None
-                    
-                
-                    # Length Distribution (top level)
-                    length_stats = df.select(size(col(column)).alias("len")) \
-                        .summary("count", "min", "max", "mean", "stddev") \
-                        .toPandas().set_index("summary").to_dict()["len"]
-                
-                    stats["LengthStats"] = {
-                        "min": int(length_stats.get("min", 0)),
-                        "max": int(length_stats.get("max", 0)),
-                        "mean": float(length_stats.get("mean", 0)),
-                        "std": float(length_stats.get("stddev", 0))
-                    }
-                
-                    # Check if inner elements are numeric — if so, calculate value statistics
-                    def flatten_all(x):
-                        """Recursively flatten list to 1D"""
-                        if isinstance(x, list):
-                            for i in x:
-                                yield from flatten_all(i)
-                        else:
-                            yield x
-                
-                    if row and isinstance(row[column], list):
-                        flat_sample = list(flatten_all(row[column]))
-                        if flat_sample and isinstance(flat_sample[0], (int, float)):
-                            # Only compute value-level stats if numeric
-                            # Use RDD for optimized distributed stat collection
-                            rdd = df.select(column_expr).rdd \
-                                .filter(lambda row: row[column] is not None) \
-                                .flatMap(lambda row: flatten_all(row[column]) if row[column] else [])
-                
-                            try:
-                                num_samples = int(np.minimum(num_rows * 0.2, 100000))
-                                stats["sampleSize"] = f"{int(np.minimum(num_rows * 0.2, 100000))} samples"
-                                sampled = rdd.take(num_samples)  # Safe sample
-                                
-                                if sampled:
-                                    arr_np = np.array(sampled)
-                                    stats["valueStats"] = {
-                                        "min": float(np.min(arr_np)),
-                                        "max": float(np.max(arr_np)),
-                                        "mean": float(np.mean(arr_np)),
-                                        "std": float(np.std(arr_np)),
-                                        "median": float(np.median(arr_np)),
-                                        "sparsity": float(np.mean(arr_np == 0))  # Fraction of zeros
-                                    }
-                            except Exception as e:
-                                stats["valueStats"] = None
-                        else:
-                            stats["valueStats"] = "Not numeric"
-                    else:
-                        stats["valueStats"] = "Not detected"
+        return compute_overview(df, mode, relative_error)
 
-                # Add the column stats to the list
-                column_stats.append(stats)
-            except Exception as e:
-                print(f"Error processing column {column}: {e}")
-                continue
-
-        # Dataset overview Dict
-        overview = {
-            "numRows": df.count(),
+    def _get_cached_overview(self, df, input_fingerprint, unchanged_columns, mode="exact", relative_error=0.05):
+        """
+        Overview of df where the stats of unchanged_columns (same values as in the data with input_fingerprint)
+        are served from the overview cache, only the remaining columns are profiled.
+        """
+        cached = {}
+        num_rows = None
+        for column in unchanged_columns:
+            entry = overview_stats_cache.get_column(input_fingerprint, column, str(df.schema[column].dataType), mode, relative_error)
+            if entry is not None:
+                cached[column], num_rows = entry
+
+        profiled = {}
+        to_profile = [c for c in df.columns if c not in cached]
+        if to_profile:
+            overview = self._get_overview(df.select([col(f"`{c}`") for c in to_profile]), mode, relative_error)
+            profiled = {stats["name"]: stats for stats in overview["columnStats"]}
+            num_rows = overview["numRows"]
+        print(f"Overview: {len(cached)} columns served from cache, {len(to_profile)} columns profiled")
+
+        return {
+            "numRows": num_rows if num_rows is not None else df.count(),
             "numColumns": len(df.columns),
-            "columnStats": column_stats
+            "overviewMode": mode,
+            "relativeError": relative_error,
+            "columnStats": [cached[c] if c in cached else profiled[c] for c in df.columns if c in cached or c in profiled]
         }
 
-        return overview
-
-    async def create_new_dataset(self, filename, filetype):
+    async def create_new_dataset(self, filename, filetype, overview_mode="exact", relative_error=0.05, with_overview=True, layout=None, read_options=None):
         """
         Move the newly uploaded dataset to the HDFS raw datasets directory.
         Notes:
         - ensure no same file name exists in the tmpuploads directory, or in uploads directory
+        - with_overview=False skips the spark overview pass (only {"filename"} is returned),
+          used when the overview is already known (e.g. from parquet footers)
+        - layout: file size, partitioning, sorting and compression of the written parquet (see parquet_writer.py)
+        - read_options: schema, schema hints or sampling ratio of the schema inference for csv (see dataset_readers.py)
         """
         print(f"in create_new_dataset {filename} is {filetype}")
         try:
-            with SparkSessionManager() as spark:
-                
-                # later create a switch case based on file type
-                if filetype == "csv":
-                    print(f"Reading CSV file: {HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}")
-                    df = spark.read.csv(f"{HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}",header=True,inferSchema=True)
-                    write_filename = write_filename = filename.replace(".csv__PROCESSING__", ".parquet")
-                    # if you write without parquet extension, it will create a directory with the filename and store the data in it
-                    df.write.mode("overwrite").parquet(f"{HDFS_FILE_READ_URL}/{HDFS_RAW_DATASETS_DIR}/{write_filename}")
-                    print(f"Successfully created new dataset in HDFS: {HDFS_RAW_DATASETS_DIR}/{write_filename}")
-
-                elif filetype == "parquet":
-                    write_filename = filename.replace("__PROCESSING__","")
-                    print(f"Reading Parquet file: {HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}")
-                    # we don't need inferSchema=True with parquet (as parquet stores the schema as metadata)
-                    df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}")
-                    df.write.mode("overwrite").parquet(f"{HDFS_FILE_READ_URL}/{HDFS_RAW_DATASETS_DIR}/{write_filename}")
-                    print(f"Successfully created new dataset in HDFS: {HDFS_RAW_DATASETS_DIR}/{write_filename}")
-                else:
-                    print("Unsupported file type for creating new dataset.")
-                    return {"message": "Unsupported file type."}
-
-                dataset_overview = self._get_overview(df)
+            with self.job_session() as spark:
                 
+                # one distributed read of any format (see dataset_readers.py), written as parquet
+                read_path = f"{HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}"
+                print(f"Reading {filetype} file: {read_path}")
+                df = read_dataset(spark, filetype, read_path, read_options)
+                self._apply_profile(spark, df, f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}")
+                write_filename = get_raw_write_filename(filename, filetype)
+                # if you write without parquet extension, it will create a directory with the filename and store the data in it
+                # a new dataset is removed if the job doesn't complete (an overwritten one is not)
+                if not hdfs_client.path_exists(f"{HDFS_RAW_DATASETS_DIR}/{write_filename}"):
+                    add_job_output(f"{HDFS_RAW_DATASETS_DIR}/{write_filename}")
+                written_layout = write_parquet(df, f"{HDFS_FILE_READ_URL}/{HDFS_RAW_DATASETS_DIR}/{write_filename}", layout)
+                print(f"Successfully created new dataset in HDFS: {HDFS_RAW_DATASETS_DIR}/{write_filename}")
+
+                if not with_overview:
+                    return {"filename": write_filename, "layout": written_layout}
+
+                # profile the written parquet, not the lazy df (that would parse the csv again for every pass)
+                df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{HDFS_RAW_DATASETS_DIR}/{write_filename}")
+                dataset_overview = self._get_overview(df, overview_mode, relative_error)
+
+                fingerprint = hdfs_client.get_fingerprint(f"{HDFS_RAW_DATASETS_DIR}/{write_filename}")
+                overview_stats_cache.put_overview(fingerprint, dataset_overview)
+                dataset_overview["fingerprint"] = fingerprint
                 dataset_overview["filename"] = write_filename
+                dataset_overview["layout"] = written_layout
+                if read_options:
+                    dataset_overview["readOptions"] = read_options
                 return dataset_overview        
             return {"message": "Dataset created."}
         except Exception as e:
@@ -300,7 +374,81 @@ class SparkSessionManager:
             raise e
     
 
-    async def preprocess_data(self, directory: str, filename: str, operations: list):
+    async def create_preview_overview(self, filename, filetype, sample_fraction=0.01, overview_mode="exact", relative_error=0.05, read_options=None):
+        """
+        Fast preview overview of a newly uploaded dataset, computed on a sample of it.
+        If the upload has many files (like a parquet directory) a random subset of the files is read (cluster sample,
+        the bounds are computed between the files). A single uncompressed csv / json lines file is sampled by its first
+        sample_fraction of bytes (between PREVIEW_PREFIX_MIN_BYTES and PREVIEW_PREFIX_MAX_BYTES), read without scanning
+        the rest of the file: these are the first rows, not a random sample, so the counts are not scaled and there are
+        no bounds (see attach_prefix_sample). Otherwise a bernoulli sample of rows is taken (the whole file is scanned).
+        Counts of a random sample are scaled to the full dataset and every column gets confidence bounds
+        (see attach_sample_bounds).
+        The overview of create_new_dataset (full precision) should replace this one when it's ready.
+        """
+        try:
+            with self.job_session() as spark:
+                path = f"{HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}"
+                # csv, json: schema is given (schema, hints) or inferred from the sampled rows only
+                read = lambda paths: read_dataset(spark, filetype, paths, {**(read_options or {}), "samplingRatio": sample_fraction})
+
+                # text source only lists the files, without reading them or inferring any schema
+                input_files = sorted(spark.read.text(path).inputFiles())
+                file_sample = len(input_files) > 1
+                prefix_sample = False
+                if file_sample:
+                    num_files = max(1, math.ceil(len(input_files) * sample_fraction))
+                    sample_files = random.Random(PREVIEW_SAMPLE_SEED).sample(input_files, num_files)
+                    sample_df = read(sample_files).withColumn(PREVIEW_FILE_COLUMN, input_file_name())
+                    fraction = num_files / len(input_files)
+                elif filetype in ("csv", "json") and not is_compressed_file(input_files[0]) and not (read_options or {}).get("multiLine"):
+                    file_path = urlparse(input_files[0]).path
+                    file_length = hdfs_client.get_size(file_path)
+                    prefix_length = min(max(math.ceil(file_length * sample_fraction), PREVIEW_PREFIX_MIN_BYTES), PREVIEW_PREFIX_MAX_BYTES)
+                    content = hdfs_client.read_prefix(file_path, prefix_length)
+                    sample_df = read_lines(spark, filetype, content.decode("utf-8", errors="replace").splitlines(), read_options)
+                    fraction = len(content) / file_length if file_length else 1.0
+                    prefix_sample = True
+                else:
+                    sample_df = read([path]).sample(withReplacement=False, fraction=sample_fraction, seed=PREVIEW_SAMPLE_SEED)
+                    fraction = sample_fraction
+                print(f"Creating preview overview of {path} from {fraction * 100:.2f}% of the data")
+
+                # the sample is read (and parsed) once, all overview passes run on the persisted blocks
+                sample_df = sample_df.persist(StorageLevel.MEMORY_AND_DISK)
+                try:
+                    if file_sample:
+                        overview = self._get_overview(sample_df.drop(PREVIEW_FILE_COLUMN), overview_mode, relative_error)
+                        overview = attach_sample_bounds(overview, fraction, file_totals=compute_file_totals(sample_df, PREVIEW_FILE_COLUMN))
+                    elif prefix_sample:
+                        overview = attach_prefix_sample(self._get_overview(sample_df, overview_mode, relative_error), fraction)
+                    else:
+                        overview = attach_sample_bounds(self._get_overview(sample_df, overview_mode, relative_error), fraction)
+                finally:
+                    sample_df.unpersist()
+                overview["preview"] = True
+                overview["filename"] = get_raw_write_filename(filename, filetype)
+                return overview
+        except Exception as e:
+            print(f"Error creating preview overview: {e}")
+            raise e
+
+    async def create_footer_overview(self, filename):
+        """
+        Instant overview of an uploaded parquet dataset from its parquet footers (no spark job, no data read),
+        only row count, null counts, min/max and schema are there (see overview_from_parquet_footers).
+        """
+        try:
+            footers = hdfs_client.read_parquet_footers(f"{RECENTLY_UPLOADED_DATASETS_DIR}/{filename}")
+            overview = overview_from_parquet_footers(footers)
+            overview["preview"] = True
+            overview["filename"] = get_raw_write_filename(filename, "parquet")
+            return overview
+        except Exception as e:
+            print(f"Error creating footer overview: {e}")
+            raise e
+
+    async def preprocess_data(self, directory: str, filename: str, operations: list, overview_mode: str = "exact", relative_error: float = 0.05, input_overview: dict = None, column_state: dict = None, layout: dict = None):
         """
         Preprocess a dataset using as per the options JSON received.
 
@@ -332,51 +480,442 @@ class SparkSessionManager:
                             {"column": "col5", "operation": "Min-Max Scaling"},
                             {"column": "col6", "operation": "Fill Mean"},
                             {"column": "All Columns", "operation": "Drop Duplicates"},
+                            {"column": "All Columns", "operation": "Remove Outliers", "method": "MAD", "factor": 3.5, "mode": "clip"},
+                            {"column": "col7", "operation": "Expression", "expression": "clip(value, -40, 60) * 1.8 + 32"},
                         ]
+            Remove Outliers takes optional method (IQR, Z-score, MAD), factor and mode (remove rows or clip values).
+            Expand Vector (after One Hot Encoding) takes an optional format: "array" (array<float> of fixed size) or
+            "columns" (a numeric column {column}_{i} per element).
+
+        vii) Overview of the output reuses cached stats (by fingerprint of the input) of the columns which were not touched
+            by any step, when no step could remove rows. input_overview (datastats of the input) warms the cache if its
+            fingerprint is still the same as of the input file.
+
+        viii) Steps are not applied one by one, PreprocessingPlanner batches the stats of the steps into shared scans and
+            composes the column transforms into single selects (with the same result as the step by step application).
+
+        ix) Long pipelines are checkpointed (see lineage_checkpoints.py), the checkpoints are removed after the output is written.
+
+        x) column_state ("All Columns" lists of an earlier run) is given when the operations continue an earlier run on its
+            output (see dataset_lineage.py), the column state after this run is returned with the overview.
+
+        xi) layout sets the file size, partitioning, sorting and compression of the output (see parquet_writer.py).
         """
         
         # don't put try except here, if any error occurs, it will be printed and counted as no error ..
         # so wherever this function is called next step will continue even after this error (put try except there instead)
         try:
-            with SparkSessionManager() as spark:
+            with self.job_session() as spark:
                 # Load the dataset from HDFS
                 print(f"Starting preprocessing for {HDFS_FILE_READ_URL}/{directory}/{filename}...")
                 df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{directory}/{filename}")
-                
-                # Record the time, and get the numeric columns
+                profile = self._apply_profile(spark, df, f"{directory}/{filename}")
+                input_fingerprint = self._get_input_fingerprint(directory, filename, input_overview)
+
+                # apply the preprocessing steps (as an optimized plan, see preprocessing_planner.py), each step is measured
+                instrumentation = SparkJobInstrumentation(spark, "preprocess")
+                checkpointer = LineageCheckpointer(spark, hdfs_client, HDFS_FILE_READ_URL, "preprocess")
+                input_columns = set(df.columns)
+                try:
+                    planner = PreprocessingPlanner(df, instrumentation, checkpointer=checkpointer, column_state=column_state)
+                    df = planner.run(operations)
+
+                    overview = self._write_processed_dataset(
+                        spark, df, filename, input_fingerprint, input_columns, planner, overview_mode, relative_error, layout
+                    )
+                finally:
+                    checkpointer.cleanup()
+                overview["processingReport"] = self._get_processing_report(planner, input_fingerprint, input_overview, overview)
+                overview["processingReport"]["sparkProfile"] = profile
+                print(f"Preprocessed dataset saved to: {HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{overview['filename']} and time taken: ", overview["processingReport"]["totalTime"])
+
+                # fitted params of the steps, to apply the same preprocessing on other datasets
+                overview["recipe"] = planner.get_recipe()
+                overview["columnState"] = planner.get_column_state()
+                return overview
+        except Exception as e:
+            print(f"Error preprocessing dataset: {e}")
+            raise e  # Raise the exception to be handled by the caller
+
+    async def preview_preprocessing(self, directory: str, filename: str, operations: list, num_rows: int = 20, sample_rows: int = PREVIEW_SAMPLE_ROWS, known_stats: list = None, total_rows: int = None):
+        """
+        Runs the operations on a bounded random sample (~sample_rows rows) and returns the first num_rows transformed rows
+        with approximate stats of the transformed sample. Nothing is written to HDFS.
+
+        Notes:
+        i) The sample is collected to the driver and recreated as a local df, so every step runs on a few rows only.
+           It's a seeded random sample of the whole dataset (fraction from total_rows, the rows of the stored overview,
+           or the parquet row count), not the first rows (which are often sorted / from one source file).
+        ii) known_stats (columnStats of the stored overview) are used for stats of the steps (means, min/max, quartiles,
+            null counts) on unchanged columns, so the preview is transformed with full data values where possible.
+        iii) The stats of the transformed sample are skipped once the time budget (~2 seconds) is already used up.
+        iv) The spark jobs of the preview are cancelled after PREVIEW_TIMEOUT seconds (TimeoutError).
+        """
+        try:
+            with self.job_session(timeout=PREVIEW_TIMEOUT) as spark:
                 t1 = time.time()
-                All_Columns = df.columns
-                numericCols = [c for c in All_Columns if isinstance(df.schema[c].dataType, NumericType)]
-
-                # Apply the preprocessing steps
-                for step in operations:
-                    if step["operation"] == "Exclude from All Columns list":
-                        All_Columns.remove(step['column'])
-                        if step['column'] in numericCols:
-                            numericCols.remove(step['column'])
-                            
-                    elif step["column"] == "All Columns":
-                        try:
-                            df = All_Column_Operations(df, step, numericCols, All_Columns)
-                        except Exception as e:
-                            print(f"error: Error in {step['operation']} operation for {step['column']} column: {str(e)} \n")       
-                    else:
-                        try:
-                            df = Column_Operations(df, step)
-                        except Exception as e:
-                            print(f"error: Error in {step['operation']} operation for {step['column']} column: {str(e)} \n")
+                df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{directory}/{filename}")
+                if total_rows is None:
+                    total_rows = df.count()
+                # 10% more than sample_rows so that the bernoulli sample is rarely short of them
+                fraction = min(1.0, 1.1 * sample_rows / total_rows) if total_rows else 1.0
+                sample_data = df.sample(fraction=fraction, seed=PREVIEW_SAMPLE_SEED).limit(sample_rows).collect()
+                sample = spark.createDataFrame(sample_data, df.schema)
+
+                planner = PreprocessingPlanner(sample, known_stats=known_stats)
+                df = planner.run(operations)
+                rows = df.limit(num_rows).collect()
+
+                preview = {
+                    "filename": filename,
+                    "columns": df.columns,
+                    "rows": [to_json_value(list(row)) for row in rows],
+                    "sampleRows": len(sample_data),
+                    "sampleFraction": round(fraction, 6),
+                    "columnStats": None,
+                }
+                if time.time() - t1 < PREVIEW_TIME_BUDGET:
+                    preview["columnStats"] = to_json_value(compute_preview_stats(df)["columnStats"])
+                preview["time"] = round(time.time() - t1, 3)
+                return preview
+        except Exception as e:
+            print(f"Error in preprocessing preview: {e}")
+            raise e
 
-                newfilename = f"{filename}_{uuid.uuid4().hex}.parquet"
-                df.write.mode("overwrite").parquet(f"{HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}")
+    async def apply_preprocessing_recipe(self, directory: str, filename: str, recipe: dict, overview_mode: str = "exact", relative_error: float = 0.05, input_overview: dict = None, layout: dict = None):
+        """
+        Applies a stored recipe (fitted params of a preprocessing run) on a dataset, it's a transform-only pass:
+        no stats are computed for the steps, so the output is transformed exactly like the data the recipe was fitted on.
+        Unlike preprocess_data a failed step is an error (the output would not be consistent with the recipe).
+        Note: a category not seen during fitting is an error in Label / One Hot Encoding.
+        """
+        try:
+            with self.job_session() as spark:
+                print(f"Applying preprocessing recipe on {HDFS_FILE_READ_URL}/{directory}/{filename}...")
+                df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{directory}/{filename}")
+                profile = self._apply_profile(spark, df, f"{directory}/{filename}")
+                input_fingerprint = self._get_input_fingerprint(directory, filename, input_overview)
+
+                instrumentation = SparkJobInstrumentation(spark, "apply-recipe")
+                checkpointer = LineageCheckpointer(spark, hdfs_client, HDFS_FILE_READ_URL, "apply-recipe")
+                input_columns = set(df.columns)
+                try:
+                    planner = PreprocessingPlanner(df, instrumentation, checkpointer=checkpointer)
+                    df = planner.apply_recipe(recipe)
+
+                    overview = self._write_processed_dataset(
+                        spark, df, filename, input_fingerprint, input_columns, planner, overview_mode, relative_error, layout
+                    )
+                finally:
+                    checkpointer.cleanup()
+                overview["processingReport"] = self._get_processing_report(planner, input_fingerprint, input_overview, overview)
+                overview["processingReport"]["sparkProfile"] = profile
+                print(f"Recipe applied, dataset saved to: {HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{overview['filename']} and time taken: ", overview["processingReport"]["totalTime"])
+                return overview
+        except Exception as e:
+            print(f"Error applying preprocessing recipe: {e}")
+            raise e
 
-                print(f"Preprocessed dataset saved to: {HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{newfilename} and time taken: ",time.time()-t1)
+    async def append_raw_partition(self, upload_filename, filetype, raw_filename, raw_overview, overview_mode="exact", relative_error=0.05):
+        """
+        Appends an uploaded file to a raw dataset as a new partition: new part files are written under the raw dataset
+        directory (existing files are never rewritten), and the overview is the stored overview merged with the overview
+        of the new partition only (see merge_overviews), so the earlier partitions are not scanned again.
 
-                overview = self._get_overview(df)
-                overview["filename"] = newfilename
+        Notes:
+        i) The upload must have all the columns of the raw dataset, they are cast to the types of the raw dataset.
+           A value which doesn't fit the type (cast to null) fails the append, it's counted by df.observe during the
+           write (csv columns are read as strings, so the values are checked by the same cast).
+        ii) datastats["partitions"] lists the files of every partition, the files present before the first append are
+            partition 0. Processed datasets record the partitions they cover (see preprocess_new_partitions).
+        iii) The files written by a failed append are deleted, the raw dataset is left as it was.
+        """
+        raw_path, existing = f"{HDFS_RAW_DATASETS_DIR}/{raw_filename}", None
+        try:
+            with self.job_session() as spark:
+                existing_files = [path for path, _ in hdfs_client.list_data_files(raw_path)]
+                raw_schema = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{raw_path}").schema
+
+                upload_path = f"{HDFS_FILE_READ_URL}/{RECENTLY_UPLOADED_DATASETS_DIR}/{upload_filename}"
+                if filetype == "csv":
+                    # all columns as strings (no inference pass), the cast below gives the types of the raw dataset
+                    df = spark.read.csv(upload_path, header=True)
+                else:
+                    df = read_dataset(spark, filetype, upload_path)
+
+                missing_columns = [field.name for field in raw_schema.fields if field.name not in df.columns]
+                if missing_columns:
+                    raise Exception(f"Columns {missing_columns} of {raw_overview['filename']} are not in the uploaded file")
+                cast_columns = [field for field in raw_schema.fields if df.schema[field.name].dataType != field.dataType]
+                df = df.select([col(f"`{field.name}`").cast(field.dataType).alias(field.name) for field in raw_schema.fields] + [
+                    col(f"`{field.name}`").alias(f"__uploaded_{i}") for i, field in enumerate(cast_columns)
+                ])
+                cast_check = Observation()
+                if cast_columns:
+                    df = df.observe(cast_check, *[
+                        spark_sum(when(col(f"__uploaded_{i}").isNotNull() & col(f"`{field.name}`").isNull(), 1).otherwise(0)).alias(field.name)
+                        for i, field in enumerate(cast_columns)
+                    ])
+                df = df.select([col(f"`{field.name}`") for field in raw_schema.fields])
+                self._apply_profile(spark, df, f"{RECENTLY_UPLOADED_DATASETS_DIR}/{upload_filename}")
+
+                existing = set(existing_files)
+                # new files follow the layout of the dataset (same partition columns)
+                write_parquet(df, f"{HDFS_FILE_READ_URL}/{raw_path}", raw_overview.get("layout"), mode="append")
+                if cast_columns:
+                    invalid = {c: n for c, n in cast_check.get.items() if n}
+                    if invalid:
+                        raise Exception(f"Values of the uploaded file don't fit the types of {raw_overview['filename']} (values per column): {invalid}")
+                new_files = [path for path, _ in hdfs_client.list_data_files(raw_path) if path not in existing]
+                # registered at the path the files have once the route renames the dataset back (__PROCESSING__
+                # removed), the rename back runs before the outputs of a failed job are deleted
+                for path in new_files:
+                    add_job_output(f"{raw_path}/{path}".replace("__PROCESSING__", ""))
+                print(f"Appended {len(new_files)} files to {raw_path}")
+
+                # only the new partition is profiled (basePath keeps the partition columns of a partitioned layout)
+                partition_df = spark.read.option("basePath", f"{HDFS_FILE_READ_URL}/{raw_path}").parquet(
+                    *[f"{HDFS_FILE_READ_URL}/{raw_path}/{path}" for path in new_files]
+                )
+                partition_overview = self._get_overview(partition_df, overview_mode, relative_error)
+
+                partitions = raw_overview.get("partitions") or [{"partitionId": 0, "files": existing_files, "numRows": raw_overview["numRows"]}]
+                overview = merge_overviews(raw_overview, partition_overview)
+                overview["partitions"] = partitions + [{
+                    "partitionId": partitions[-1]["partitionId"] + 1,
+                    "files": new_files,
+                    "numRows": partition_overview["numRows"],
+                    "addedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }]
+
+                fingerprint = hdfs_client.get_fingerprint(raw_path, f"{HDFS_RAW_DATASETS_DIR}/{raw_overview['filename']}")
+                overview_stats_cache.put_overview(fingerprint, overview)
+                overview["fingerprint"] = fingerprint
                 return overview
         except Exception as e:
-            print(f"Error preprocessing dataset: {e}")
-            raise e  # Raise the exception to be handled by the caller
+            print(f"Error appending partition to raw dataset: {e}")
+            if existing is not None:
+                self._remove_appended_files(raw_path, existing)
+            raise e
+
+    async def preprocess_new_partitions(self, raw_filename, raw_partitions, processed_filename, processed_overview, recipe, overview_mode="exact", relative_error=0.05):
+        """
+        Incremental preprocessing: the raw partitions not yet in a processed dataset are transformed with the recipe
+        fitted on the original data (transform-only, like apply_preprocessing_recipe) and appended to the processed
+        dataset, its overview is merged with the overview of the appended output only.
+        Returns None if there are no new partitions.
+
+        Notes:
+        i) No step is fitted again, so the new rows are transformed exactly like the earlier rows (means, min/max,
+            category labels and outlier bounds of the original data), a category not seen in fitting is an error.
+        ii) Drop Duplicates removes duplicates within the new partitions only.
+        iii) Raw partitions are never rewritten after they are appended, so they are read without locking the raw dataset.
+        iv) The files appended by a failed run are deleted, the processed dataset is left as it was.
+        """
+        processed_partitions = processed_overview.get("sourcePartitions", [0])
+        new_partitions = [p for p in raw_partitions if p["partitionId"] not in processed_partitions]
+        if not new_partitions:
+            return None
+
+        output_path, existing_files = f"{HDFS_PROCESSED_DATASETS_DIR}/{processed_filename}", None
+        try:
+            with self.job_session() as spark:
+                raw_path = f"{HDFS_FILE_READ_URL}/{HDFS_RAW_DATASETS_DIR}/{raw_filename}"
+                df = spark.read.option("basePath", raw_path).parquet(*[f"{raw_path}/{path}" for p in new_partitions for path in p["files"]])
+                self._apply_profile(spark, df, input_size=self._get_incremental_input_size(raw_filename, new_partitions, output_path))
+                print(f"Preprocessing {len(new_partitions)} new partitions of {raw_filename} with the recipe of {processed_overview['filename']}")
+
+                instrumentation = SparkJobInstrumentation(spark, "incremental-preprocess")
+                planner = PreprocessingPlanner(df, instrumentation)
+                df = planner.apply_recipe(recipe)
+
+                existing_files = set(path for path, _ in hdfs_client.list_data_files(output_path))
+                with self._measure(planner, "Append parquet"):
+                    write_parquet(df, f"{HDFS_FILE_READ_URL}/{output_path}", processed_overview.get("layout"), mode="append")
+                planner.collect_observations()
+                new_files = [path for path, _ in hdfs_client.list_data_files(output_path) if path not in existing_files]
+                # at the path after the rename back, as in append_raw_partition
+                for path in new_files:
+                    add_job_output(f"{output_path}/{path}".replace("__PROCESSING__", ""))
+
+                with self._measure(planner, "Overview"):
+                    partition_df = spark.read.option("basePath", f"{HDFS_FILE_READ_URL}/{output_path}").parquet(
+                        *[f"{HDFS_FILE_READ_URL}/{output_path}/{path}" for path in new_files]
+                    )
+                    partition_overview = self._get_overview(partition_df, overview_mode, relative_error)
+                overview = merge_overviews(processed_overview, partition_overview)
+
+                report = planner.get_report(sum(p["numRows"] for p in new_partitions), partition_overview["numRows"])
+                report["phases"] = [record for record in instrumentation.records if "index" not in record]
+                report["totalTime"] = instrumentation.total_time()
+                partition_ids = [p["partitionId"] for p in new_partitions]
+                overview["sourcePartitions"] = processed_partitions + partition_ids
+                overview["incrementalUpdates"] = processed_overview.get("incrementalUpdates", []) + [
+                    {"partitions": partition_ids, "numRows": partition_overview["numRows"], "processingReport": report}
+                ]
+
+                fingerprint = hdfs_client.get_fingerprint(output_path, f"{HDFS_PROCESSED_DATASETS_DIR}/{processed_overview['filename']}")
+                overview_stats_cache.put_overview(fingerprint, overview)
+                overview["fingerprint"] = fingerprint
+                print(f"Appended {partition_overview['numRows']} rows to {output_path} and time taken: ", report["totalTime"])
+                return overview
+        except Exception as e:
+            print(f"Error in incremental preprocessing: {e}")
+            if existing_files is not None:
+                self._remove_appended_files(output_path, existing_files)
+            raise e
+
+    async def compact_dataset(self, directory, filename, overview, layout=None):
+        """
+        Rewrites a dataset directory into well sized files (see parquet_writer.py), layout keys not given are taken from
+        the stored layout of the dataset. The data is the same, so the stored overview is kept (with the new fingerprint
+        and layout), unless partitionBy changed (partition discovery can change the column order and types), then the
+        compacted dataset is profiled again.
+
+        Notes:
+        i) The files are written to a temporary directory next to the dataset, which then replaces the dataset directory
+           (one rename, the old directory is removed after it), so a failure leaves the dataset as it was.
+        ii) A raw dataset with appended partitions (see append_raw_partition) is compacted partition by partition, the
+            compacted files of every partition are moved to the same temporary directory (same relative paths as
+            written), so processed datasets still know which partitions they cover. partitionBy of such a dataset
+            can't be changed.
+        """
+        stored_layout = overview.get("layout") or {}
+        layout = {**stored_layout, **(layout or {})}
+        partitions = overview.get("partitions") or []
+        partition_by_changed = (layout.get("partitionBy") or []) != (stored_layout.get("partitionBy") or [])
+        if len(partitions) > 1 and partition_by_changed:
+            raise Exception("partitionBy of a dataset with appended partitions can't be changed")
+
+        path = f"{directory}/{filename}"
+        temp_path = f"{path}__COMPACT_{uuid.uuid4().hex[:8]}"
+        add_job_output(temp_path)
+        try:
+            with self.job_session() as spark:
+                file_sizes = dict(hdfs_client.list_data_files(path))
+                self._apply_profile(spark, spark.read.parquet(f"{HDFS_FILE_READ_URL}/{path}"), path)
+                print(f"Compacting {path} ({len(file_sizes)} files, {sum(file_sizes.values())} bytes)...")
+                read = lambda files: spark.read.option("basePath", f"{HDFS_FILE_READ_URL}/{path}").parquet(
+                    *[f"{HDFS_FILE_READ_URL}/{path}/{f}" for f in files]
+                )
+
+                if len(partitions) > 1:
+                    compacted_partitions = []
+                    for partition in partitions:
+                        # hidden directory (skipped by spark reads) of the partition in the new dataset directory
+                        partition_path = f"{temp_path}/_partition_{partition['partitionId']}"
+                        written_layout = write_parquet(
+                            read(partition["files"]), f"{HDFS_FILE_READ_URL}/{partition_path}", layout,
+                            estimated_size=sum(file_sizes.get(f, 0) for f in partition["files"]), estimated_rows=partition.get("numRows")
+                        )
+                        compacted_files = [f for f, _ in hdfs_client.list_data_files(partition_path)]
+                        for f in compacted_files:
+                            if "/" in f:
+                                await hdfs_client.make_directory(f"{temp_path}/{f.rsplit('/', 1)[0]}")
+                            await hdfs_client.rename_file_or_folder(f"{partition_path}/{f}", f"{temp_path}/{f}")
+                        hdfs_client.delete_path(partition_path)
+                        compacted_partitions.append({**partition, "files": compacted_files})
+                    overview = {**overview, "partitions": compacted_partitions}
+                else:
+                    written_layout = write_parquet(
+                        spark.read.parquet(f"{HDFS_FILE_READ_URL}/{path}"), f"{HDFS_FILE_READ_URL}/{temp_path}", layout,
+                        estimated_size=sum(file_sizes.values()), estimated_rows=overview.get("numRows")
+                    )
+                    if partitions:
+                        overview = {**overview, "partitions": [{**partitions[0], "files": [f for f, _ in hdfs_client.list_data_files(temp_path)]}]}
+
+                # the old files are removed only once the compacted directory is in place
+                await hdfs_client.rename_file_or_folder(path, f"{temp_path}_OLD")
+                await hdfs_client.rename_file_or_folder(temp_path, path)
+                hdfs_client.delete_path(f"{temp_path}_OLD")
+
+                if partition_by_changed:
+                    df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{path}")
+                    mode = overview.get("overviewMode") if overview.get("overviewMode") in ("exact", "approx") else "exact"
+                    profiled = self._get_overview(df, mode, overview.get("relativeError", 0.05))
+                    overview = {**overview, **profiled}
+
+                fingerprint = hdfs_client.get_fingerprint(path, f"{directory}/{overview['filename']}")
+                overview_stats_cache.put_overview(fingerprint, overview)
+                num_files = len(hdfs_client.list_data_files(path))
+                print(f"Compacted {path} into {num_files} files")
+                return {**overview, "fingerprint": fingerprint, "layout": {**written_layout, "numFiles": num_files}}
+        except Exception as e:
+            print(f"Error compacting dataset: {e}")
+            raise e
+
+    def _get_incremental_input_size(self, raw_filename, new_partitions, output_path):
+        """
+        Bytes of the new raw partitions plus the processed dataset they are appended to (the profile of an incremental
+        run is of the whole dataset, not only of the new rows), None if not available
+        """
+        try:
+            raw_sizes = dict(hdfs_client.list_data_files(f"{HDFS_RAW_DATASETS_DIR}/{raw_filename}"))
+            new_size = sum(raw_sizes.get(path, 0) for p in new_partitions for path in p["files"])
+            return new_size + hdfs_client.get_size(output_path)
+        except Exception as e:
+            print(f"Input size not available for the spark profile: {e}")
+            return None
+
+    def _remove_appended_files(self, path, existing_files):
+        """Deletes the data files under path (HDFS) which are not in existing_files, the files of a failed append"""
+        try:
+            for file_path, _ in hdfs_client.list_data_files(path):
+                if file_path not in existing_files:
+                    hdfs_client.delete_path(f"{path}/{file_path}")
+                    print(f"Removed {path}/{file_path} of the failed append")
+        except Exception as e:
+            print(f"Error removing the appended files of {path}: {e}")
+
+    def _measure(self, planner, label):
+        if planner.instrumentation is None:
+            return nullcontext()
+        return planner.instrumentation.measure(label)
+
+    def _get_processing_report(self, planner, input_fingerprint, input_overview, overview):
+        """
+        Per step report of a preprocessing job (see SparkJobInstrumentation), followed by the write and the overview.
+        Rows of the input are known from its stored overview (if it's still of the same data).
+        """
+        rows_in = None
+        if input_overview and input_overview.get("fingerprint") == input_fingerprint:
+            rows_in = input_overview.get("numRows")
+        report = planner.get_report(rows_in, overview["numRows"])
+        report["phases"] = [record for record in planner.instrumentation.records if "index" not in record]
+        report["totalTime"] = planner.instrumentation.total_time()
+        return report
+
+    def _get_input_fingerprint(self, directory, filename, input_overview=None):
+        """Fingerprint of the input of preprocessing (key path without __PROCESSING__), warms the cache from input_overview"""
+        input_fingerprint = hdfs_client.get_fingerprint(f"{directory}/{filename}", f"{directory}/{filename.replace('__PROCESSING__', '')}")
+        if input_overview and input_overview.get("fingerprint") == input_fingerprint:
+            overview_stats_cache.put_overview(input_fingerprint, input_overview)
+        return input_fingerprint
+
+    def _write_processed_dataset(self, spark, df, filename, input_fingerprint, input_columns, planner, overview_mode, relative_error, layout=None):
+        """
+        Writes the preprocessed df as a new parquet in HDFS_PROCESSED_DATASETS_DIR and returns its overview,
+        the written parquet is profiled (so the preprocessing lineage runs only once, for the write) reusing cached stats
+        of the columns not touched by the planner.
+        """
+        newfilename = f"{filename}_{uuid.uuid4().hex}.parquet"
+        add_job_output(f"{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}")
+        with self._measure(planner, "Write parquet"):
+            written_layout = write_parquet(df, f"{HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}", layout)
+        planner.collect_observations()
+
+        df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}")
+
+        unchanged_columns = [] if planner.rows_changed else [c for c in df.columns if c in input_columns and c not in planner.modified_columns]
+        with self._measure(planner, "Overview"):
+            overview = self._get_cached_overview(df, input_fingerprint, unchanged_columns, overview_mode, relative_error)
+
+        fingerprint = hdfs_client.get_fingerprint(f"{HDFS_PROCESSED_DATASETS_DIR}/{newfilename}")
+        overview_stats_cache.put_overview(fingerprint, overview)
+        overview["fingerprint"] = fingerprint
+        overview["filename"] = newfilename
+        overview["layout"] = written_layout
+        return overview
 
     async def create_qpd_dataset(self, filename: str, num_points:int):
         """
@@ -384,10 +923,11 @@ class SparkSessionManager:
         """      
  
         try:
-            with SparkSessionManager() as spark:
+            with self.job_session() as spark:
                 # Load the dataset from HDFS
                 print(f"Starting creating qpd dataset from {HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{filename}...")
                 df = spark.read.parquet(f"{HDFS_FILE_READ_URL}/{HDFS_PROCESSED_DATASETS_DIR}/{filename}")
+                self._apply_profile(spark, df, f"{HDFS_PROCESSED_DATASETS_DIR}/{filename}")
                 
                 # Create a new dataset with the specified number of points
                 df_subset = df.orderBy(rand()).limit(num_points)
@@ -398,7 +938,8 @@ class SparkSessionManager:
                 df_subset.write.parquet(write_path) # no overwrite since it will be unique path
                 print(f"Created QPD dataset saved to: {write_path}")
 
-                overview = self._get_overview(df_subset)
+                # profile the written subset, re-evaluating df_subset would pick a different random subset
+                overview = self._get_overview(spark.read.parquet(write_path))
                 overview["datapath"] = write_path
                 return overview
         except Exception as e: